@@ -343,9 +343,165 @@ class CTxWitness(ImmutableSerializable):
             return cls(txwitness.vtxinwit)
 
 
+_unpack_int32 = struct.Struct(b"<i").unpack_from
+_unpack_uint32 = struct.Struct(b"<I").unpack_from
+_unpack_int64 = struct.Struct(b"<q").unpack_from
+_unpack_outpoint = struct.Struct(b"<32sI").unpack_from
+
+
+def _deserialize_tx(buf, pos):
+    """Deserialize a transaction from a memoryview at offset pos
+
+    Offset based counterpart of CTransaction.stream_deserialize(), producing
+    the same object. Fields are read with struct.unpack_from and scripts are
+    copied once, straight out of buf. The txid, wtxid and weight are cached
+    from the byte ranges the transaction was read from, so they never need a
+    reserialization.
+
+    Returns (tx, offset after the transaction). Truncated input raises
+    struct.error, IndexError or SerializationTruncationError.
+    """
+    new_script = bytes.__new__
+    start = pos
+    nVersion = _unpack_int32(buf, pos)[0]
+    pos += 4
+    segwit = buf[pos] == 0 and buf[pos+1] == 1
+    if segwit:
+        pos += 2
+    body = pos
+
+    n, pos = ser_read_varint(buf, pos)
+    vin = []
+    for _ in range(n):
+        prevout = COutPoint(*_unpack_outpoint(buf, pos))
+        l, pos = ser_read_varint(buf, pos+36)
+        end = pos + l
+        scriptSig = new_script(CScript, buf[pos:end].tobytes())
+        vin.append(CTxIn(prevout, scriptSig, _unpack_uint32(buf, end)[0]))
+        pos = end + 4
+
+    n, pos = ser_read_varint(buf, pos)
+    vout = []
+    for _ in range(n):
+        nValue = _unpack_int64(buf, pos)[0]
+        l, pos = ser_read_varint(buf, pos+8)
+        end = pos + l
+        vout.append(CTxOut(nValue, new_script(CScript, buf[pos:end].tobytes())))
+        pos = end
+    body_end = pos
+
+    if segwit:
+        vtxinwit = []
+        for _ in range(len(vin)):
+            n, pos = ser_read_varint(buf, pos)
+            stack = []
+            for _ in range(n):
+                l, pos = ser_read_varint(buf, pos)
+                stack.append(buf[pos:pos+l].tobytes())
+                pos += l
+            vtxinwit.append(CTxInWitness(CScriptWitness(tuple(stack))))
+        wit = CTxWitness(tuple(vtxinwit))
+    else:
+        wit = CTxWitness()
+
+    # vin and vout are already immutable, skip the copies __init__ makes
+    tx = object.__new__(CTransaction)
+    set_slot = object.__setattr__
+    set_slot(tx, 'nLockTime', _unpack_uint32(buf, pos)[0])
+    set_slot(tx, 'nVersion', nVersion)
+    set_slot(tx, 'vin', tuple(vin))
+    set_slot(tx, 'vout', tuple(vout))
+    set_slot(tx, 'wit', wit)
+    pos += 4
+
+    if not segwit:
+        stripped = full = buf[start:pos]
+    else:
+        stripped = b''.join((buf[start:start+4], buf[body:body_end], buf[pos-4:pos]))
+        full = stripped if wit.is_null() else buf[start:pos]
+    txid = Hash(stripped)
+    set_slot(tx, '_cached_GetTxid', txid)
+    set_slot(tx, '_cached_GetHash', txid if full is stripped else Hash(full))
+    set_slot(tx, '_cached_weight', len(stripped) * 3 + len(full))
+    return tx, pos
+
+
+def _deserialize_buffer(cls, buf, allow_padding, parse):
+    """Run an offset based parse over buf with Serializable.deserialize() semantics"""
+    buf = memoryview(buf)
+    try:
+        r, pos = parse(buf, 0)
+    except (struct.error, IndexError) as err:
+        raise SerializationTruncationError('Truncated %s: %s' % (cls.__name__, err))
+    if not allow_padding and pos != len(buf):
+        raise DeserializationExtraDataError('Not all bytes consumed during deserialization',
+                                            r, bytes(buf[pos:]))
+    return r
+
+
+def iter_block_outputs(buf):
+    """Iterate over the outputs of every transaction of a serialized block
+
+    Yields (txid, vout_index, script_pubkey, value) tuples, script_pubkey as
+    bytes. Inputs and witnesses are skipped over without being parsed into
+    objects and the txid is hashed from the byte ranges of the non-witness
+    serialization, so memory use is bounded by the largest transaction,
+    not the block. For scanning blocks for payments to known scripts;
+    deserialize a CBlock when the rest is needed.
+
+    Raises SerializationTruncationError if buf ends early.
+    """
+    buf = memoryview(buf)
+    try:
+        n_tx, pos = ser_read_varint(buf, 80)
+        for _ in range(n_tx):
+            start = pos
+            pos += 4
+            segwit = buf[pos] == 0 and buf[pos+1] == 1
+            if segwit:
+                pos += 2
+            body = pos
+
+            n_in, pos = ser_read_varint(buf, pos)
+            for _ in range(n_in):
+                l, pos = ser_read_varint(buf, pos+36)
+                pos += l + 4
+
+            n, pos = ser_read_varint(buf, pos)
+            vout = []
+            for _ in range(n):
+                value = _unpack_int64(buf, pos)[0]
+                l, pos = ser_read_varint(buf, pos+8)
+                vout.append((pos, pos+l, value))
+                pos += l
+            body_end = pos
+
+            if segwit:
+                for _ in range(n_in):
+                    n, pos = ser_read_varint(buf, pos)
+                    for _ in range(n):
+                        l, pos = ser_read_varint(buf, pos)
+                        pos += l
+            _unpack_uint32(buf, pos)
+            pos += 4
+
+            if segwit:
+                txid = Hash(b''.join((buf[start:start+4], buf[body:body_end], buf[pos-4:pos])))
+            else:
+                txid = Hash(buf[start:pos])
+            for i, (script_start, script_end, value) in enumerate(vout):
+                yield txid, i, buf[script_start:script_end].tobytes(), value
+    except (struct.error, IndexError) as err:
+        raise SerializationTruncationError('Truncated block: %s' % err)
+
 class CTransaction(ImmutableSerializable):
-    """A transaction"""
-    __slots__ = ['nVersion', 'vin', 'vout', 'nLockTime', 'wit']
+    """A transaction
+
+    Immutable, so txid, wtxid (GetHash) and weight are computed once from a
+    single serialization of each form and cached.
+    """
+    __slots__ = ['nVersion', 'vin', 'vout', 'nLockTime', 'wit',
+                 '_cached_GetTxid', '_cached_weight']
 
     def __init__(self, vin=(), vout=(), nLockTime=0, nVersion=1, witness=CTxWitness()):
         """Create a new transaction
@@ -394,6 +550,16 @@ class CTransaction(ImmutableSerializable):
             nLockTime = struct.unpack(b"<I", ser_read(f,4))[0]
             return cls(vin, vout, nLockTime, nVersion)
 
+    @classmethod
+    def deserialize(cls, buf, allow_padding=False, params={}):
+        """Deserialize bytes, returning an instance
+
+        Parses buf in place through a memoryview, see _deserialize_tx().
+        Subclasses such as CMutableTransaction keep the stream path.
+        """
+        if cls is not CTransaction:
+            return super(CTransaction, cls).deserialize(buf, allow_padding, params)
+        return _deserialize_buffer(cls, buf, allow_padding, _deserialize_tx)
 
     def stream_serialize(self, f, include_witness=True):
         f.write(struct.pack(b"<i", self.nVersion))
@@ -433,18 +599,44 @@ class CTransaction(ImmutableSerializable):
         else:
             return cls(tx.vin, tx.vout, tx.nLockTime, tx.nVersion, tx.wit)
 
+    def _calc_hashes(self):
+        """Return (txid, wtxid, weight) without touching the cache"""
+        stripped = self.serialize({'include_witness': False})
+        if self.wit.is_null():
+            full = stripped
+        else:
+            full = self.serialize()
+        return Hash(stripped), Hash(full), len(stripped) * 3 + len(full)
+
+    def _cache_hashes(self):
+        txid, wtxid, weight = self._calc_hashes()
+        object.__setattr__(self, '_cached_GetTxid', txid)
+        object.__setattr__(self, '_cached_GetHash', wtxid)
+        object.__setattr__(self, '_cached_weight', weight)
+
     def GetTxid(self):
         """Get the transaction ID.
 
         This differs from the transactions hash as given by GetHash. GetTxid
         excludes witness data, while GetHash includes it.
         """
-        if self.wit != CTxWitness():
-            txid = Hash(CTransaction(self.vin, self.vout, self.nLockTime,
-                self.nVersion).serialize())
-        else:
-            txid = Hash(self.serialize())
-        return txid
+        try:
+            return self._cached_GetTxid
+        except AttributeError:
+            self._cache_hashes()
+            return self._cached_GetTxid
+
+    def GetHash(self):
+        """Return the hash of the serialized transaction, with witness"""
+        try:
+            return self._cached_GetHash
+        except AttributeError:
+            self._cache_hashes()
+            return self._cached_GetHash
+
+    def GetWtxid(self):
+        """Get the witness transaction ID, same as GetHash"""
+        return self.GetHash()
 
     def calc_weight(self):
         """Calculate the transaction weight, as defined by BIP141.
@@ -456,13 +648,15 @@ class CTransaction(ImmutableSerializable):
         assert len(self.vin) > 0
         assert len(self.vout) > 0
 
-        # This special case isn't strictly necessary. But saves on serializing
-        # the transaction twice in the no-witness case.
-        if self.wit.is_null():
-            return len(self.serialize()) * 4
-        else:
-            stripped = CTransaction(self.vin, self.vout, self.nLockTime, self.nVersion)
-            return len(stripped.serialize()) * 3 + len(self.serialize())
+        try:
+            return self._cached_weight
+        except AttributeError:
+            self._cache_hashes()
+            return self._cached_weight
+
+    def calc_vsize(self):
+        """Virtual size in vbytes, weight / 4 rounded up"""
+        return (self.calc_weight() + 3) // 4
 
 @__make_mutable
 class CMutableTransaction(CTransaction):
@@ -495,6 +689,25 @@ class CMutableTransaction(CTransaction):
 
         return cls(vin, vout, tx.nLockTime, tx.nVersion, tx.wit)
 
+    # mutable, nothing is cached
+
+    def GetTxid(self):
+        """Get the transaction ID.
+
+        This differs from the transactions hash as given by GetHash. GetTxid
+        excludes witness data, while GetHash includes it.
+        """
+        return Hash(self.serialize({'include_witness': False}))
+
+    def GetWtxid(self):
+        return Serializable.GetHash(self)
+
+    def calc_weight(self):
+        """Calculate the transaction weight, as defined by BIP141."""
+        assert len(self.vin) > 0
+        assert len(self.vout) > 0
+        return self._calc_hashes()[2]
+
 
 class CBlockHeader(ImmutableSerializable):
     """A block header"""
@@ -665,8 +878,30 @@ class CBlock(CBlockHeader):
     @classmethod
     def stream_deserialize(cls, f):
         self = super(CBlock, cls).stream_deserialize(f)
+        self._set_vtx(VectorSerializer.stream_deserialize(CTransaction, f))
+        return self
+
+    @classmethod
+    def deserialize(cls, buf, allow_padding=False, params={}):
+        """Deserialize bytes, returning an instance
 
-        vtx = VectorSerializer.stream_deserialize(CTransaction, f)
+        Parses buf in place through a memoryview, the transactions with
+        _deserialize_tx(), so building the merkle trees reuses their cached
+        txids and wtxids.
+        """
+        def parse(buf, pos):
+            header = struct.unpack_from(b"<i32s32sIII", buf, pos)
+            n, pos = ser_read_varint(buf, pos+80)
+            vtx = []
+            for _ in range(n):
+                tx, pos = _deserialize_tx(buf, pos)
+                vtx.append(tx)
+            self = cls(*header)
+            self._set_vtx(vtx)
+            return self, pos
+        return _deserialize_buffer(cls, buf, allow_padding, parse)
+
+    def _set_vtx(self, vtx):
         vMerkleTree = tuple(CBlock.build_merkle_tree_from_txs(vtx))
         object.__setattr__(self, 'vMerkleTree', vMerkleTree)
         try:
@@ -676,8 +911,6 @@ class CBlock(CBlockHeader):
         object.__setattr__(self, 'vWitnessMerkleTree', vWitnessMerkleTree)
         object.__setattr__(self, 'vtx', tuple(vtx))
 
-        return self
-
     def stream_serialize(self, f, include_witness=True):
         super(CBlock, self).stream_serialize(f)
         VectorSerializer.stream_serialize(CTransaction, self.vtx, f, dict(include_witness=include_witness))
@@ -972,6 +1205,7 @@ __all__ = (
         'CTxInWitness',
         'CBlockHeader',
         'CBlock',
+        'iter_block_outputs',
         'CoreChainParams',
         'CoreMainParams',
         'CoreTestNetParams',
@@ -23,6 +23,7 @@ import app.bitcoinlib
 import app.bitcoinlib.signature
 
 import app.bitcoinlib.core.script
+import app.bitcoinlib.core.secp256k1 as _secp256k1
 
 _ssl = ctypes.cdll.LoadLibrary(
     ctypes.util.find_library('ssl.35') or ctypes.util.find_library('ssl') or ctypes.util.find_library('libeay32')
@@ -576,12 +577,32 @@ class CPubKey(bytes):
 
     def __new__(cls, buf, _cec_key=None):
         self = super(CPubKey, cls).__new__(cls, buf)
-        if _cec_key is None:
-            _cec_key = CECKey()
         self._cec_key = _cec_key
-        self.is_fullyvalid = _cec_key.set_pubkey(self) is not None
+        self._is_fullyvalid = None
+        if _cec_key is not None:
+            self._is_fullyvalid = _cec_key.set_pubkey(self) is not None
         return self
 
+    @property
+    def is_fullyvalid(self):
+        # checked on first access, most keys are only put into scripts
+        if self._is_fullyvalid is None:
+            self._is_fullyvalid = self._check_fullyvalid()
+        return self._is_fullyvalid
+
+    def _check_fullyvalid(self):
+        if _secp256k1.is_available() and _secp256k1.is_fullyvalid(self):
+            return True
+        # OpenSSL decides the rest, e.g. it accepts b'\x00'
+        self._get_cec_key()
+        return self._is_fullyvalid_openssl
+
+    def _get_cec_key(self):
+        if self._cec_key is None:
+            self._cec_key = CECKey()
+            self._is_fullyvalid_openssl = self._cec_key.set_pubkey(self) is not None
+        return self._cec_key
+
     @classmethod
     def recover_compact(cls, hash, sig): # pylint: disable=redefined-builtin
         """Recover a public key from a compact signature."""
@@ -615,7 +636,7 @@ class CPubKey(bytes):
         return len(self) == 33
 
     def verify(self, hash, sig): # pylint: disable=redefined-builtin
-        return self._cec_key.verify(hash, sig)
+        return self._get_cec_key().verify(hash, sig)
 
     def __str__(self):
         return repr(self)
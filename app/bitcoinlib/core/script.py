@@ -974,12 +974,37 @@ def RawSignatureHash(script, txTo, inIdx, hashtype):
 SIGVERSION_BASE = 0
 SIGVERSION_WITNESS_V0 = 1
 
-def SignatureHash(script, txTo, inIdx, hashtype, amount=None, sigversion=SIGVERSION_BASE):
+
+class PrecomputedTxData(object):
+    """BIP143 hashes shared by every input of a transaction
+
+    hashPrevouts, hashSequence and hashOutputs only depend on the
+    transaction, not on the input being signed. Compute them once and pass
+    the object to SignatureHash() for each input, otherwise every call
+    rehashes all inputs and outputs.
+
+    The transaction must not be modified afterwards.
+    """
+    __slots__ = ['hashPrevouts', 'hashSequence', 'hashOutputs']
+
+    def __init__(self, txTo):
+        self.hashPrevouts = app.bitcoinlib.core.Hash(
+                b''.join(txin.prevout.serialize() for txin in txTo.vin))
+        self.hashSequence = app.bitcoinlib.core.Hash(
+                b''.join(struct.pack("<I", txin.nSequence) for txin in txTo.vin))
+        self.hashOutputs = app.bitcoinlib.core.Hash(
+                b''.join(txout.serialize() for txout in txTo.vout))
+
+
+def SignatureHash(script, txTo, inIdx, hashtype, amount=None, sigversion=SIGVERSION_BASE, precomputed=None):
     """Calculate a signature hash
 
     'Cooked' version that checks if inIdx is out of bounds - this is *not*
     consensus-correct behavior, but is what you probably want for general
     wallet use.
+
+    precomputed is an optional PrecomputedTxData of txTo, used for
+    SIGVERSION_WITNESS_V0 when signing several inputs of one transaction.
     """
 
     if sigversion == SIGVERSION_WITNESS_V0:
@@ -987,23 +1012,20 @@ def SignatureHash(script, txTo, inIdx, hashtype, amount=None, sigversion=SIGVERS
         hashSequence = b'\x00'*32
         hashOutputs  = b'\x00'*32
 
+        if precomputed is None and not (hashtype & SIGHASH_ANYONECANPAY):
+            precomputed = PrecomputedTxData(txTo)
+
         if not (hashtype & SIGHASH_ANYONECANPAY):
-            serialize_prevouts = bytes()
-            for i in txTo.vin:
-                serialize_prevouts += i.prevout.serialize()
-            hashPrevouts = app.bitcoinlib.core.Hash(serialize_prevouts)
+            hashPrevouts = precomputed.hashPrevouts
 
         if (not (hashtype & SIGHASH_ANYONECANPAY) and (hashtype & 0x1f) != SIGHASH_SINGLE and (hashtype & 0x1f) != SIGHASH_NONE):
-            serialize_sequence = bytes()
-            for i in txTo.vin:
-                serialize_sequence += struct.pack("<I", i.nSequence)
-            hashSequence = app.bitcoinlib.core.Hash(serialize_sequence)
+            hashSequence = precomputed.hashSequence
 
         if ((hashtype & 0x1f) != SIGHASH_SINGLE and (hashtype & 0x1f) != SIGHASH_NONE):
-            serialize_outputs = bytes()
-            for o in txTo.vout:
-                serialize_outputs += o.serialize()
-            hashOutputs = app.bitcoinlib.core.Hash(serialize_outputs)
+            if precomputed is None:
+                hashOutputs = app.bitcoinlib.core.Hash(b''.join(o.serialize() for o in txTo.vout))
+            else:
+                hashOutputs = precomputed.hashOutputs
         elif ((hashtype & 0x1f) == SIGHASH_SINGLE and inIdx < len(txTo.vout)):
             serialize_outputs = txTo.vout[inIdx].serialize()
             hashOutputs = app.bitcoinlib.core.Hash(serialize_outputs)
@@ -1171,6 +1193,7 @@ __all__ = (
         'SIGHASH_ANYONECANPAY',
         'FindAndDelete',
         'RawSignatureHash',
+        'PrecomputedTxData',
         'SignatureHash',
         'IsLowDERSignature',
 
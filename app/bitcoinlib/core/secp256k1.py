@@ -0,0 +1,146 @@
+# Copyright (C) The python-app.bitcoinlib developers
+#
+# This file is part of python-app.bitcoinlib.
+#
+# It is subject to the license terms in the LICENSE file found in the top-level
+# directory of this distribution.
+#
+# No part of python-app.bitcoinlib, including this file, may be copied, modified,
+# propagated, or distributed except according to the terms contained in the
+# LICENSE file.
+
+"""libsecp256k1 public key arithmetic
+
+ctypes bindings for parsing, serializing and tweaking public keys. One
+context is created on first use and shared by all calls, the library only
+reads it so it is safe to use from several threads.
+
+Callers should check is_available() and keep a fallback, the library is
+optional.
+"""
+
+import ctypes
+import ctypes.util
+import threading
+
+_libsecp256k1_path = ctypes.util.find_library('secp256k1')
+_libsecp256k1 = None
+_libsecp256k1_context = None
+_lock = threading.Lock()
+
+# from include/secp256k1.h
+SECP256K1_FLAGS_TYPE_CONTEXT = (1 << 0)
+SECP256K1_FLAGS_TYPE_COMPRESSION = (1 << 1)
+SECP256K1_FLAGS_BIT_CONTEXT_VERIFY = (1 << 8)
+SECP256K1_FLAGS_BIT_COMPRESSION = (1 << 8)
+
+SECP256K1_CONTEXT_VERIFY = \
+    (SECP256K1_FLAGS_TYPE_CONTEXT | SECP256K1_FLAGS_BIT_CONTEXT_VERIFY)
+SECP256K1_EC_COMPRESSED = \
+    (SECP256K1_FLAGS_TYPE_COMPRESSION | SECP256K1_FLAGS_BIT_COMPRESSION)
+SECP256K1_EC_UNCOMPRESSED = SECP256K1_FLAGS_TYPE_COMPRESSION
+
+# secp256k1_pubkey is an opaque 64 byte struct
+PUBKEY_STRUCT_SIZE = 64
+
+
+class Secp256k1Error(ValueError):
+    pass
+
+
+def is_available():
+    return _libsecp256k1_path is not None
+
+
+def _load():
+    global _libsecp256k1
+    global _libsecp256k1_context
+
+    with _lock:
+        if _libsecp256k1_context is not None:
+            return
+        if not is_available():
+            raise ImportError("unable to locate libsecp256k1")
+
+        lib = ctypes.cdll.LoadLibrary(_libsecp256k1_path)
+        lib.secp256k1_context_create.restype = ctypes.c_void_p
+        lib.secp256k1_context_create.argtypes = [ctypes.c_uint]
+
+        lib.secp256k1_ec_pubkey_parse.restype = ctypes.c_int
+        lib.secp256k1_ec_pubkey_parse.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_size_t]
+
+        lib.secp256k1_ec_pubkey_serialize.restype = ctypes.c_int
+        lib.secp256k1_ec_pubkey_serialize.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_size_t),
+                                                      ctypes.c_char_p, ctypes.c_uint]
+
+        lib.secp256k1_ec_pubkey_tweak_add.restype = ctypes.c_int
+        lib.secp256k1_ec_pubkey_tweak_add.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]
+
+        context = lib.secp256k1_context_create(SECP256K1_CONTEXT_VERIFY)
+        if not context:
+            raise ImportError("unable to create libsecp256k1 context")
+        _libsecp256k1 = lib
+        _libsecp256k1_context = context
+
+
+def _context():
+    if _libsecp256k1_context is None:
+        _load()
+    return _libsecp256k1, _libsecp256k1_context
+
+
+def pubkey_parse(data):
+    """Parse a serialized public key into the library struct
+
+    Accepts compressed, uncompressed and hybrid encodings. Raises
+    Secp256k1Error if the key is not a valid point.
+    """
+    lib, ctx = _context()
+    pubkey = ctypes.create_string_buffer(PUBKEY_STRUCT_SIZE)
+    if not lib.secp256k1_ec_pubkey_parse(ctx, pubkey, bytes(data), len(data)):
+        raise Secp256k1Error("invalid public key")
+    return pubkey
+
+
+def pubkey_serialize(pubkey, compressed=True):
+    """Serialize a public key struct to 33 or 65 bytes"""
+    lib, ctx = _context()
+    size = ctypes.c_size_t(65)
+    output = ctypes.create_string_buffer(65)
+    flags = SECP256K1_EC_COMPRESSED if compressed else SECP256K1_EC_UNCOMPRESSED
+    lib.secp256k1_ec_pubkey_serialize(ctx, output, ctypes.byref(size), pubkey, flags)
+    return output.raw[:size.value]
+
+
+def is_fullyvalid(data):
+    """True if data is a valid serialized public key"""
+    try:
+        pubkey_parse(data)
+    except Secp256k1Error:
+        return False
+    return True
+
+
+def pubkey_tweak_add(data, tweak, compressed=True):
+    """Return serialized data + tweak*G
+
+    tweak is a 32 byte big endian scalar. Raises Secp256k1Error if the
+    tweak is not below the curve order or the result is infinity.
+    """
+    if len(tweak) != 32:
+        raise Secp256k1Error("tweak must be 32 bytes")
+    lib, ctx = _context()
+    pubkey = pubkey_parse(data)
+    if not lib.secp256k1_ec_pubkey_tweak_add(ctx, pubkey, bytes(tweak)):
+        raise Secp256k1Error("invalid tweak")
+    return pubkey_serialize(pubkey, compressed)
+
+
+__all__ = (
+    'Secp256k1Error',
+    'is_available',
+    'pubkey_parse',
+    'pubkey_serialize',
+    'is_fullyvalid',
+    'pubkey_tweak_add',
+)
@@ -70,6 +70,26 @@ def ser_read(f, n):
     return r
 
 
+def ser_read_varint(buf, pos):
+    """Read a varint from a buffer at offset pos
+
+    Offset based counterpart of VarIntSerializer.stream_deserialize() for
+    parsing a memoryview in place. Returns (value, offset after the varint)
+    and raises SerializationTruncationError if buf ends first.
+    """
+    try:
+        r = buf[pos]
+        if r < 0xfd:
+            return r, pos + 1
+        elif r == 0xfd:
+            return struct.unpack_from(b'<H', buf, pos + 1)[0], pos + 3
+        elif r == 0xfe:
+            return struct.unpack_from(b'<I', buf, pos + 1)[0], pos + 5
+        else:
+            return struct.unpack_from(b'<Q', buf, pos + 1)[0], pos + 9
+    except (IndexError, struct.error):
+        raise SerializationTruncationError('Truncated varint at offset %i' % pos)
+
 class Serializable(object):
     """Base class for serializable objects"""
 
@@ -352,6 +372,7 @@ __all__ = (
         'SerializationTruncationError',
         'DeserializationExtraDataError',
         'ser_read',
+        'ser_read_varint',
         'Serializable',
         'ImmutableSerializable',
         'Serializer',
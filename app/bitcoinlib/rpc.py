@@ -30,8 +30,14 @@ import decimal
 import json
 import os
 import platform
+import itertools
 import urllib.parse as urlparse
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
 import app.bitcoinlib
 from app.bitcoinlib.core import COIN, x, lx, b2lx, CBlock, CBlockHeader, CTransaction, COutPoint, CTxOut
 from app.bitcoinlib.core.script import CScript
@@ -41,6 +47,8 @@ DEFAULT_USER_AGENT = "AuthServiceProxy/0.1"
 
 DEFAULT_HTTP_TIMEOUT = 30
 
+DEFAULT_MAX_CONNECTIONS = 10
+
 def unhexlify_str(h):
     """
     Converts a string containing hexadecimal encoding into a bytes-object.
@@ -128,6 +136,120 @@ class InWarmupError(JSONRPCError):
     RPC_ERROR_CODE = -28
 
 
+def _parse_response(rdata, status, reason):
+    """Parse a JSON-RPC HTTP response body, floats as Decimal"""
+    try:
+        return json.loads(rdata, parse_float=decimal.Decimal)
+    except Exception:
+        raise JSONRPCError({
+            'code': -342,
+            'message': ('non-JSON HTTP response with \'%i %s\' from server: \'%.20s%s\''
+                        % (status, reason,
+                           rdata, '...' if len(rdata) > 20 else ''))})
+
+
+def _response_result(response):
+    """Return the result of a JSON-RPC response, raising JSONRPCError on error"""
+    err = response.get('error')
+    if err is not None:
+        if isinstance(err, dict):
+            raise JSONRPCError(
+                {'code': err.get('code', -345),
+                 'message': err.get('message', 'error message not specified')})
+        raise JSONRPCError({'code': -344, 'message': str(err)})
+    elif 'result' not in response:
+        raise JSONRPCError({
+            'code': -343, 'message': 'missing JSON-RPC result'})
+    else:
+        return response['result']
+
+
+def _batch_results(response, ids):
+    """Match a JSON-RPC batch response to the request ids
+
+    Returns one entry per id in request order: the result of the call, or
+    the JSONRPCError it failed with. Responses may arrive in any order.
+    """
+    if isinstance(response, dict):
+        # the batch as a whole was rejected
+        _response_result(response)
+    if not isinstance(response, list):
+        raise JSONRPCError({
+            'code': -343, 'message': 'missing JSON-RPC batch result'})
+    by_id = {r.get('id'): r for r in response if isinstance(r, dict)}
+    results = []
+    for rpc_id in ids:
+        r = by_id.get(rpc_id)
+        if r is None:
+            results.append(JSONRPCError({
+                'code': -343, 'message': 'missing JSON-RPC result for id %r' % rpc_id}))
+            continue
+        try:
+            results.append(_response_result(r))
+        except JSONRPCError as err:
+            results.append(err)
+    return results
+
+
+def _conf_service_url(service_port=None, btc_conf_file=None):
+    """Return (service_url, authpair) from bitcoin.conf and the cookie file
+
+    Shared by BaseProxy and AsyncProxy.
+    """
+    # Figure out the path to the bitcoin.conf file
+    if btc_conf_file is None:
+        if platform.system() == 'Darwin':
+            btc_conf_file = os.path.expanduser('~/Library/Application Support/Bitcoin/')
+        elif platform.system() == 'Windows':
+            btc_conf_file = os.path.join(os.environ['APPDATA'], 'Bitcoin')
+        else:
+            btc_conf_file = os.path.expanduser('~/.bitcoin')
+        btc_conf_file = os.path.join(btc_conf_file, 'bitcoin.conf')
+
+    # Bitcoin Core accepts empty rpcuser, not specified in btc_conf_file
+    conf = {'rpcuser': ""}
+
+    # Extract contents of bitcoin.conf to build service_url
+    try:
+        with open(btc_conf_file, 'r') as fd:
+            for line in fd.readlines():
+                if '#' in line:
+                    line = line[:line.index('#')]
+                if '=' not in line:
+                    continue
+                k, v = line.split('=', 1)
+                conf[k.strip()] = v.strip()
+
+    # Treat a missing bitcoin.conf as though it were empty
+    except FileNotFoundError:
+        pass
+
+    if service_port is None:
+        service_port = app.bitcoinlib.params.RPC_PORT
+    conf['rpcport'] = int(conf.get('rpcport', service_port))
+    conf['rpchost'] = conf.get('rpcconnect', 'localhost')
+
+    service_url = ('%s://%s:%d' %
+        ('http', conf['rpchost'], conf['rpcport']))
+
+    cookie_dir = conf.get('datadir', os.path.dirname(btc_conf_file))
+    if app.bitcoinlib.params.NAME == 'testnet':
+        cookie_dir = os.path.join(cookie_dir, 'testnet3')
+    elif app.bitcoinlib.params.NAME == 'regtest':
+        cookie_dir = os.path.join(cookie_dir, app.bitcoinlib.params.NAME)
+    cookie_file = os.path.join(cookie_dir, ".cookie")
+    try:
+        with open(cookie_file, 'r') as fd:
+            authpair = fd.read()
+    except IOError as err:
+        if 'rpcpassword' in conf:
+            authpair = "%s:%s" % (conf['rpcuser'], conf['rpcpassword'])
+
+        else:
+            raise ValueError('Cookie file unusable (%s) and rpcpassword not specified in the configuration file: %r' % (err, btc_conf_file))
+    return service_url, authpair
+
+
 class BaseProxy(object):
     """Base JSON-RPC proxy class. Contains only private methods; do not use
     directly."""
@@ -146,58 +268,7 @@ class BaseProxy(object):
         authpair = None
 
         if service_url is None:
-            # Figure out the path to the bitcoin.conf file
-            if btc_conf_file is None:
-                if platform.system() == 'Darwin':
-                    btc_conf_file = os.path.expanduser('~/Library/Application Support/Bitcoin/')
-                elif platform.system() == 'Windows':
-                    btc_conf_file = os.path.join(os.environ['APPDATA'], 'Bitcoin')
-                else:
-                    btc_conf_file = os.path.expanduser('~/.bitcoin')
-                btc_conf_file = os.path.join(btc_conf_file, 'bitcoin.conf')
-
-            # Bitcoin Core accepts empty rpcuser, not specified in btc_conf_file
-            conf = {'rpcuser': ""}
-
-            # Extract contents of bitcoin.conf to build service_url
-            try:
-                with open(btc_conf_file, 'r') as fd:
-                    for line in fd.readlines():
-                        if '#' in line:
-                            line = line[:line.index('#')]
-                        if '=' not in line:
-                            continue
-                        k, v = line.split('=', 1)
-                        conf[k.strip()] = v.strip()
-
-            # Treat a missing bitcoin.conf as though it were empty
-            except FileNotFoundError:
-                pass
-
-            if service_port is None:
-                service_port = app.bitcoinlib.params.RPC_PORT
-            conf['rpcport'] = int(conf.get('rpcport', service_port))
-            conf['rpchost'] = conf.get('rpcconnect', 'localhost')
-
-            service_url = ('%s://%s:%d' %
-                ('http', conf['rpchost'], conf['rpcport']))
-
-            cookie_dir = conf.get('datadir', os.path.dirname(btc_conf_file))
-            if app.bitcoinlib.params.NAME == 'testnet':
-                cookie_dir = os.path.join(cookie_dir, 'testnet3')
-            elif app.bitcoinlib.params.NAME == 'regtest':
-                cookie_dir = os.path.join(cookie_dir, app.bitcoinlib.params.NAME)
-            cookie_file = os.path.join(cookie_dir, ".cookie")
-            try:
-                with open(cookie_file, 'r') as fd:
-                    authpair = fd.read()
-            except IOError as err:
-                if 'rpcpassword' in conf:
-                    authpair = "%s:%s" % (conf['rpcuser'], conf['rpcpassword'])
-
-                else:
-                    raise ValueError('Cookie file unusable (%s) and rpcpassword not specified in the configuration file: %r' % (err, btc_conf_file))
-
+            service_url, authpair = _conf_service_url(service_port, btc_conf_file)
         else:
             url = urlparse.urlparse(service_url)
             authpair = "%s:%s" % (url.username, url.password)
@@ -245,20 +316,7 @@ class BaseProxy(object):
 
         self.__conn.request('POST', self.__url.path, postdata, headers)
 
-        response = self._get_response()
-        # print('RESPONSE', response)
-        err = response.get('error')
-        if err is not None:
-            if isinstance(err, dict):
-                raise JSONRPCError(
-                    {'code': err.get('code', -345),
-                     'message': err.get('message', 'error message not specified')})
-            raise JSONRPCError({'code': -344, 'message': str(err)})
-        elif 'result' not in response:
-            raise JSONRPCError({
-                'code': -343, 'message': 'missing JSON-RPC result'})
-        else:
-            return response['result']
+        return _response_result(self._get_response())
 
     def _batch(self, rpc_call_list):
         postdata = json.dumps(list(rpc_call_list))
@@ -282,14 +340,7 @@ class BaseProxy(object):
                 'code': -342, 'message': 'missing HTTP response from server'})
 
         rdata = http_response.read().decode('utf8')
-        try:
-            return json.loads(rdata, parse_float=decimal.Decimal)
-        except Exception:
-            raise JSONRPCError({
-                'code': -342,
-                'message': ('non-JSON HTTP response with \'%i %s\' from server: \'%.20s%s\''
-                            % (http_response.status, http_response.reason,
-                               rdata, '...' if len(rdata) > 20 else ''))})
+        return _parse_response(rdata, http_response.status, http_response.reason)
 
     def close(self):
         if self.__conn is not None:
@@ -376,6 +427,17 @@ class Proxy(BaseProxy):
         """Call an RPC method by name and raw (JSON encodable) arguments"""
         return self._call(service_name, *args)
 
+    def batch(self):
+        """Queue calls to send them as one JSON-RPC batch request
+
+        >>> with proxy.batch() as batch:
+        ...     confirmations = [batch.getconfirmations(txid, 0) for txid in txids]
+        >>> [c.result() for c in confirmations]
+
+        The batch is sent when the ``with`` block exits, or by ``send()``.
+        """
+        return RPCBatch(self)
+
     def dumpprivkey(self, addr):
         """Return the private key matching an address
         """
@@ -487,18 +549,7 @@ class Proxy(BaseProxy):
         except InvalidAddressOrKeyError as ex:
             raise IndexError('%s.getblockheader(): %s (%d)' %
                     (self.__class__.__name__, ex.error['message'], ex.error['code']))
-
-        if verbose:
-            nextblockhash = None
-            if 'nextblockhash' in r:
-                nextblockhash = lx(r['nextblockhash'])
-            return {'confirmations':r['confirmations'],
-                    'height':r['height'],
-                    'mediantime':r['mediantime'],
-                    'nextblockhash':nextblockhash,
-                    'chainwork':x(r['chainwork'])}
-        else:
-            return CBlockHeader.deserialize(unhexlify_str(r))
+        return _blockheader_result(r, verbose)
 
 
     def getblock(self, block_hash):
@@ -506,10 +557,18 @@ class Proxy(BaseProxy):
 
         Raises IndexError if block_hash is not valid.
         """
+        return CBlock.deserialize(self.getrawblock(block_hash))
+
+    def getrawblock(self, block_hash):
+        """Get serialized block <block_hash> as bytes
+
+        For callers that parse the block themselves, e.g. with
+        iter_block_outputs(). Raises IndexError if block_hash is not valid.
+        """
         try:
             block_hash = b2lx(block_hash)
         except TypeError:
-            raise TypeError('%s.getblock(): block_hash must be bytes; got %r instance' %
+            raise TypeError('%s.getrawblock(): block_hash must be bytes; got %r instance' %
                     (self.__class__.__name__, block_hash.__class__))
         try:
             # With this change ( https://github.com/bitcoin/bitcoin/commit/96c850c20913b191cff9f66fedbb68812b1a41ea#diff-a0c8f511d90e83aa9b5857e819ced344 ),
@@ -517,9 +576,9 @@ class Proxy(BaseProxy):
             # The change above is backward-compatible so far; the old "false" is taken as the new "0".
             r = self._call('getblock', block_hash, False)
         except InvalidAddressOrKeyError as ex:
-            raise IndexError('%s.getblock(): %s (%d)' %
+            raise IndexError('%s.getrawblock(): %s (%d)' %
                     (self.__class__.__name__, ex.error['message'], ex.error['code']))
-        return CBlock.deserialize(unhexlify_str(r))
+        return unhexlify_str(r)
 
     def estimatesmartfee(self, blocks: int):
         r = self._call('estimatesmartfee', blocks)
@@ -611,18 +670,7 @@ class Proxy(BaseProxy):
         except InvalidAddressOrKeyError as ex:
             raise IndexError('%s.getrawtransaction(): %s (%d)' %
                     (self.__class__.__name__, ex.error['message'], ex.error['code']))
-        if verbose:
-            r['tx'] = CTransaction.deserialize(unhexlify_str(r['hex']))
-            del r['hex']
-            del r['txid']
-            del r['version']
-            del r['locktime']
-            del r['vin']
-            del r['vout']
-            r['blockhash'] = lx(r['blockhash']) if 'blockhash' in r else None
-        else:
-            r = CTransaction.deserialize(unhexlify_str(r))
-        return r
+        return _rawtransaction_result(r, verbose)
 
     def getreceivedbyaddress(self, addr, minconf=1):
         """Return total amount received by given a (wallet) address
@@ -680,20 +728,10 @@ class Proxy(BaseProxy):
 
         if r is None:
             raise IndexError('%s.gettxout(): unspent txout %r not found' % (self.__class__.__name__, outpoint))
-
-        r['txout'] = CTxOut(int(r['value'] * COIN),
-                            CScript(unhexlify_str(r['scriptPubKey']['hex'])))
-        del r['value']
-        del r['scriptPubKey']
-        r['bestblock'] = lx(r['bestblock'])
-        return r
+        return _txout_result(r)
     
     def getconfirmations(self, txid, vout, includemempool=True):
-        r = self._call('gettxout', txid, vout, includemempool)        
-        if r is None:
-            raise IndexError('unspent txout not found')
-        n = r['confirmations']
-        return n
+        return _confirmations_result(self._call('gettxout', txid, vout, includemempool))
 
     def gettxout2(self, txid, vout, includemempool=True):
         r = self._call('gettxout', txid, vout, includemempool)
@@ -850,6 +888,364 @@ class Proxy(BaseProxy):
     def removenode(self, node):
         return self._addnode(node, 'remove')
 
+
+def _blockheader_result(r, verbose):
+    if verbose:
+        nextblockhash = None
+        if 'nextblockhash' in r:
+            nextblockhash = lx(r['nextblockhash'])
+        return {'confirmations':r['confirmations'],
+                'height':r['height'],
+                'mediantime':r['mediantime'],
+                'nextblockhash':nextblockhash,
+                'chainwork':x(r['chainwork'])}
+    return CBlockHeader.deserialize(unhexlify_str(r))
+
+
+def _rawtransaction_result(r, verbose):
+    if verbose:
+        r['tx'] = CTransaction.deserialize(unhexlify_str(r['hex']))
+        del r['hex']
+        del r['txid']
+        del r['version']
+        del r['locktime']
+        del r['vin']
+        del r['vout']
+        r['blockhash'] = lx(r['blockhash']) if 'blockhash' in r else None
+        return r
+    return CTransaction.deserialize(unhexlify_str(r))
+
+
+def _txout_result(r):
+    r['txout'] = CTxOut(int(r['value'] * COIN),
+                        CScript(unhexlify_str(r['scriptPubKey']['hex'])))
+    del r['value']
+    del r['scriptPubKey']
+    r['bestblock'] = lx(r['bestblock'])
+    return r
+
+
+def _confirmations_result(r):
+    if r is None:
+        raise IndexError('unspent txout not found')
+    return r['confirmations']
+
+
+class BatchResult(object):
+    """Result of a call queued in an RPCBatch
+
+    Available once the batch has been sent.
+    """
+    __slots__ = ['done', 'value', 'error']
+
+    def __init__(self):
+        self.done = False
+        self.value = None
+        self.error = None
+
+    def result(self):
+        """Return the converted result, raising the error the call failed with"""
+        if not self.done:
+            raise RuntimeError('batch has not been sent')
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class RPCBatch(object):
+    """Calls queued for one JSON-RPC batch request, see Proxy.batch()
+
+    The typed methods mirror ``Proxy`` and return a ``BatchResult``; results
+    are converted and errors mapped the same way, so a missing transaction
+    is an IndexError raised by ``BatchResult.result()``. Responses are
+    matched to calls by id.
+    """
+
+    def __init__(self, proxy):
+        self._proxy = proxy
+        self._calls = []
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.send()
+
+    def _queue(self, service_name, args, convert=None, not_found=None):
+        """Queue a call
+
+        convert - applied to the raw result
+        not_found - JSONRPCError subclass mapped to IndexError
+        """
+        r = BatchResult()
+        self._calls.append((service_name, args, convert, not_found, r))
+        return r
+
+    def _request(self):
+        return [{'version': '1.1',
+                 'method': service_name,
+                 'params': args,
+                 'id': rpc_id}
+                for rpc_id, (service_name, args, _, _, _) in enumerate(self._calls)]
+
+    def _resolve(self, response):
+        results = _batch_results(response, range(len(self._calls)))
+        values = []
+        for (service_name, _, convert, not_found, r), result in zip(self._calls, results):
+            if isinstance(result, JSONRPCError):
+                if not_found is not None and isinstance(result, not_found):
+                    result = IndexError('%s(): %s (%d)' %
+                        (service_name, result.error['message'], result.error['code']))
+                r.error = result
+            elif convert is None:
+                r.value = result
+            else:
+                try:
+                    r.value = convert(result)
+                except IndexError as err:
+                    r.error = err
+            r.done = True
+            values.append(r.value if r.error is None else r.error)
+        self._calls = []
+        return values
+
+    def send(self):
+        """Send the queued calls in one request
+
+        Returns the converted results in the order of calls, a call that
+        failed is returned as its exception.
+        """
+        if not self._calls:
+            return []
+        return self._resolve(self._proxy._batch(self._request()))
+
+    def call(self, service_name, *args):
+        """Queue an RPC method by name and raw (JSON encodable) arguments"""
+        return self._queue(service_name, args)
+
+    def getbestblockhash(self):
+        return self._queue('getbestblockhash', (), lx)
+
+    def getblockcount(self):
+        return self._queue('getblockcount', ())
+
+    def getblockhash(self, height):
+        return self._queue('getblockhash', (height,), lx, InvalidParameterError)
+
+    def getblockheader(self, block_hash, verbose=False):
+        return self._queue('getblockheader', (b2lx(block_hash), verbose),
+                           lambda r: _blockheader_result(r, verbose), InvalidAddressOrKeyError)
+
+    def getrawblock(self, block_hash):
+        return self._queue('getblock', (b2lx(block_hash), False), unhexlify_str, InvalidAddressOrKeyError)
+
+    def getrawtransaction(self, txid, verbose=False, block_hash=None):
+        args = (b2lx(txid), 1 if verbose else 0)
+        if block_hash is not None:
+            args += (b2lx(block_hash),)
+        return self._queue('getrawtransaction', args,
+                           lambda r: _rawtransaction_result(r, verbose), InvalidAddressOrKeyError)
+
+    def gettxout(self, outpoint, includemempool=True):
+        def convert(r):
+            if r is None:
+                raise IndexError('gettxout(): unspent txout %r not found' % outpoint)
+            return _txout_result(r)
+        return self._queue('gettxout', (b2lx(outpoint.hash), outpoint.n, includemempool), convert)
+
+    def getconfirmations(self, txid, vout, includemempool=True):
+        return self._queue('gettxout', (txid, vout, includemempool), _confirmations_result)
+
+    def estimatesmartfee(self, blocks):
+        return self._queue('estimatesmartfee', (blocks,), lambda r: int(r['feerate']))
+
+
+class AsyncRPCBatch(RPCBatch):
+    """RPCBatch of an AsyncProxy, see AsyncProxy.batch()"""
+
+    def __enter__(self):
+        raise TypeError('use async with')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.send()
+
+    async def send(self):
+        if not self._calls:
+            return []
+        return self._resolve(await self._proxy._batch(self._request()))
+
+
+class AsyncProxy(object):
+    """Asyncio proxy to a bitcoin RPC service
+
+    Mirrors ``Proxy`` for the calls the app makes, as coroutines. Requests
+    go through a pooled ``httpx.AsyncClient`` so one instance can be shared
+    and called concurrently; bitcoind serves up to ``rpcthreads`` of them in
+    parallel. Configuration, cookie discovery and ``JSONRPCError`` mapping
+    are the same as ``Proxy``.
+
+    ``max_connections`` - size of the HTTP connection pool
+    """
+
+    def __init__(self,
+                 service_url=None,
+                 service_port=None,
+                 btc_conf_file=None,
+                 timeout=DEFAULT_HTTP_TIMEOUT,
+                 max_connections=DEFAULT_MAX_CONNECTIONS,
+                 transport=None):
+        if httpx is None:
+            raise ImportError('AsyncProxy requires httpx')
+
+        if service_url is None:
+            service_url, authpair = _conf_service_url(service_port, btc_conf_file)
+        else:
+            url = urlparse.urlparse(service_url)
+            authpair = "%s:%s" % (url.username, url.password)
+
+        url = urlparse.urlparse(service_url)
+        if url.scheme not in ('http',):
+            raise ValueError('Unsupported URL scheme %r' % url.scheme)
+        port = url.port if url.port is not None else httplib.HTTP_PORT
+
+        self._url = 'http://%s:%d%s' % (url.hostname, port, url.path or '/')
+        self._ids = itertools.count(1)
+        headers = {
+            'User-Agent': DEFAULT_USER_AGENT,
+            'Content-type': 'application/json',
+        }
+        if authpair is not None:
+            headers['Authorization'] = 'Basic ' + base64.b64encode(authpair.encode('utf8')).decode('ascii')
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_connections)
+        self._client = httpx.AsyncClient(headers=headers, timeout=timeout,
+                                         limits=limits, transport=transport)
+
+    async def _post(self, postdata):
+        r = await self._client.post(self._url, content=postdata)
+        return _parse_response(r.content.decode('utf8'), r.status_code, r.reason_phrase)
+
+    async def _call(self, service_name, *args):
+        postdata = json.dumps({'version': '1.1',
+                               'method': service_name,
+                               'params': args,
+                               'id': next(self._ids)})
+        return _response_result(await self._post(postdata))
+
+    async def _batch(self, rpc_call_list):
+        return await self._post(json.dumps(list(rpc_call_list)))
+
+    async def call(self, service_name, *args):
+        """Call an RPC method by name and raw (JSON encodable) arguments"""
+        return await self._call(service_name, *args)
+
+    def batch(self):
+        """Queue calls to send them as one JSON-RPC batch request
+
+        Same as ``Proxy.batch()``, the batch is sent when the ``async with``
+        block exits, or by ``await batch.send()``.
+        """
+        return AsyncRPCBatch(self)
+
+    async def call_batch(self, calls):
+        """Send several calls in one JSON-RPC batch request
+
+        calls - iterable of (service_name, *args) tuples
+
+        Returns the raw results in the order of calls. A call that failed
+        is returned as its JSONRPCError instead of raising, so one bad
+        call does not hide the others.
+        """
+        batch = self.batch()
+        for service_name, *args in calls:
+            batch.call(service_name, *args)
+        return await batch.send()
+
+    async def getbestblockhash(self):
+        """Return hash of best (tip) block in longest block chain."""
+        return lx(await self._call('getbestblockhash'))
+
+    async def getblockcount(self):
+        """Return the number of blocks in the longest block chain"""
+        return await self._call('getblockcount')
+
+    async def getblockhash(self, height):
+        """Return hash of block in best-block-chain at height.
+
+        Raises IndexError if height is not valid.
+        """
+        try:
+            return lx(await self._call('getblockhash', height))
+        except InvalidParameterError as ex:
+            raise IndexError('%s.getblockhash(): %s (%d)' %
+                    (self.__class__.__name__, ex.error['message'], ex.error['code']))
+
+    async def getblockheader(self, block_hash, verbose=False):
+        """Get block header <block_hash>, see Proxy.getblockheader()"""
+        try:
+            r = await self._call('getblockheader', b2lx(block_hash), verbose)
+        except InvalidAddressOrKeyError as ex:
+            raise IndexError('%s.getblockheader(): %s (%d)' %
+                    (self.__class__.__name__, ex.error['message'], ex.error['code']))
+        return _blockheader_result(r, verbose)
+
+    async def getrawblock(self, block_hash):
+        """Get serialized block <block_hash> as bytes
+
+        Raises IndexError if block_hash is not valid.
+        """
+        try:
+            r = await self._call('getblock', b2lx(block_hash), False)
+        except InvalidAddressOrKeyError as ex:
+            raise IndexError('%s.getrawblock(): %s (%d)' %
+                    (self.__class__.__name__, ex.error['message'], ex.error['code']))
+        return unhexlify_str(r)
+
+    async def getblock(self, block_hash):
+        """Get block <block_hash>
+
+        Raises IndexError if block_hash is not valid.
+        """
+        return CBlock.deserialize(await self.getrawblock(block_hash))
+
+    async def getrawtransaction(self, txid):
+        """Return transaction with hash txid
+
+        Raises IndexError if transaction not found.
+        """
+        try:
+            r = await self._call('getrawtransaction', b2lx(txid), 0)
+        except InvalidAddressOrKeyError as ex:
+            raise IndexError('%s.getrawtransaction(): %s (%d)' %
+                    (self.__class__.__name__, ex.error['message'], ex.error['code']))
+        return _rawtransaction_result(r, False)
+
+    async def getconfirmations(self, txid, vout, includemempool=True):
+        return _confirmations_result(await self._call('gettxout', txid, vout, includemempool))
+
+    async def estimatesmartfee(self, blocks: int):
+        r = await self._call('estimatesmartfee', blocks)
+        return int(r['feerate'])
+
+    async def sendrawtransaction(self, hextx, allowhighfees=False):
+        """Submit transaction to local node and network."""
+        if allowhighfees:
+            r = await self._call('sendrawtransaction', hextx, True)
+        else:
+            r = await self._call('sendrawtransaction', hextx)
+        return lx(r)
+
+    async def aclose(self):
+        await self._client.aclose()
+
 __all__ = (
     'JSONRPCError',
     'ForbiddenBySafeModeError',
@@ -861,4 +1257,8 @@ __all__ = (
     'InWarmupError',
     'RawProxy',
     'Proxy',
+    'AsyncProxy',
+    'RPCBatch',
+    'AsyncRPCBatch',
+    'BatchResult',
 )
@@ -11,8 +11,11 @@
 
 
 import unittest
+from io import BytesIO
 
 from app.bitcoinlib.core import *
+from app.bitcoinlib.core.script import CScript
+from app.bitcoinlib.core.serialize import DeserializationExtraDataError, SerializationTruncationError
 
 class Test_str_value(unittest.TestCase):
     def test(self):
@@ -96,6 +99,50 @@ class Test_CBlock(unittest.TestCase):
         genesis = CBlock.deserialize(x('0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c0101000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4d04ffff001d0104455468652054696d65732030332f4a616e2f32303039204368616e63656c6c6f72206f6e206272696e6b206f66207365636f6e64206261696c6f757420666f722062616e6b73ffffffff0100f2052a01000000434104678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac00000000'))
         self.assertEqual(genesis.GetHash(), lx('000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f'))
 
+    def test_deserialize_matches_stream(self):
+        # 170 two transactions
+        raw = x('0100000055bd840a78798ad0da853f68974f3d183e2bd1db6a842c1feecf222a00000000ff104ccb05421ab93e63f8c3ce5c2c2e9dbb37de2764b3a3175c8166562cac7d51b96a49ffff001d283e9e700201000000010000000000000000000000000000000000000000000000000000000000000000ffffffff0704ffff001d0102ffffffff0100f2052a01000000434104d46c4968bde02899d2aa0963367c7a6ce34eec332b32e42e5f3407e052d64ac625da6f0718e7b302140434bd725706957c092db53805b821a85b23a7ac61725bac000000000100000001c997a5e56e104102fa209c6a852dd90660a20b2d9c352423edce25857fcd3704000000004847304402204e45e16932b8af514961a1d3a1a25fdf3f4f7732e9d624c6c61548ab5fb8cd410220181522ec8eca07de4860a4acdd12909d831cc56cbbac4622082221a8768d1d0901ffffffff0200ca9a3b00000000434104ae1a62fe09c5f51b13905f07f06b99a2f7159b2225f374cd378d71302fa28414e7aab37397f554a7df5f142c21c1b7303b8a0626f1baded5c72a704f7e6cd84cac00286bee0000000043410411db93e1dcdb8a016b49840f8c53bc1eb68a382e97b1482ecad7b148a6909a5cb2e0eaddfb84ccf9744464f82e160bfa9b8b64f9d4c03f999b8643f656b412a3ac00000000')
+        block = CBlock.deserialize(raw)
+        expected = CBlock.stream_deserialize(BytesIO(raw))
+        self.assertEqual(repr(block), repr(expected))
+        self.assertEqual(block.vtx, expected.vtx)
+        self.assertEqual(block.vMerkleTree, expected.vMerkleTree)
+        self.assertEqual(block.vWitnessMerkleTree, ())
+        self.assertEqual(block.GetHash(), expected.GetHash())
+        self.assertEqual(block.serialize(), raw)
+
+        with self.assertRaises(SerializationTruncationError):
+            CBlock.deserialize(raw[:-1])
+        with self.assertRaises(SerializationTruncationError):
+            CBlock.deserialize(raw[:79])
+        with self.assertRaises(DeserializationExtraDataError):
+            CBlock.deserialize(raw + b'\x00')
+
+    def test_iter_block_outputs(self):
+        # 170 two transactions
+        raw = x('0100000055bd840a78798ad0da853f68974f3d183e2bd1db6a842c1feecf222a00000000ff104ccb05421ab93e63f8c3ce5c2c2e9dbb37de2764b3a3175c8166562cac7d51b96a49ffff001d283e9e700201000000010000000000000000000000000000000000000000000000000000000000000000ffffffff0704ffff001d0102ffffffff0100f2052a01000000434104d46c4968bde02899d2aa0963367c7a6ce34eec332b32e42e5f3407e052d64ac625da6f0718e7b302140434bd725706957c092db53805b821a85b23a7ac61725bac000000000100000001c997a5e56e104102fa209c6a852dd90660a20b2d9c352423edce25857fcd3704000000004847304402204e45e16932b8af514961a1d3a1a25fdf3f4f7732e9d624c6c61548ab5fb8cd410220181522ec8eca07de4860a4acdd12909d831cc56cbbac4622082221a8768d1d0901ffffffff0200ca9a3b00000000434104ae1a62fe09c5f51b13905f07f06b99a2f7159b2225f374cd378d71302fa28414e7aab37397f554a7df5f142c21c1b7303b8a0626f1baded5c72a704f7e6cd84cac00286bee0000000043410411db93e1dcdb8a016b49840f8c53bc1eb68a382e97b1482ecad7b148a6909a5cb2e0eaddfb84ccf9744464f82e160bfa9b8b64f9d4c03f999b8643f656b412a3ac00000000')
+        outputs = list(iter_block_outputs(raw))
+        self.assertEqual([(b2lx(txid), i, value) for txid, i, script, value in outputs],
+                         [('b1fea52486ce0c62bb442b530a3f0132b826c74e473d1f2c220bfa78111c5082', 0, 5000000000),
+                          ('f4184fc596403b9d638783cf57adfe4c75c605f6356fbc91338530e9831e9e16', 0, 1000000000),
+                          ('f4184fc596403b9d638783cf57adfe4c75c605f6356fbc91338530e9831e9e16', 1, 4000000000)])
+        self.assertEqual(outputs[1][2], CBlock.deserialize(raw).vtx[1].vout[0].scriptPubKey)
+
+        with self.assertRaises(SerializationTruncationError):
+            list(iter_block_outputs(raw[:-1]))
+
+    def test_iter_block_outputs_segwit(self):
+        # one segwit input (P2WPKH) and two legacy inputs (P2PKH), from test_calc_weight
+        tx = CTransaction.deserialize(x('010000000001036b6b6ac7e34e97c53c1cc74c99c7948af2e6aac75d8778004ae458d813456764000000006a473044022001deec7d9075109306320b3754188f81a8236d0d232b44bc69f8309115638b8f02204e17a5194a519cf994d0afeea1268740bdc10616b031a521113681cc415e815c012103488d3272a9fad78ee887f0684cb8ebcfc06d0945e1401d002e590c7338b163feffffffffc75bd7aa6424aee972789ec28ba181254ee6d8311b058d165bd045154d7660b0000000006b483045022100c8641bcbee3e4c47a00417875015d8c5d5ea918fb7e96f18c6ffe51bc555b401022074e2c46f5b1109cd79e39a9aa203eadd1d75356415e51d80928a5fb5feb0efee0121033504b4c6dfc3a5daaf7c425aead4c2dbbe4e7387ce8e6be2648805939ecf7054ffffffff494df3b205cd9430a26f8e8c0dc0bb80496fbc555a524d6ea307724bc7e60eee0100000000ffffffff026d861500000000001976a9145c54ed1360072ebaf56e87693b88482d2c6a101588ace407000000000000160014761e31e2629c6e11936f2f9888179d60a5d4c1f900000247304402201fa38a67a63e58b67b6cfffd02f59121ca1c8a1b22e1efe2573ae7e4b4f06c2b022002b9b431b58f6e36b3334fb14eaecee7d2f06967a77ef50d8d5f90dda1057f0c01210257dc6ce3b1100903306f518ee8fa113d778e403f118c080b50ce079fba40e09a00000000'))
+        coinbase = CTransaction([CTxIn(COutPoint(), CScript(b'\x01\x01'))], [CTxOut(50*COIN, CScript(b'\x51'))])
+        block = CBlock(vtx=(coinbase, tx))
+
+        expected = [(t.GetTxid(), i, txout.scriptPubKey, txout.nValue)
+                    for t in block.vtx for i, txout in enumerate(t.vout)]
+        self.assertEqual(list(iter_block_outputs(block.serialize())), expected)
+        self.assertEqual(list(iter_block_outputs(memoryview(block.serialize()))), expected)
+        self.assertNotEqual(tx.GetTxid(), tx.GetHash())
+
     def test_calc_merkle_root_of_empty_block(self):
         """CBlock.calc_merkle_root() fails if vtx empty"""
         block = CBlock()
@@ -38,3 +38,11 @@ class Test_CPubKey(unittest.TestCase):
 
         T('0478d430274f8c5ec1321338151e9f27f4c676a008bdf8638d07c0b6be9ab35c71a1518063243acd4dfe96b66e3f2ec8013c8e072cd09b3834a19f81f659cc3455',
           True, True, False)
+
+    def test_lazy_openssl_key(self):
+        key = CPubKey(x('0378d430274f8c5ec1321338151e9f27f4c676a008bdf8638d07c0b6be9ab35c71'))
+        self.assertIsNone(key._cec_key)
+        self.assertTrue(key.is_fullyvalid)
+        self.assertFalse(key.verify(b'\x00' * 32, b''))
+        self.assertIsNotNone(key._cec_key)
+
@@ -0,0 +1,61 @@
+# Copyright (C) The python-app.bitcoinlib developers
+#
+# This file is part of python-app.bitcoinlib.
+#
+# It is subject to the license terms in the LICENSE file found in the top-level
+# directory of this distribution.
+#
+# No part of python-app.bitcoinlib, including this file, may be copied, modified,
+# propagated, or distributed except according to the terms contained in the
+# LICENSE file.
+
+
+import unittest
+
+from app.bitcoinlib.core import secp256k1
+from app.bitcoinlib.core import x
+
+# pubkeys of the secret keys 1, 2 and 3
+G = '0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798'
+G_UNCOMPRESSED = '0479be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798' \
+                 '483ada7726a3c4655da4fbfc0e1108a8fd17b448a68554199c47d08ffb10d4b8'
+G2 = '02c6047f9441ed7d6d3045406e95c07cd85c778e4b8cef3ca7abac09b95c709ee5'
+G3 = '02f9308a019258c31049344f85f89d5229b531c845836f99b08601f113bce036f9'
+
+ORDER = 'fffffffffffffffffffffffffffffffebaaedce6af48a03bbfd25e8cd0364141'
+
+
+@unittest.skipUnless(secp256k1.is_available(), "libsecp256k1 not installed")
+class Test_secp256k1(unittest.TestCase):
+    def test_parse_serialize(self):
+        pubkey = secp256k1.pubkey_parse(x(G))
+        self.assertEqual(secp256k1.pubkey_serialize(pubkey), x(G))
+        self.assertEqual(secp256k1.pubkey_serialize(pubkey, compressed=False), x(G_UNCOMPRESSED))
+
+        pubkey = secp256k1.pubkey_parse(x(G_UNCOMPRESSED))
+        self.assertEqual(secp256k1.pubkey_serialize(pubkey), x(G))
+
+    def test_parse_invalid(self):
+        for invalid in ('', '00', '02', G[:-2], '05' + G[2:], '02' + 'ff' * 32):
+            with self.assertRaises(secp256k1.Secp256k1Error):
+                secp256k1.pubkey_parse(x(invalid))
+            self.assertFalse(secp256k1.is_fullyvalid(x(invalid)))
+        self.assertTrue(secp256k1.is_fullyvalid(x(G)))
+
+    def test_tweak_add(self):
+        one = (1).to_bytes(32, 'big')
+        two = (2).to_bytes(32, 'big')
+        self.assertEqual(secp256k1.pubkey_tweak_add(x(G), one), x(G2))
+        self.assertEqual(secp256k1.pubkey_tweak_add(x(G), two), x(G3))
+        self.assertEqual(secp256k1.pubkey_tweak_add(x(G2), one), x(G3))
+        self.assertEqual(secp256k1.pubkey_tweak_add(x(G), one, compressed=False)[1:33], x(G2)[1:])
+
+    def test_tweak_add_invalid(self):
+        with self.assertRaises(secp256k1.Secp256k1Error):
+            secp256k1.pubkey_tweak_add(x(G), x(ORDER))
+        # G + (n-1)G is the point at infinity
+        n_minus_1 = (int(ORDER, 16) - 1).to_bytes(32, 'big')
+        with self.assertRaises(secp256k1.Secp256k1Error):
+            secp256k1.pubkey_tweak_add(x(G), n_minus_1)
+        with self.assertRaises(secp256k1.Secp256k1Error):
+            secp256k1.pubkey_tweak_add(x(G), b'\x01')
@@ -109,6 +109,35 @@ class Test_Segwit(unittest.TestCase):
                 0, SIGHASH_SINGLE|SIGHASH_ANYONECANPAY, value, SIGVERSION_WITNESS_V0),
             x('511e8e52ed574121fc1b654970395502128263f62662e076dc6baf05c2e6a99b'))
 
+    def test_precomputed_signaturehash(self):
+        unsigned_tx = CTransaction.deserialize(x('010000000136641869ca081e70f394c6948e8af409e18b619df2ed74aa106c1ca29787b96e0100000000ffffffff0200e9a435000000001976a914389ffce9cd9ae88dcc0631e88a821ffdbe9bfe2688acc0832f05000000001976a9147480a33f950689af511e6e84c138dbbd3c3ee41588ac00000000'))
+        value        = int(9.87654321*COIN)
+        witnessscript= CScript(x('56210307b8ae49ac90a048e9b53357a2354b3334e9c8bee813ecb98e99a7e07e8c3ba32103b28f0c28bfab54554ae8c658ac5c3e0ce6e79ad336331f78c428dd43eea8449b21034b8113d703413d57761b8b9781957b8c0ac1dfe69f492580ca4195f50376ba4a21033400f6afecb833092a9a21cfdf1ed1376e58c5d1f47de74683123987e967a8f42103a6d48b1131e94ba04d9737d61acdaa1322008af9602b3b14862c07a1789aac162102d8b661b0b3302ee2f162b09e07a55ad5dfbe673a9f01d9f0c19617681024306b56ae'))
+
+        precomputed = PrecomputedTxData(unsigned_tx)
+        for hashtype, expected in ((SIGHASH_ALL, '185c0be5263dce5b4bb50a047973c1b6272bfbd0103a89444597dc40b248ee7c'),
+                                   (SIGHASH_NONE, 'e9733bc60ea13c95c6527066bb975a2ff29a925e80aa14c213f686cbae5d2f36'),
+                                   (SIGHASH_SINGLE, '1e1f1c303dc025bd664acb72e583e933fae4cff9148bf78c157d1e8f78530aea'),
+                                   (SIGHASH_ALL|SIGHASH_ANYONECANPAY, '2a67f03e63a6a422125878b40b82da593be8d4efaafe88ee528af6e5a9955c6e'),
+                                   (SIGHASH_SINGLE|SIGHASH_ANYONECANPAY, '511e8e52ed574121fc1b654970395502128263f62662e076dc6baf05c2e6a99b')):
+            self.assertEqual(SignatureHash(witnessscript, unsigned_tx, 0, hashtype, value,
+                                           SIGVERSION_WITNESS_V0, precomputed=precomputed),
+                             x(expected))
+
+    def test_precomputed_multiple_inputs(self):
+        unsigned_tx  = CTransaction.deserialize(x('0100000002fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f0000000000eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac11000000'))
+        script = CScript(x('76a9141d0f172a0ecb48aee1be1f2687d2963ae33f71a188ac'))
+
+        precomputed = PrecomputedTxData(unsigned_tx)
+        for i in range(len(unsigned_tx.vin)):
+            for hashtype in (SIGHASH_ALL, SIGHASH_NONE, SIGHASH_SINGLE, SIGHASH_ALL|SIGHASH_ANYONECANPAY):
+                self.assertEqual(SignatureHash(script, unsigned_tx, i, hashtype, COIN, SIGVERSION_WITNESS_V0,
+                                               precomputed=precomputed),
+                                 SignatureHash(script, unsigned_tx, i, hashtype, COIN, SIGVERSION_WITNESS_V0))
+        self.assertEqual(SignatureHash(script, unsigned_tx, 1, SIGHASH_ALL, int(6*COIN), SIGVERSION_WITNESS_V0,
+                                       precomputed=precomputed),
+                         x('c37af31116d1b27caf68aae9e3ac82f1477929014d5b917657d0eb49478cb670'))
+
     def test_checkblock(self):
         # (No witness) coinbase generated by Bitcoin Core
         str_coinbase = '01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff03520101ffffffff0100f2052a01000000232102960c90bc04a631cb17922e4f5d80ac75fd590a88b8baaa5a3d5086ac85e4d788ac00000000'
@@ -13,8 +13,11 @@
 import json
 import unittest
 import os
+from io import BytesIO
 
 from app.bitcoinlib.core import *
+from app.bitcoinlib.core.script import CScript
+from app.bitcoinlib.core.serialize import DeserializationExtraDataError, SerializationTruncationError
 from app.bitcoinlib.core.scripteval import VerifyScript, SCRIPT_VERIFY_P2SH
 
 from app.bitcoinlib.tests.test_scripteval import parse_script
@@ -171,3 +174,69 @@ class Test_CTransaction(unittest.TestCase):
         for tx, expected_wu in txs:
             tx = CTransaction.deserialize(x(tx))
             self.assertEqual(tx.calc_weight(), expected_wu)
+
+    def test_cached_hashes(self):
+        # one segwit input (P2WPKH), from test_calc_weight
+        tx = CTransaction.deserialize(x('020000000001018a763b78d3e17acea0625bf9e52b0dc1beb2241b2502185348ba8ff4a253176e0100000000ffffffff0280d725000000000017a914c07ed639bd46bf7087f2ae1dfde63b815a5f8b488767fda20300000000160014869ec8520fa2801c8a01bfdd2e82b19833cd0daf02473044022016243edad96b18c78b545325aaff80131689f681079fb107a67018cb7fb7830e02205520dae761d89728f73f1a7182157f6b5aecf653525855adb7ccb998c8e6143b012103b9489bde92afbcfa85129a82ffa512897105d1a27ad9806bded27e0532fc84e700000000'))
+        stripped = CTransaction(tx.vin, tx.vout, tx.nLockTime, tx.nVersion)
+        self.assertEqual(tx.GetTxid(), Hash(stripped.serialize()))
+        self.assertEqual(tx.GetHash(), Hash(tx.serialize()))
+        self.assertEqual(tx.GetWtxid(), tx.GetHash())
+        self.assertNotEqual(tx.GetTxid(), tx.GetHash())
+        self.assertEqual(tx.calc_weight(), 565)
+        self.assertEqual(tx.calc_vsize(), 142)
+        # computed once
+        self.assertEqual(tx._cached_GetTxid, tx.GetTxid())
+        self.assertEqual(tx._cached_weight, 565)
+
+        # without witness txid and wtxid are the same
+        self.assertEqual(stripped.GetTxid(), stripped.GetHash())
+
+    def test_mutable_hashes_not_cached(self):
+        tx = CMutableTransaction([CMutableTxIn()], [CMutableTxOut(1, CScript())])
+        txid, weight = tx.GetTxid(), tx.calc_weight()
+        self.assertEqual(txid, CTransaction.from_tx(tx).GetTxid())
+        self.assertEqual(tx.GetWtxid(), txid)
+
+        tx.vout[0].nValue = 2
+        tx.vin[0].scriptSig = CScript([b'\x01' * 10])
+        self.assertNotEqual(tx.GetTxid(), txid)
+        self.assertEqual(tx.GetTxid(), CTransaction.from_tx(tx).GetTxid())
+        self.assertEqual(tx.calc_weight(), weight + 4 * 11)
+
+    def test_deserialize_matches_stream(self):
+        vectors = []
+        for name in ('tx_valid.json', 'tx_invalid.json'):
+            with open(os.path.dirname(__file__) + '/data/' + name, 'r') as fd:
+                vectors.extend(x(test_case[1]) for test_case in json.load(fd) if len(test_case) == 3)
+        # segwit, from test_calc_weight
+        vectors.append(x('020000000001018a763b78d3e17acea0625bf9e52b0dc1beb2241b2502185348ba8ff4a253176e0100000000ffffffff0280d725000000000017a914c07ed639bd46bf7087f2ae1dfde63b815a5f8b488767fda20300000000160014869ec8520fa2801c8a01bfdd2e82b19833cd0daf02473044022016243edad96b18c78b545325aaff80131689f681079fb107a67018cb7fb7830e02205520dae761d89728f73f1a7182157f6b5aecf653525855adb7ccb998c8e6143b012103b9489bde92afbcfa85129a82ffa512897105d1a27ad9806bded27e0532fc84e700000000'))
+
+        for raw in vectors:
+            tx = CTransaction.deserialize(raw)
+            expected = CTransaction.stream_deserialize(BytesIO(raw))
+            self.assertEqual(repr(tx), repr(expected))
+            self.assertEqual(tx.serialize(), raw)
+            for txin in tx.vin:
+                self.assertIs(type(txin.scriptSig), CScript)
+            for txout in tx.vout:
+                self.assertIs(type(txout.scriptPubKey), CScript)
+            # cached from the input bytes
+            self.assertEqual((tx.GetTxid(), tx.GetHash(), tx._cached_weight), expected._calc_hashes())
+
+    def test_deserialize_memoryview(self):
+        raw = x('0100000001c336895d9fa674f8b1e294fd006b1ac8266939161600e04788c515089991b50a030000006a47304402204213769e823984b31dcb7104f2c99279e74249eacd4246dabcf2575f85b365aa02200c3ee89c84344ae326b637101a92448664a8d39a009c8ad5d147c752cbe112970121028b1b44b4903c9103c07d5a23e3c7cf7aeb0ba45ddbd2cfdce469ab197381f195fdffffff040000000000000000536a4c5058325bb7b7251cf9e36cac35d691bd37431eeea426d42cbdecca4db20794f9a4030e6cb5211fabf887642bcad98c9994430facb712da8ae5e12c9ae5ff314127d33665000bb26c0067000bb0bf00322a50c300000000000017a9145ca04fdc0a6d2f4e3f67cfeb97e438bb6287725f8750c30000000000001976a91423086a767de0143523e818d4273ddfe6d9e4bbcc88acc8465003000000001976a914c95cbacc416f757c65c942f9b6b8a20038b9b12988ac00000000')
+        tx = CTransaction.deserialize(raw)
+        self.assertEqual(CTransaction.deserialize(memoryview(raw)).serialize(), raw)
+        self.assertEqual(CTransaction.deserialize(bytearray(raw)).serialize(), raw)
+        self.assertIsInstance(CMutableTransaction.deserialize(raw), CMutableTransaction)
+
+        for n in (0, 5, 40, len(raw) - 100, len(raw) - 1):
+            with self.assertRaises(SerializationTruncationError):
+                CTransaction.deserialize(raw[:n])
+
+        with self.assertRaises(DeserializationExtraDataError) as cm:
+            CTransaction.deserialize(raw + b'\x00\x01')
+        self.assertEqual(cm.exception.padding, b'\x00\x01')
+        self.assertEqual(cm.exception.obj.GetTxid(), tx.GetTxid())
+        self.assertEqual(CTransaction.deserialize(raw + b'\x00', allow_padding=True).GetTxid(), tx.GetTxid())
@@ -0,0 +1,95 @@
+"""
+Pre-derived deposit address pool
+
+Keeps ADDRESS_POOL_SIZE unused addresses per active user, one that
+already has deposit addresses, so handing out a deposit address is a
+single indexed read. Users are refilled after a deposit marks an address
+used and by a periodic scan, new users on their first request.
+"""
+
+import asyncio
+import os
+from typing import Callable
+from ..connections import logger, psql_pool
+from .crud import BTCCrud
+
+
+ADDRESS_POOL_SIZE = int(os.getenv("ADDRESS_POOL_SIZE", 5))
+ADDRESS_POOL_BATCH = int(os.getenv("ADDRESS_POOL_BATCH", 100))
+ADDRESS_POOL_SCAN_S = int(os.getenv("ADDRESS_POOL_SCAN_S", 300))
+
+
+class AddressPoolManager:
+    def __init__(self, psql: BTCCrud,
+                 size: int = ADDRESS_POOL_SIZE,
+                 batch_size: int = ADDRESS_POOL_BATCH,
+                 scan_interval: int = ADDRESS_POOL_SCAN_S):
+        self.psql = psql
+        self.size = size
+        self.batch_size = batch_size
+        self.scan_interval = scan_interval
+        self.pending: set[str] = set()
+        self.wakeup = asyncio.Event()
+        # called with the script_pubkeys of every batch of new addresses
+        self.on_created: list[Callable[[list[str]], None]] = []
+        # metrics
+        self.refills = 0
+        self.created = 0
+        self.misses = 0
+
+    def notify(self, userid: str):
+        """Schedule a refill, called when an address of the user got used"""
+        self.pending.add(userid)
+        self.wakeup.set()
+
+    async def refill(self, userids: list[str]) -> int:
+        script_pubkeys = await self.psql.fill_address_pool(userids, self.size)
+        self.refills += 1
+        self.created += len(script_pubkeys)
+        for callback in self.on_created:
+            callback(script_pubkeys)
+        return len(script_pubkeys)
+
+    async def get_unused_address(self, userid: str) -> str | None:
+        script_pubkey = await self.psql.get_unused_address(userid)
+        if script_pubkey is None:
+            # pool not filled yet, e.g. right after signup
+            self.misses += 1
+            if not await self.psql.get_user_exists(userid):
+                return None
+            await self.refill([userid])
+            script_pubkey = await self.psql.get_unused_address(userid)
+        return script_pubkey
+
+    async def run(self):
+        await self.scan()
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.scan_interval)
+            except asyncio.TimeoutError:
+                await self.scan()
+                continue
+            self.wakeup.clear()
+            userids, self.pending = list(self.pending), set()
+            for i in range(0, len(userids), self.batch_size):
+                await self.refill(userids[i:i+self.batch_size])
+            logger.debug({"event": "Address pool refilled", "stats": self.stats()})
+
+    async def scan(self):
+        """Refill every active user below the pool size, until a round inserts nothing"""
+        while True:
+            userids = await self.psql.get_users_below_pool(self.size, self.batch_size)
+            if not userids or not await self.refill(userids):
+                return
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "pending": len(self.pending),
+            "refills": self.refills,
+            "created": self.created,
+            "misses": self.misses,
+        }
+
+
+address_pool = AddressPoolManager(BTCCrud(psql_pool))
@@ -85,3 +85,4 @@ class WithdrawalModel(BaseModel):
     txid: str = ""
     hash: str = ""
     signed_txhash: str = ""
+    tx_hex: str = ""
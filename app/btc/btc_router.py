@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from redis import Redis
+from redis.asyncio import Redis
 from typing import Annotated
 from datetime import datetime
 import os
@@ -11,6 +11,7 @@ from ..bitcoinlib.core import b2x, lx, x, CScript
 from .crud import BTCCrud
 from .base import DepositNewUtxo, AddressResponse, WithdrawBtcResponse
 from .tasks import scan_address
+from .address_pool import address_pool
 
 
 psql = BTCCrud(psql_pool)
@@ -48,7 +49,10 @@ async def deposit_btc_scan(
         return []
     new_utxos = await psql.utxo_verify_new(b2x(pubkey_bytes), scanned_utxos)
     total_amount = sum([n.amount for n in new_utxos])
-    redis_conn.hincrby(f"{token_data.userid}::session", "balances", total_amount)
+    if new_utxos:
+        # address is used now, top up the pool
+        address_pool.notify(token_data.userid)
+    await redis_conn.hincrby(f"{token_data.userid}::session", "balances", total_amount)
     return new_utxos
 
 
@@ -61,10 +65,9 @@ async def create_new_address(
 ) -> AddressResponse:
     if token_data is None:
         raise HTTPException(401, "Invalid token")
-    user_exists = await psql.get_user_exists(token_data.userid)
-    if not user_exists:
+    pubkey = await address_pool.get_unused_address(token_data.userid)
+    if pubkey is None:
         raise HTTPException(401, "User not found")
-    pubkey = await psql.get_unused_address(token_data.userid)
     addr = CBitcoinAddress.from_scriptPubKey(CScript(x(pubkey)))
     return AddressResponse(address=str(addr))
 
@@ -91,7 +94,7 @@ async def btc_withdraw_request(
         raise HTTPException(status_code=400, detail="Invalid bitcoin address")
     destination_pubkey = b2x(addr.to_scriptPubKey())
     # verify balance
-    available = redis_conn.hget(f"{token_data.userid}::session", "balances")
+    available = await redis_conn.hget(f"{token_data.userid}::session", "balances")
     if available is None:
         raise HTTPException(status_code=400, detail="Invalid token")
     available = int(available)
@@ -116,7 +119,7 @@ async def btc_withdraw_request(
     if SKIP_VERIFICATION:
         await psql.update_withdraw_status(status="VERIFIED", k1=random_k1_value)
         await psql.withdraw_redeem_request(req)
-        redis_conn.hincrby(f"{token_data.userid}::session", "balances", -requested_amount)
+        await redis_conn.hincrby(f"{token_data.userid}::session", "balances", -requested_amount)
     else:
         # send code to email
         # not implemented 
@@ -135,13 +138,13 @@ async def btc_withdraw(
     """
     if token_data is None:
         raise HTTPException(status_code=400, detail="Invalid token")
-    userid = redis_conn.get(k1)
+    userid = await redis_conn.get(k1)
     if userid is None:
         raise HTTPException(status_code=400, detail="Request expired")
     request = await psql.get_withdraw_request(k1)
     if request is None:
         raise HTTPException(status_code=400, detail="Invalid request token")
-    available = redis_conn.hget(f"{token_data.userid}::session", "balances")
+    available = await redis_conn.hget(f"{token_data.userid}::session", "balances")
     if available is None:
         raise HTTPException(status_code=400, detail="Invalid token")
     available = int(available)
@@ -152,5 +155,5 @@ async def btc_withdraw(
     if request is None:
         logger.error({"error": "Attempt to redeem invalid requests", "k1": k1})
         raise HTTPException(400, "Invalid request")
-    redis_conn.hincrby(f"{token_data.userid}::session", "balances", -request.amount)        
+    await redis_conn.hincrby(f"{token_data.userid}::session", "balances", -request.amount)        
     return WithdrawBtcResponse(k1=request.k1)
@@ -1,13 +1,18 @@
 from ..user.base import WithdrawRequest
-from ..user.auth import derive_new_address
+from ..user.auth import address_derivation
 from ..user.crud import PSQLClient
-from .base import WalletAddressInDb, UtxosInDb, WithdrawalModel
+from .base import WalletAddressInDb, UtxosInDb, WithdrawalModel, UserWithdrawal, WDIn, WDOut
 from datetime import datetime
+import asyncio
 import psycopg_pool
 import psycopg
 from psycopg.rows import dict_row
 
 
+# pg_advisory_xact_lock namespace of per-user address pool fills
+ADDRESS_POOL_LOCK_ID = 72102
+
+
 class BTCCrud(PSQLClient):
 
     def __init__(self, pool: psycopg_pool.AsyncConnectionPool):
@@ -28,14 +33,6 @@ class BTCCrud(PSQLClient):
         """
         return await self.execute(q, *address.model_dump(exclude=['used']).values())
 
-    async def create_next_address(self, userid: str, change = 0) -> str:
-        next_idx = await self.get_next_addressindex(userid, change)
-        user_index = next_idx['user_index']
-        address_index = next_idx['next_index']
-        address = derive_new_address(userid, user_index, change, address_index)
-        await self.create_wallet_address(address)
-        return address.script_pubkey
-
     async def get_user_exists(self, userid: str) -> int:
         q = """
         SELECT COUNT(userid) exists
@@ -45,61 +42,161 @@ class BTCCrud(PSQLClient):
         exists = await self.fetchone(q, userid)
         return exists.get("exists", 0)
 
-    async def get_unused_address(self, userid: str) -> str:
+    async def get_unused_address(self, userid: str, change: int = 0) -> str | None:
         """Get unused script public key"""
         q = """
         SELECT script_pubkey
         FROM wallet_addresses
         WHERE userid = %s
+        AND change = %s
         AND used = 0
+        ORDER BY address_index
+        LIMIT 1
         """
-        addr =  await self.fetchone(q, userid)
+        addr = await self.fetchone(q, userid, change)
         if addr is None:
-            return await self.create_next_address(userid)
+            return None
         return addr['script_pubkey']
 
-    async def get_unused_address_username(self, username: str) -> str:
+    async def get_unused_address_username(self, username: str) -> str | None:
         """Get unused script public key"""
         q = """
+        SELECT wa.script_pubkey
+        FROM users AS u
+        JOIN wallet_addresses AS wa
+        ON wa.userid = u.userid
+        AND wa.change = 0
+        AND wa.used = 0
+        WHERE u.username = %s
+        ORDER BY wa.address_index
+        LIMIT 1
+        """
+        addr = await self.fetchone(q, username)
+        if addr is None:
+            return None
+        return addr['script_pubkey']
+
+    async def get_users_below_pool(self, size: int, limit: int, change: int = 0) -> list[str]:
+        """
+        Users with addresses on the branch but fewer than size unused.
+        Users that never asked for an address are filled on first request.
+        """
+        q = """
         SELECT userid
-        FROM users
-        WHERE username = %s
+        FROM wallet_addresses
+        WHERE change = %s
+        GROUP BY userid
+        HAVING COUNT(*) FILTER (WHERE used = 0) < %s
+        LIMIT %s
+        """
+        rows = await self.fetchmany(q, change, size, limit)
+        return [r["userid"] for r in rows]
+
+    async def fill_address_pool(self, userids: list[str], size: int, change: int = 0) -> list[str]:
+        """
+        Top up unused addresses of each user to size with one multi-row
+        insert. Users are locked for the transaction so concurrent fills
+        can not allocate two user indexes or the same address index.
+        Returns the script_pubkeys of the addresses actually inserted.
+        """
+        q = """
+        SELECT pg_advisory_xact_lock(%s, hashtext(u.userid))
+        FROM unnest(%s::text[]) AS u(userid)
+        ORDER BY u.userid
         """
         q2 = """
+        SELECT u.userid, MAX(wa.user_index) user_index,
+        COALESCE(MAX(wa.address_index) FILTER (WHERE wa.change = %s) + 1, 0) next_index,
+        COUNT(wa.public_key) FILTER (WHERE wa.change = %s AND wa.used = 0) unused
+        FROM unnest(%s::text[]) AS u(userid)
+        LEFT JOIN wallet_addresses AS wa
+        ON wa.userid = u.userid
+        GROUP BY u.userid
+        """
+        q3 = """
+        SELECT nextval('wallet_user_index_seq') user_index
+        FROM generate_series(1, %s)
+        """
+        q4 = """
+        INSERT INTO wallet_addresses
+        (
+            public_key, chain_code, user_index, userid, change,
+            address_index, path, witness_script, script_pubkey, p2wsh
+        )
+        SELECT * FROM unnest(
+            %s::text[], %s::text[], %s::bigint[], %s::text[], %s::bigint[],
+            %s::bigint[], %s::text[], %s::text[], %s::text[], %s::text[]
+        )
+        ON CONFLICT DO NOTHING
+        RETURNING script_pubkey
+        """
+        userids = sorted(set(userids))
+        if not userids:
+            return []
+        async with self.pipeline_transaction() as cur:
+            await cur.execute(q, (ADDRESS_POOL_LOCK_ID, userids))
+            await cur.execute(q2, (change, change, userids))
+            state = [s for s in await cur.fetchall() if s["unused"] < size]
+            new_users = [s for s in state if s["user_index"] is None]
+            if new_users:
+                await cur.execute(q3, (len(new_users), ))
+                for s, row in zip(new_users, await cur.fetchall()):
+                    s["user_index"] = row["user_index"]
+            jobs = [(s["user_index"], change, s["next_index"], size - s["unused"], s["userid"]) for s in state]
+            if not jobs:
+                return []
+            # derivation is CPU bound, keep it off the event loop
+            addresses = await asyncio.to_thread(
+                lambda: [a for job in jobs for a in address_derivation.derive_range(*job)])
+            columns = list(zip(*(a.model_dump(exclude=['used']).values() for a in addresses)))
+            await cur.execute(q4, [list(c) for c in columns])
+            # rows skipped by ON CONFLICT are not new addresses
+            inserted = await cur.fetchall()
+        return [r["script_pubkey"] for r in inserted]
+
+    async def get_script_pubkeys(self) -> list[str]:
+        """Deposit addresses, change outputs are credited by the withdraw tracker"""
+        q = """
         SELECT script_pubkey
         FROM wallet_addresses
-        WHERE userid = %s
-        AND used = 0
-        """        
-        userid =  await self.fetchone(q, username)
-        addr =  await self.fetchone(q2, userid.get("userid", 0))
-        if addr is None:
-            return await self.create_next_address(username)
-        return addr['script_pubkey']
+        WHERE change = 0
+        """
+        rows = await self.fetchmany(q)
+        return [r["script_pubkey"] for r in rows]
 
-    async def get_max_userindex(self) -> int:
+    async def get_wallet_address_count(self) -> int:
         q = """
-        SELECT MAX(user_index) ci
+        SELECT COUNT(*) count
         FROM wallet_addresses
+        WHERE change = 0
         """
-        result = await self.fetchone(q)
-        if result['ci'] is None:
-            return 1000
-        return result['ci']
+        count = await self.fetchone(q)
+        return count.get("count", 0)
 
-    async def get_next_addressindex(self, userid: str, change: int):
+    async def get_block_checkpoint(self, stream: str) -> int:
+        """Last block height scanned by stream, 0 if none"""
         q = """
-        SELECT MAX(address_index) + 1 next_index, user_index
-        FROM wallet_addresses
-        WHERE userid = %s
-        AND change = %s
-        GROUP BY user_index
+        SELECT add_index
+        FROM stream_checkpoints
+        WHERE stream = %s
+        """
+        checkpoint = await self.fetchone(q, stream)
+        if checkpoint is None:
+            return 0
+        return checkpoint["add_index"]
+
+    async def update_block_checkpoint(self, stream: str, height: int) -> None:
+        """Advance block checkpoint, stored in add_index of stream_checkpoints"""
+        q = """
+        INSERT INTO stream_checkpoints
+        (stream, add_index, settle_index, ts_updated)
+        VALUES (%s, %s, 0, %s)
+        ON CONFLICT (stream) DO UPDATE
+        SET add_index = GREATEST(stream_checkpoints.add_index, EXCLUDED.add_index),
+        ts_updated = EXCLUDED.ts_updated
         """
-        idx = await self.fetchone(q, userid, change)
-        if idx is None:
-            max_idx = await self.get_max_userindex()
-            return {'next_index': 0, 'user_index': max_idx+1}
-        return idx
+        current_time = int(datetime.utcnow().timestamp())
+        return await self.execute(q, stream, height, current_time)
 
     async def get_address_exists(self, public_key: str, userid: str) -> int:
         q = """
@@ -127,7 +224,7 @@ class BTCCrud(PSQLClient):
                                   request.status, request.amount,
                                   request.destination, request.ts_created)
 
-    async def get_queued_requests(self) -> list[WithdrawRequest]:
+    async def get_queued_requests(self, limit: int = 20) -> list[WithdrawRequest]:
         q = """
         SELECT wr.*, fr.rate
         FROM withdraw_requests AS wr
@@ -138,9 +235,45 @@ class BTCCrud(PSQLClient):
         AND fr.network = 'BTC'
         AND redeemed = TRUE
         ORDER BY wr.ts_created ASC
-        LIMIT 20
+        LIMIT %s
         """
-        return await self.fetchmany(q)
+        return await self.fetchmany(q, limit)
+
+    async def reject_queued_requests(self, k1s: list[str], reason: str) -> list[dict]:
+        """
+        Reject QUEUED requests and refund their locked balance in one
+        statement. Returns userid and total amount refunded per user.
+        """
+        q = """
+        WITH rejected AS (
+            UPDATE withdraw_requests
+            SET status = 'REJECTED',
+            reason = %s
+            WHERE k1 = ANY(%s)
+            AND status = 'QUEUED'
+            RETURNING k1
+        ), unlocked AS (
+            DELETE FROM locked_balances AS lb
+            USING rejected
+            WHERE lb.k1 = rejected.k1
+            RETURNING lb.userid, lb.amount
+        ), refunds AS (
+            SELECT userid, SUM(amount)::bigint AS amount
+            FROM unlocked
+            GROUP BY userid
+        ), refund AS (
+            UPDATE balances AS b
+            SET amount = b.amount + refunds.amount
+            FROM refunds
+            WHERE b.userid = refunds.userid
+            AND b.market = 'usd'
+        )
+        SELECT userid, amount
+        FROM refunds
+        """
+        if not k1s:
+            return []
+        return await self.fetchmany(q, reason, k1s)
 
     async def get_withdraw_request(self, k1: str) -> WithdrawRequest | None:
         q = """
@@ -253,9 +386,11 @@ class BTCCrud(PSQLClient):
         return unseen
 
 
-    async def create_deposit_utxo(self, utxo: UtxosInDb) -> None:
+    async def create_deposit_utxo(self, utxo: UtxosInDb) -> str | None:
         """
         utxos added when received from provider / node
+        Returns the userid credited, raises IntegrityError if the utxo
+        is already known.
         """
         q = """
         INSERT INTO utxos
@@ -265,6 +400,7 @@ class BTCCrud(PSQLClient):
         SELECT wa.userid, %s, %s, %s, %s, %s, %s
         FROM wallet_addresses AS wa
         WHERE wa.script_pubkey = %s
+        RETURNING userid
         """
         q2 = """
         UPDATE balances AS b
@@ -286,20 +422,37 @@ class BTCCrud(PSQLClient):
         WHERE script_pubkey = %s
         """
         current_time = int(datetime.utcnow().timestamp())
-        async with self.pool.connection() as conn:
-            async with conn.cursor(row_factory=dict_row) as cur:
-                async with conn.transaction():
-                    await cur.execute(q, list(utxo.model_dump().values()) + [utxo.public_key])
-                    await cur.execute(q2, (utxo.amount, utxo.public_key, ))
-                    await cur.execute(q3, (utxo.public_key, ))
-                    await cur.execute(q4, (utxo.txid_hex, utxo.vout, utxo.amount, current_time, utxo.public_key, ))
-                return
+        async with self.pipeline_transaction() as cur:
+            await cur.execute(q2, (utxo.amount, utxo.public_key, ))
+            await cur.execute(q3, (utxo.public_key, ))
+            await cur.execute(q4, (utxo.txid_hex, utxo.vout, utxo.amount, current_time, utxo.public_key, ))
+            # last, so its RETURNING row is the one fetched
+            await cur.execute(q, list(utxo.model_dump().values()) + [utxo.public_key])
+            row = await cur.fetchone()
+        return row["userid"] if row else None
+
+    async def get_spendable_utxos(self, limit: int) -> list[dict]:
+        """Unlocked utxos with their witness script, largest first"""
+        q = """
+        SELECT u.userid, u.txid_hex, u.vout, u.amount, u.public_key, wa.witness_script
+        FROM utxos AS u
+        JOIN wallet_addresses AS wa
+        ON wa.script_pubkey = u.public_key
+        WHERE u.locked = 0
+        ORDER BY u.amount DESC
+        LIMIT %s
+        """
+        return await self.fetchmany(q, limit)
 
     async def finalize_payment(self, WD: WithdrawalModel):
+        """
+        Persist a built withdrawal transaction. Raises IntegrityError if
+        one of its inputs or requests already is in another payment.
+        """
         q = """
         INSERT INTO btc_payments
-        (txid_hex, amount, fee, fee_covered, confirmations)
-        VALUES (%s, %s, %s, %s, %s)
+        (txid_hex, amount, fee, fee_covered, confirmations, tx_hex)
+        VALUES (%s, %s, %s, %s, %s, %s)
         """
         q2 = """
         INSERT INTO change_outs
@@ -318,27 +471,112 @@ class BTCCrud(PSQLClient):
         """
         q5 = """
         UPDATE withdraw_requests
-        SET status = 'IN-FLIGHT'
+        SET status = 'IN_FLIGHT'
         WHERE k1 = %s
         """
-        current_time = int(datetime.utcnow().timestamp())
-        async with self.pool.connection() as conn:
-            async with conn.cursor(row_factory=dict_row) as cur:
-                async with conn.transaction():
-                    await cur.execute(q, (WD.txid, WD.vin_amount, WD.fee, 0, 0))
+        q6 = """
+        UPDATE utxos
+        SET locked = 1
+        WHERE txid_hex = %s
+        AND vout = %s
+        """
+        q7 = """
+        UPDATE wallet_addresses
+        SET used = used + 1
+        WHERE script_pubkey = %s
+        """
+        change_outs = [(WD.txid, i, out.amount, out.userid, out.public_key)
+                       for i, out in enumerate(WD.vout) if out.change]
+        wd_outs = [(out.k1, WD.txid, i, out.amount, out.public_key)
+                   for i, out in enumerate(WD.vout) if not out.change]
+        wd_ins = [(WD.txid, vin.txid, vin.vout, vin.amount, vin.public_key) for vin in WD.vin]
+        requests = [(req.k1, ) for req in WD.user_requests.values()]
+        locked = [(vin.txid, vin.vout) for vin in WD.vin]
+        # change address is not handed out again while in flight
+        change_addresses = [(out.public_key, ) for out in WD.vout if out.change]
+        async with self.pipeline_transaction() as cur:
+            await cur.execute(q, (WD.txid, WD.vin_amount, WD.fee, WD.fee_covered, 0, WD.tx_hex))
+            for query, rows in ((q2, change_outs), (q3, wd_outs), (q4, wd_ins), (q5, requests),
+                                (q6, locked), (q7, change_addresses)):
+                if rows:
+                    await cur.executemany(query, rows)
 
-                    for i, out in enumerate(WD.vout):
-                        if out.change:
-                            await cur.execute(q2, (WD.txid, i, out.amount, out.userid, out.public_key))
-                            continue
-                        await cur.execute(q3, (out.k1, WD.txid, i, out.amount, out.public_key))
+    async def get_unconfirmed_outputs(self, confirmations: int) -> list[dict]:
+        """Outputs of every payment with fewer than confirmations"""
+        q = """
+        SELECT bp.txid_hex, o.vout
+        FROM btc_payments AS bp
+        JOIN (
+            SELECT txid_hex, vout FROM wd_outs
+            UNION ALL
+            SELECT txid_hex, vout FROM change_outs
+        ) AS o
+        ON o.txid_hex = bp.txid_hex
+        WHERE bp.confirmations < %s
+        """
+        return await self.fetchmany(q, confirmations)
 
-                    for vin in WD.vin:
-                        await cur.execute(q4, (WD.txid, vin.txid, vin.vout, vin.amount, vin.public_key))
-                        # await cur.execute(q7, (vin.txid, vin.vout, ))
+    async def update_payment_confirmations(self, confirmations: list[tuple[int, str]]) -> None:
+        """Record (confirmations, txid_hex) of payments still below target"""
+        q = """
+        UPDATE btc_payments
+        SET confirmations = %s
+        WHERE txid_hex = %s
+        """
+        return await self.execute_many(q, *confirmations)
 
-                    for req in WD.user_requests.values():
-                        await cur.execute(q5, (req.k1, ))
+    async def get_payment_withdrawal(self, txid_hex: str) -> WithdrawalModel | None:
+        """Rebuild the WithdrawalModel persisted by finalize_payment"""
+        q = """
+        SELECT *
+        FROM btc_payments
+        WHERE txid_hex = %s
+        """
+        q2 = """
+        SELECT wo.k1, wo.vout, wo.amount, wo.public_key, wr.userid, wr.amount AS request_amount
+        FROM wd_outs AS wo
+        JOIN withdraw_requests AS wr
+        ON wr.k1 = wo.k1
+        WHERE wo.txid_hex = %s
+        """
+        q3 = """
+        SELECT vout, amount, userid, public_key
+        FROM change_outs
+        WHERE txid_hex = %s
+        """
+        q4 = """
+        SELECT txid_hex_prev, vout, amount, public_key
+        FROM wd_ins
+        WHERE txid_hex = %s
+        """
+        payment = await self.fetchone(q, txid_hex)
+        if payment is None:
+            return None
+        wd_outs = await self.fetchmany(q2, txid_hex)
+        change_outs = await self.fetchmany(q3, txid_hex)
+        wd_ins = await self.fetchmany(q4, txid_hex)
+        outs = {}
+        user_requests = {}
+        for o in wd_outs:
+            outs[o["vout"]] = WDOut(amount=o["amount"], public_key=o["public_key"],
+                                    userid=o["userid"], change=False, k1=o["k1"])
+            user_requests[o["userid"]] = UserWithdrawal(
+                k1=o["k1"], userid=o["userid"], public_key=o["public_key"],
+                request_amount=o["request_amount"], remaining_amount=0)
+        for o in change_outs:
+            outs[o["vout"]] = WDOut(amount=o["amount"], public_key=o["public_key"],
+                                    userid=o["userid"], change=True)
+        vin = [WDIn(txid=i["txid_hex_prev"], vout=i["vout"], amount=i["amount"],
+                    public_key=i["public_key"]) for i in wd_ins]
+        vout = [outs[i] for i in sorted(outs)]
+        return WithdrawalModel(
+            txid=txid_hex,
+            vin=vin,
+            vout=vout,
+            user_requests=user_requests,
+            vin_amount=payment["amount"],
+            vout_amount=sum(o.amount for o in vout),
+            fee=payment["fee"])
 
     async def create_withdraw_transaction(self, n: int, WD: WithdrawalModel):
         q = """
@@ -376,21 +614,23 @@ class BTCCrud(PSQLClient):
         AND vout = %s
         """                
         current_time = int(datetime.utcnow().timestamp())
-        async with self.pool.connection() as conn:
-            async with conn.cursor(row_factory=dict_row) as cur:
-                async with conn.transaction():
-                    await cur.execute(q, (n, WD.txid, ))
-                    for i, out in enumerate(WD.vout):
-                        if out.change: 
-                            await cur.execute(q5, (out.userid, out.public_key, WD.txid, i, out.amount, 0, current_time))
-                            await cur.execute(q7, (out.public_key, ))
-                            continue
-                        fee = WD.user_requests[out.userid].request_amount - out.amount
-                        await cur.execute(q1, (out.userid, WD.txid, i, out.amount, fee, current_time, ))                        
-                        await cur.execute(q2, (out.k1, ))
-                        await cur.execute(q3, (out.k1, ))
-                    for i, vin in enumerate(WD.vin):
-                        await cur.execute(q6, (vin.txid, vin.vout, ))
+        change_utxos, used_addresses = [], []
+        withdrawals, paid_requests = [], []
+        for i, out in enumerate(WD.vout):
+            if out.change:
+                change_utxos.append((out.userid, out.public_key, WD.txid, i, out.amount, 0, current_time))
+                used_addresses.append((out.public_key, ))
+                continue
+            fee = WD.user_requests[out.userid].request_amount - out.amount
+            withdrawals.append((out.userid, WD.txid, i, out.amount, fee, current_time))
+            paid_requests.append((out.k1, ))
+        spent = [(vin.txid, vin.vout) for vin in WD.vin]
+        async with self.pipeline_transaction() as cur:
+            await cur.execute(q, (n, WD.txid, ))
+            for query, rows in ((q5, change_utxos), (q7, used_addresses), (q1, withdrawals),
+                                (q2, paid_requests), (q3, paid_requests), (q6, spent)):
+                if rows:
+                    await cur.executemany(query, rows)
 
     async def unlock_utxos(self, utxos: [tuple[str, int]]):
         q = """
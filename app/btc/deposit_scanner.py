@@ -0,0 +1,164 @@
+"""
+Block-driven deposit scanner
+
+Follows the best chain of bitcoind and matches every output of each new
+block against the script_pubkeys of all wallet addresses, held in an
+in-memory set. Matches are credited through create_deposit_utxo, so
+detecting deposits costs a set lookup per block output instead of a
+scantxoutset per user request.
+
+Blocks are scanned once they have BTC_DEPOSIT_CONFIRMATIONS confirmations
+and the last scanned height is checkpointed, reorgs deeper than that are
+not handled.
+
+Without a checkpoint the scan starts at BTC_SCAN_START_HEIGHT. It must be
+set to a height below the first deposit when the wallet already has
+addresses, for instance the height the service went live: blocks before
+it are never scanned. Only an empty wallet may start at the current tip.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from psycopg import IntegrityError
+from ..bitcoinlib.core import b2x, iter_block_outputs
+from ..connections import logger, psql_pool
+from ..ln.settlement import apply_committed_credits
+from .address_pool import address_pool
+from .base import UtxosInDb
+from .crud import BTCCrud
+from .node import btc_node
+
+
+BTC_DEPOSIT_CONFIRMATIONS = int(os.getenv("BTC_DEPOSIT_CONFIRMATIONS", 3))
+BTC_SCAN_POLL_S = int(os.getenv("BTC_SCAN_POLL_S", 30))
+# first height scanned without a checkpoint, 0 starts at the current tip
+# and is only accepted while the wallet has no addresses
+BTC_SCAN_START_HEIGHT = int(os.getenv("BTC_SCAN_START_HEIGHT", 0))
+
+# stream_checkpoints row holding the last scanned height
+BLOCK_STREAM = "btc_blocks"
+
+
+class DepositScanner:
+    def __init__(self, psql: BTCCrud,
+                 confirmations: int = BTC_DEPOSIT_CONFIRMATIONS,
+                 poll_interval: int = BTC_SCAN_POLL_S,
+                 start_height: int = BTC_SCAN_START_HEIGHT):
+        self.psql = psql
+        self.confirmations = max(confirmations, 1)
+        self.poll_interval = poll_interval
+        self.start_height = start_height
+        self.scripts: set[bytes] = set()
+        self.height: int | None = None
+        # metrics
+        self.blocks = 0
+        self.outputs = 0
+        self.deposits = 0
+        self.reloads = 0
+        self.last_block_ms = 0.0
+
+    def watch(self, script_pubkeys: list[str]):
+        """Add new wallet addresses to the watch set"""
+        self.scripts.update(bytes.fromhex(s) for s in script_pubkeys)
+
+    async def load(self):
+        script_pubkeys = await self.psql.get_script_pubkeys()
+        self.scripts = {bytes.fromhex(s) for s in script_pubkeys}
+        self.reloads += 1
+        logger.debug({"event": "Deposit watch set loaded", "size": len(self.scripts)})
+
+    async def sync_watch_set(self):
+        # picks up addresses created by other app instances
+        if await self.psql.get_wallet_address_count() != len(self.scripts):
+            await self.load()
+
+    async def run(self):
+        await self.load()
+        best_hash = None
+        while True:
+            tip_hash = await btc_node.getbestblockhash()
+            if tip_hash != best_hash:
+                header = await btc_node.getblockheader(tip_hash, True)
+                await self.scan_to(header["height"] - self.confirmations + 1)
+                best_hash = tip_hash
+            await asyncio.sleep(self.poll_interval)
+
+    async def scan_to(self, target: int):
+        """Scan every block after the checkpoint up to height target"""
+        if self.height is None:
+            self.height = await self.psql.get_block_checkpoint(BLOCK_STREAM)
+            if not self.height:
+                self.height = await self.first_height(target) - 1
+        while self.height < target:
+            await self.sync_watch_set()
+            await self.scan_block(self.height + 1)
+            self.height += 1
+            await self.psql.update_block_checkpoint(BLOCK_STREAM, self.height)
+
+    async def first_height(self, target: int) -> int:
+        if self.start_height:
+            return self.start_height
+        if await self.psql.get_wallet_address_count():
+            # starting at the tip would skip every earlier deposit
+            raise ValueError("BTC_SCAN_START_HEIGHT is required, the wallet has addresses and no scan checkpoint")
+        return target
+
+    async def scan_block(self, height: int):
+        start = time.perf_counter()
+        raw = await btc_node.getrawblock(await btc_node.getblockhash(height))
+        matches, n_outputs = await asyncio.to_thread(self.match_block, raw)
+        current_time = int(datetime.utcnow().timestamp())
+        credits = []
+        for txid, vout, script_pubkey, value in matches:
+            utxo = UtxosInDb(
+                public_key=b2x(script_pubkey),
+                txid_hex=b2x(txid),
+                vout=vout,
+                amount=value,
+                locked=0,
+                ts_created=current_time,)
+            try:
+                userid = await self.psql.create_deposit_utxo(utxo)
+            except IntegrityError:
+                # credited before a restart, checkpoint was not advanced
+                continue
+            if userid is None:
+                continue
+            credits.append({"userid": userid, "amount": value})
+            # address is used now, top up the pool
+            address_pool.notify(userid)
+        # utxos are committed, the rescan would not return them again
+        await apply_committed_credits(credits)
+        self.blocks += 1
+        self.outputs += n_outputs
+        self.deposits += len(credits)
+        self.last_block_ms = (time.perf_counter() - start) * 1000
+        if credits:
+            logger.debug({"event": "Deposits found", "height": height, "count": len(credits), "stats": self.stats()})
+
+    def match_block(self, raw: bytes) -> tuple[list[tuple], int]:
+        """Return the outputs of a raw block paying a watched script"""
+        scripts = self.scripts
+        matches, n_outputs = [], 0
+        for output in iter_block_outputs(raw):
+            n_outputs += 1
+            if output[2] in scripts:
+                matches.append(output)
+        return matches, n_outputs
+
+    def stats(self) -> dict:
+        return {
+            "height": self.height,
+            "watched": len(self.scripts),
+            "blocks": self.blocks,
+            "outputs": self.outputs,
+            "deposits": self.deposits,
+            "reloads": self.reloads,
+            "last_block_ms": round(self.last_block_ms, 2),
+        }
+
+
+deposit_scanner = DepositScanner(BTCCrud(psql_pool))
+address_pool.on_created.append(deposit_scanner.watch)
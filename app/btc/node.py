@@ -0,0 +1,23 @@
+"""
+Shared bitcoind RPC client
+
+All btc tasks call bitcoind through this one AsyncProxy, its connection
+pool lets them run concurrently without blocking the event loop.
+"""
+
+import os
+from ..bitcoinlib import SelectParams
+from ..bitcoinlib.rpc import AsyncProxy
+from ..connections import NETWORK
+
+
+BTC_CONF_FILE = "app/bitcoin.conf"
+BTC_RPC_TIMEOUT = int(os.getenv("BTC_RPC_TIMEOUT", 60))
+BTC_RPC_MAX_CONNECTIONS = int(os.getenv("BTC_RPC_MAX_CONNECTIONS", 10))
+
+# chain params pick the rpc port and cookie directory
+SelectParams(NETWORK)
+
+btc_node = AsyncProxy(btc_conf_file=BTC_CONF_FILE,
+                      timeout=BTC_RPC_TIMEOUT,
+                      max_connections=BTC_RPC_MAX_CONNECTIONS)
@@ -0,0 +1,235 @@
+"""
+Batched on-chain withdrawals
+
+Every BTC_WITHDRAW_BATCH_S the QUEUED withdraw requests are paid by one
+transaction instead of one per user. Requests are taken oldest first up
+to BTC_WITHDRAW_MAX_OUTPUTS outputs and BTC_WITHDRAW_MAX_WEIGHT weight
+units, those that do not fit are skipped for the younger ones. utxos are
+selected largest first and the rest goes to a fresh change-branch address.
+Requests too small to ever pay their fee are rejected and refunded.
+
+Each user pays, at the rate of their feerates row, for the vbytes of
+their own output plus an equal share of the vbytes every output needs:
+version, locktime, inputs and change. The fee is taken from the
+requested amount. The unsigned transaction is persisted with
+finalize_payment, withdraw_tracker settles it once confirmed.
+"""
+
+import asyncio
+import math
+import os
+from psycopg import IntegrityError
+from ..bitcoinlib.core import COutPoint, CMutableTransaction, CMutableTxIn, CMutableTxOut, b2x, x
+from ..bitcoinlib.core.script import CScript, OP_1, OP_16
+from ..connections import logger, psql_pool
+from ..ln.settlement import apply_committed_credits
+from .base import UserWithdrawal, WDIn, WDOut, WithdrawalModel
+from .crud import BTCCrud
+
+
+BTC_WITHDRAW_BATCH_S = int(os.getenv("BTC_WITHDRAW_BATCH_S", 600))
+BTC_WITHDRAW_MAX_OUTPUTS = int(os.getenv("BTC_WITHDRAW_MAX_OUTPUTS", 20))
+BTC_WITHDRAW_MAX_WEIGHT = int(os.getenv("BTC_WITHDRAW_MAX_WEIGHT", 100000))
+
+# largest unlocked utxos considered per batch
+UTXO_CANDIDATES = 500
+# queued requests read per batch, in multiples of max_outputs, so skipped
+# requests do not keep younger ones out
+QUEUE_WINDOW = 4
+DUST_LIMIT = 546
+# signals replaceability, fees can be bumped
+SEQUENCE_RBF = 0xfffffffd
+# version, locktime, vin and vout counts, segwit marker and flag
+TX_OVERHEAD_WEIGHT = (4 + 4 + 1 + 1) * 4 + 2
+# change goes to a P2WSH wallet address
+P2WSH_SCRIPT_SIZE = 34
+
+
+def _varint_size(n: int) -> int:
+    return 1 if n < 0xfd else 3 if n <= 0xffff else 5
+
+
+def output_weight(script_size: int) -> int:
+    return (8 + _varint_size(script_size) + script_size) * 4
+
+
+def input_weight(witness_script: bytes) -> int:
+    """Weight of a signed P2WSH multisig input spending witness_script"""
+    n_sigs = witness_script[0] - OP_1 + 1 if OP_1 <= witness_script[0] <= OP_16 else 1
+    # count, CHECKMULTISIG dummy, DER signatures, script
+    witness = 1 + 1 + n_sigs * (1 + 72) + _varint_size(len(witness_script)) + len(witness_script)
+    # outpoint, empty scriptSig, sequence
+    return (32 + 4 + 1 + 4) * 4 + witness
+
+
+class WithdrawBatcher:
+    def __init__(self, psql: BTCCrud,
+                 interval: int = BTC_WITHDRAW_BATCH_S,
+                 max_outputs: int = BTC_WITHDRAW_MAX_OUTPUTS,
+                 max_weight: int = BTC_WITHDRAW_MAX_WEIGHT):
+        self.psql = psql
+        self.interval = interval
+        self.max_outputs = max_outputs
+        self.max_weight = max_weight
+        # metrics
+        self.batches = 0
+        self.paid = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.last_weight = 0
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.build()
+
+    async def build(self) -> WithdrawalModel | None:
+        requests = await self.psql.get_queued_requests(self.max_outputs * QUEUE_WINDOW)
+        unpayable = [r for r in requests if self.unpayable(r)]
+        if unpayable:
+            await self.reject(unpayable)
+            requests = [r for r in requests if r not in unpayable]
+        if not requests:
+            return None
+        utxos = await self.psql.get_spendable_utxos(UTXO_CANDIDATES)
+        WD = self.plan(requests, utxos)
+        if WD is None:
+            logger.error({"event": "Withdrawal batch not funded", "requests": len(requests), "utxos": len(utxos)})
+            return None
+        if WD.change_vout:
+            change = WD.change_vout[0]
+            change.public_key = await self.get_change_address(change.userid)
+            WD.vout.append(change)
+        tx = self.build_transaction(WD)
+        WD.txid = b2x(tx.GetTxid())
+        WD.hash = WD.txid
+        WD.tx_hex = b2x(tx.serialize())
+        try:
+            await self.psql.finalize_payment(WD)
+        except IntegrityError:
+            # inputs or requests taken by a batch of another instance
+            logger.exception("Error persisting BTC withdrawal batch in SQL")
+            return None
+        self.batches += 1
+        self.paid += len(WD.user_requests)
+        self.last_weight = WD.weight
+        logger.debug({"event": "Withdrawal batch built", "txid": WD.txid, "stats": self.stats()})
+        return WD
+
+    def plan(self, requests: list[dict], utxos: list[dict]) -> WithdrawalModel | None:
+        """
+        Pick requests oldest first, with inputs and fee shares. A request
+        that can not be funded, breaks the weight cap or leaves a request
+        of the batch below dust is skipped and waits for a later batch,
+        younger requests still fill this one.
+        """
+        selected, userids, WD = [], set(), None
+        for r in requests:
+            if len(selected) >= self.max_outputs:
+                break
+            # user_requests is keyed by userid, one request per user per batch
+            if r["userid"] in userids:
+                continue
+            planned = self._plan(selected + [r], utxos)
+            if planned is None or planned.weight > self.max_weight or any(
+                    u.remaining_amount < DUST_LIMIT for u in planned.user_requests.values()):
+                self.skipped += 1
+                continue
+            selected.append(r)
+            userids.add(r["userid"])
+            WD = planned
+        return WD
+
+    @staticmethod
+    def unpayable(r: dict) -> bool:
+        """Amount below dust once the fee of its own output is paid, no batch can pay it"""
+        own_fee = math.ceil(r["rate"] * output_weight(len(r["destination"]) // 2) / 4)
+        return r["amount"] - own_fee < DUST_LIMIT
+
+    async def reject(self, requests: list[dict]):
+        refunds = await self.psql.reject_queued_requests(
+            [r["k1"] for r in requests], "Amount does not cover fee and dust limit")
+        # locked balances are refunded, the session balance follows
+        await apply_committed_credits(refunds)
+        self.rejected += len(requests)
+        logger.debug({"event": "Withdraw requests rejected", "count": len(requests), "stats": self.stats()})
+
+    def _plan(self, requests: list[dict], utxos: list[dict]) -> WithdrawalModel | None:
+        requested = sum(r["amount"] for r in requests)
+        vin, scripts, vin_amount = [], [], 0
+        for u in utxos:
+            if vin_amount >= requested:
+                break
+            vin.append(WDIn(txid=u["txid_hex"], vout=u["vout"], amount=u["amount"], public_key=u["public_key"]))
+            scripts.append(u["witness_script"])
+            vin_amount += u["amount"]
+        if vin_amount < requested:
+            return None
+        change_amount = vin_amount - requested
+        shared_weight = TX_OVERHEAD_WEIGHT + sum(input_weight(x(s)) for s in scripts)
+        if change_amount >= DUST_LIMIT:
+            shared_weight += output_weight(P2WSH_SCRIPT_SIZE)
+        else:
+            # below dust, left to the miner
+            change_amount = 0
+        weight = shared_weight
+        vout, user_requests = [], {}
+        for r in requests:
+            own_weight = output_weight(len(r["destination"]) // 2)
+            user_fee = math.ceil(r["rate"] * (own_weight + shared_weight / len(requests)) / 4)
+            amount = r["amount"] - user_fee
+            weight += own_weight
+            vout.append(WDOut(amount=amount, public_key=r["destination"], userid=r["userid"], change=False, k1=r["k1"]))
+            user_requests[r["userid"]] = UserWithdrawal(
+                k1=r["k1"],
+                userid=r["userid"],
+                public_key=r["destination"],
+                request_amount=r["amount"],
+                remaining_amount=amount,
+                fee_rate=r["rate"],
+                fee=user_fee)
+        vout_amount = sum(o.amount for o in vout)
+        change_vout = []
+        if change_amount:
+            # change returns to the owner of the largest input
+            change_vout.append(WDOut(amount=change_amount, public_key="", userid=utxos[0]["userid"], change=True))
+            vout_amount += change_amount
+        fee = vin_amount - vout_amount
+        return WithdrawalModel(
+            requested_amount=requested,
+            vin_amount=vin_amount,
+            vout_amount=vout_amount,
+            change_amount=change_amount,
+            fee=fee,
+            fee_rate=round(fee * 4 / weight),
+            user_requests=user_requests,
+            vin=vin,
+            scripts=scripts,
+            vout=vout,
+            change_vout=change_vout,
+            weight=weight)
+
+    async def get_change_address(self, userid: str) -> str:
+        script_pubkey = await self.psql.get_unused_address(userid, change=1)
+        if script_pubkey is None:
+            await self.psql.fill_address_pool([userid], 1, change=1)
+            script_pubkey = await self.psql.get_unused_address(userid, change=1)
+        return script_pubkey
+
+    def build_transaction(self, WD: WithdrawalModel) -> CMutableTransaction:
+        """Unsigned transaction, the signers complete the P2WSH witnesses from WD.scripts"""
+        vin = [CMutableTxIn(COutPoint(x(i.txid), i.vout), nSequence=SEQUENCE_RBF) for i in WD.vin]
+        vout = [CMutableTxOut(o.amount, CScript(x(o.public_key))) for o in WD.vout]
+        return CMutableTransaction(vin, vout, nLockTime=0, nVersion=2)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "paid": self.paid,
+            "skipped": self.skipped,
+            "rejected": self.rejected,
+            "last_weight": self.last_weight,
+        }
+
+
+withdraw_batcher = WithdrawBatcher(BTCCrud(psql_pool))
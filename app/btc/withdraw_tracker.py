@@ -0,0 +1,127 @@
+"""
+On-chain withdrawal confirmation tracker
+
+One service for every in-flight withdrawal. It follows the tip of
+bitcoind and on each new block checks all btc_payments below
+BTC_WITHDRAW_CONFIRMATIONS with a single batched getrawtransaction
+request, then settles those that reached the target with
+create_withdraw_transaction. Its cost grows with blocks, not with pending
+transactions.
+
+getrawtransaction finds confirmed transactions only with txindex=1 on
+bitcoind. Without it, a payment is checked through gettxout on all of
+its outputs. That lookup loses the payment once every output is spent.
+"""
+
+import asyncio
+import os
+import time
+from psycopg import IntegrityError
+from ..bitcoinlib.core import b2lx, x
+from ..connections import logger, psql_pool
+from .crud import BTCCrud
+from .node import btc_node
+
+
+BTC_WITHDRAW_CONFIRMATIONS = int(os.getenv("BTC_WITHDRAW_CONFIRMATIONS", 3))
+BTC_TRACK_POLL_S = int(os.getenv("BTC_TRACK_POLL_S", 30))
+
+
+class WithdrawTracker:
+    def __init__(self, psql: BTCCrud,
+                 confirmations: int = BTC_WITHDRAW_CONFIRMATIONS,
+                 poll_interval: int = BTC_TRACK_POLL_S):
+        self.psql = psql
+        self.confirmations = max(confirmations, 1)
+        self.poll_interval = poll_interval
+        # metrics
+        self.checks = 0
+        self.pending = 0
+        self.settled = 0
+        self.last_check_ms = 0.0
+
+    async def run(self):
+        best_hash = None
+        while True:
+            tip_hash = await btc_node.getbestblockhash()
+            if tip_hash != best_hash:
+                await self.check()
+                best_hash = tip_hash
+            await asyncio.sleep(self.poll_interval)
+
+    async def check(self):
+        """Update confirmations of all unconfirmed payments, settle confirmed ones"""
+        start = time.perf_counter()
+        outputs = await self.psql.get_unconfirmed_outputs(self.confirmations)
+        confirmations = await self.get_confirmations(outputs)
+        progress = [(n, txid_hex) for txid_hex, n in confirmations.items() if 0 < n < self.confirmations]
+        if progress:
+            await self.psql.update_payment_confirmations(progress)
+        for txid_hex, n in confirmations.items():
+            if n >= self.confirmations:
+                await self.settle(txid_hex, n)
+        self.checks += 1
+        self.pending = len(confirmations)
+        self.last_check_ms = (time.perf_counter() - start) * 1000
+        logger.debug({"event": "Withdrawals checked", "stats": self.stats()})
+
+    async def get_confirmations(self, outputs: list[dict]) -> dict[str, int]:
+        """
+        Confirmations per txid_hex from one batched getrawtransaction,
+        which needs txindex for confirmed transactions. Transactions it
+        can not find fall back to gettxout on their outputs, in a second
+        batch.
+        """
+        txids = list(dict.fromkeys(o["txid_hex"] for o in outputs))
+        async with btc_node.batch() as batch:
+            results = [(txid_hex, batch.getrawtransaction(x(txid_hex), True)) for txid_hex in txids]
+        confirmations, missing = {}, set()
+        for txid_hex, r in results:
+            try:
+                # no confirmations key while in the mempool
+                confirmations[txid_hex] = r.result().get("confirmations", 0)
+            except IndexError:
+                missing.add(txid_hex)
+        if missing:
+            confirmations.update(await self.get_output_confirmations(
+                [o for o in outputs if o["txid_hex"] in missing]))
+        return confirmations
+
+    async def get_output_confirmations(self, outputs: list[dict]) -> dict[str, int]:
+        """Confirmations per txid_hex from gettxout, blind to spent outputs"""
+        async with btc_node.batch() as batch:
+            results = [(o["txid_hex"], batch.getconfirmations(b2lx(x(o["txid_hex"])), o["vout"]))
+                       for o in outputs]
+        confirmations = {}
+        for txid_hex, r in results:
+            try:
+                n = r.result()
+            except IndexError:
+                # output spent, or transaction not in mempool or chain
+                n = 0
+            confirmations[txid_hex] = max(n, confirmations.get(txid_hex, 0))
+        return confirmations
+
+    async def settle(self, txid_hex: str, n: int):
+        WD = await self.psql.get_payment_withdrawal(txid_hex)
+        if WD is None:
+            return
+        try:
+            await self.psql.create_withdraw_transaction(n, WD)
+        except IntegrityError:
+            logger.exception("Error finalizing BTC withdraw transaction in SQL")
+            return
+        self.settled += 1
+        logger.debug({"event": "Withdrawal confirmed", "txid": txid_hex, "confirmations": n})
+
+    def stats(self) -> dict:
+        return {
+            "confirmations": self.confirmations,
+            "pending": self.pending,
+            "checks": self.checks,
+            "settled": self.settled,
+            "last_check_ms": round(self.last_check_ms, 2),
+        }
+
+
+withdraw_tracker = WithdrawTracker(BTCCrud(psql_pool))
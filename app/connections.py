@@ -1,11 +1,10 @@
-from redis import Redis, ConnectionPool
+from redis.asyncio import Redis, BlockingConnectionPool
 import psycopg_pool
 import logging
 from logging.handlers import RotatingFileHandler
 import asyncio
 from typing import List
 import os
-import time
 from .ln.node import LndRestNode
 
 # bitcoin network
@@ -23,14 +22,29 @@ psql_pool = psycopg_pool.AsyncConnectionPool(conninfo=psql_coninf)
 r_host = os.getenv("REDIS_HOST")
 r_port = os.getenv("REDIS_PORT")
 r_psw = os.getenv("REDIS_PSW")
-redis_pool = ConnectionPool(host=r_host,
-                            port=r_port,
-                            password=r_psw,
-                            db=0, decode_responses=True)
+r_max_connections = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+r_pool_timeout = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+r_socket_timeout = float(os.getenv("REDIS_SOCKET_TIMEOUT", 2))
+r_connect_timeout = float(os.getenv("REDIS_CONNECT_TIMEOUT", 2))
+r_health_check_interval = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+# asyncio pool, parser is hiredis when installed (redis[hiredis])
+# blocks up to r_pool_timeout for a free connection instead of erroring
+redis_pool = BlockingConnectionPool(host=r_host,
+                                    port=r_port,
+                                    password=r_psw,
+                                    db=0, decode_responses=True,
+                                    max_connections=r_max_connections,
+                                    timeout=r_pool_timeout,
+                                    socket_timeout=r_socket_timeout,
+                                    socket_connect_timeout=r_connect_timeout,
+                                    health_check_interval=r_health_check_interval)
 
 async def get_redis_connection():
     connection = Redis(connection_pool=redis_pool)
-    yield connection
+    try:
+        yield connection
+    finally:
+        await connection.aclose(close_connection_pool=False)
 
 node = LndRestNode()
 
@@ -72,4 +86,4 @@ async def catch_everything_and_restart(func, *args):
             raise  # because we must pass this up
         except Exception as exc:
             logger.exception("Background service exception: ")
-            time.sleep(10)
+            await asyncio.sleep(10)
@@ -4,6 +4,7 @@ PSQL Async Pool Client
 
 import psycopg_pool
 from psycopg.rows import dict_row
+from contextlib import asynccontextmanager
 import os
 import asyncio
 from .connections import logger
@@ -37,12 +38,23 @@ class PSQLClient:
                 rows = await cur.fetchall()
                 return rows
 
+    @asynccontextmanager
+    async def pipeline_transaction(self):
+        """
+        Transaction in pipeline mode. Statements executed on the yielded
+        cursor are queued without waiting for results, the whole block
+        costs one round trip unless a result is fetched midway.
+        """
+        async with self.pool.connection() as conn:
+            async with conn.pipeline():
+                async with conn.transaction():
+                    async with conn.cursor(row_factory=dict_row) as cur:
+                        yield cur
+
 
 async def db_init(pool):
-    if os.getenv("DROP_DATABASE"):
-        await asyncio.gather(_drop_tables(pool, all_tables))
-    if os.getenv("INIT_DATABASE"):
-        await asyncio.gather(_init_tables_all(pool))
+    if os.getenv("DROP_DATABASE") == "true":
+        await asyncio.gather(_drop_tables(pool, all_tables + ["schema_migrations"]))
 
 
 async def _drop_tables(pool, tables):
@@ -59,33 +71,28 @@ async def _drop_tables(pool, tables):
     logger.debug("Tables dropped successfully")
 
 
-async def _init_tables_all(pool):
-    logger.debug("Initializing database tables")
-    async with pool.connection() as conn:
-        await conn.set_autocommit(True)
-        async with conn.cursor() as cur:
-            # base
-            await create_users_table(cur)
-            await create_balances_table(cur)
-            await create_userlog_table(cur)
-            await create_feerates_table(cur)
-            # transfers
-            await create_deposit_transactions_table(cur)
-            await create_withdraw_transactions_table(cur)
-            await create_withdraw_requests_table(cur)
-            await create_locked_balances_table(cur)
-            # ln
-            await create_withdraw_invoices_table(cur)
-            await create_ln_payments_table(cur)
-            await create_deposit_invoices_table(cur)
-            # btc
-            await create_wallet_addresses_table(cur)
-            await create_utxos_table(cur)
-            await create_btc_payments_table(cur)
-            await create_change_outs_table(cur)
-            await create_wd_outs_table(cur)
-            await create_wd_ins_table(cur)
-    logger.debug("Initializing database tables")
+async def create_tables_all(cur):
+    # base
+    await create_users_table(cur)
+    await create_balances_table(cur)
+    await create_userlog_table(cur)
+    await create_feerates_table(cur)
+    # transfers
+    await create_deposit_transactions_table(cur)
+    await create_withdraw_transactions_table(cur)
+    await create_withdraw_requests_table(cur)
+    await create_locked_balances_table(cur)
+    # ln
+    await create_withdraw_invoices_table(cur)
+    await create_ln_payments_table(cur)
+    await create_deposit_invoices_table(cur)
+    # btc
+    await create_wallet_addresses_table(cur)
+    await create_utxos_table(cur)
+    await create_btc_payments_table(cur)
+    await create_change_outs_table(cur)
+    await create_wd_outs_table(cur)
+    await create_wd_ins_table(cur)
 
 base = [
     "users", 
@@ -102,7 +109,9 @@ deposits = [
 ln = [
     'withdraw_invoices', 
     'ln_payments', 
-    'deposit_invoices']
+    'deposit_invoices',
+    'stream_checkpoints',
+    'ln_payouts']
 
 btc = [
     'wallet_addresses', 
@@ -312,6 +321,35 @@ async def create_deposit_invoices_table(cursor):
     """
     await cursor.execute(q)
 
+async def create_stream_checkpoints_table(cursor):
+    q = """
+    CREATE TABLE IF NOT EXISTS stream_checkpoints
+    (
+        stream character varying(50) NOT NULL PRIMARY KEY,
+        add_index bigint DEFAULT 0 NOT NULL,
+        settle_index bigint DEFAULT 0 NOT NULL,
+        ts_updated bigint NOT NULL
+    )
+    """
+    await cursor.execute(q)
+
+async def create_ln_payouts_table(cursor):
+    q = """
+    CREATE TABLE IF NOT EXISTS ln_payouts
+    (
+        payment_hash character(64) NOT NULL PRIMARY KEY,
+        k1 character(64) NOT NULL,
+        bolt11 character varying(1023) NOT NULL,
+        fee_limit_sat bigint NOT NULL,
+        status character varying(20) DEFAULT 'QUEUED',
+        attempts bigint DEFAULT 0,
+        error text,
+        ts_created bigint NOT NULL,
+        ts_updated bigint
+    )
+    """
+    await cursor.execute(q)
+
 """
 MAINNET
 """
@@ -336,6 +374,16 @@ async def create_wallet_addresses_table(cursor):
     await cursor.execute(q)
 
 
+async def create_wallet_user_index_sequence(cursor):
+    # dropped together with wallet_addresses
+    q = """
+    CREATE SEQUENCE IF NOT EXISTS wallet_user_index_seq
+    START WITH 1001
+    OWNED BY wallet_addresses.user_index
+    """
+    await cursor.execute(q)
+
+
 async def create_utxos_table(cursor):
     q = """
     CREATE TABLE IF NOT EXISTS utxos
@@ -25,6 +25,7 @@ class LNDInvoice(BaseModel):
     preimage: Optional[str] = None
     state: Optional[str] = None
     add_index: Optional[int] = None
+    settle_index: Optional[int] = None
 
     @validator("features", pre=True)
     def convert_dict_to_json(cls, value):
@@ -0,0 +1,251 @@
+"""
+BOLT11 payment request decoder
+
+Builds LNDInvoice locally instead of a /v1/payreq round trip to the node.
+https://github.com/lightning/bolts/blob/master/11-payment-encoding.md
+"""
+
+from functools import lru_cache
+import base64
+import hashlib
+import os
+import re
+from ..bitcoinlib.segwit_addr import CHARSET, bech32_polymod, bech32_hrp_expand, convertbits
+from ..bitcoinlib.segwit_addr import encode as segwit_encode
+from ..bitcoinlib.base58 import CBase58Data
+from ..bitcoinlib.core.key import CPubKey
+from .base import LNDInvoice
+
+
+BOLT11_CACHE_SIZE = int(os.getenv("BOLT11_CACHE_SIZE", 4096))
+
+DEFAULT_EXPIRY = 3600
+DEFAULT_MIN_FINAL_CLTV_EXPIRY = 18
+
+# currency prefix: (segwit hrp, p2pkh version, p2sh version)
+CURRENCIES = {
+    "bc": ("bc", 0, 5),
+    "tb": ("tb", 111, 196),
+    "tbs": ("tb", 111, 196),
+    "bcrt": ("bcrt", 111, 196),
+    "sb": ("tb", 111, 196),
+}
+
+# invoice currencies accepted on each chain of NETWORK
+NETWORK_CURRENCIES = {
+    "mainnet": ("bc",),
+    "testnet": ("tb",),
+    "signet": ("tbs",),
+    "regtest": ("bcrt",),
+}
+
+# msat per unit of amount with multiplier, 1 BTC = 10^11 msat
+MULTIPLIERS = {
+    "": 10**11,
+    "m": 10**8,
+    "u": 10**5,
+    "n": 10**2,
+}
+
+# LND feature names by bit pair
+FEATURE_NAMES = {
+    0: "data-loss-protect",
+    4: "upfront-shutdown-script",
+    6: "gossip-queries",
+    8: "tlv-onion",
+    10: "ext-gossip-queries",
+    12: "static-remote-key",
+    14: "payment-addr",
+    16: "multi-path-payments",
+    24: "amp",
+    48: "script-enforced-lease",
+}
+
+HRP_RE = re.compile(r"^ln(bcrt|bc|tbs|tb|sb)(\d+)?([munp])?$")
+
+
+class Bolt11Error(ValueError):
+    pass
+
+
+def _to_int(groups: list[int]) -> int:
+    n = 0
+    for g in groups:
+        n = (n << 5) | g
+    return n
+
+
+def _to_bytes(groups: list[int]) -> bytes:
+    # fields are padded to 5 bits, trailing bits are dropped
+    return bytes(convertbits(groups, 5, 8, True)[:len(groups) * 5 // 8])
+
+
+def _decode_amount(amount: str | None, multiplier: str | None) -> int:
+    """Amount in msat"""
+    if amount is None:
+        return 0
+    if multiplier == "p":
+        if int(amount) % 10:
+            raise Bolt11Error("Sub-millisatoshi amount")
+        return int(amount) // 10
+    return int(amount) * MULTIPLIERS[multiplier or ""]
+
+
+def _decode_route_hint(data: bytes) -> dict:
+    hop_hints = []
+    for i in range(0, len(data) - len(data) % 51, 51):
+        hop = data[i:i+51]
+        hop_hints.append({
+            "node_id": hop[0:33].hex(),
+            "chan_id": str(int.from_bytes(hop[33:41], "big")),
+            "fee_base_msat": int.from_bytes(hop[41:45], "big"),
+            "fee_proportional_millionths": int.from_bytes(hop[45:49], "big"),
+            "cltv_expiry_delta": int.from_bytes(hop[49:51], "big"),
+        })
+    return {"hop_hints": hop_hints}
+
+
+def _decode_fallback(groups: list[int], currency: str) -> str:
+    hrp, p2pkh, p2sh = CURRENCIES[currency]
+    version, program = groups[0], _to_bytes(groups[1:])
+    if version == 17:
+        return str(CBase58Data.from_bytes(program, p2pkh))
+    if version == 18:
+        return str(CBase58Data.from_bytes(program, p2sh))
+    if version <= 16:
+        return segwit_encode(hrp, version, program) or ""
+    return ""
+
+
+def _decode_features(groups: list[int]) -> dict:
+    bits = _to_int(groups)
+    features = {}
+    n = 0
+    while bits >> n:
+        if (bits >> n) & 1:
+            name = FEATURE_NAMES.get(n - n % 2, "unknown")
+            features[str(n)] = {
+                "name": name,
+                "is_required": n % 2 == 0,
+                "is_known": name != "unknown",
+            }
+        n += 1
+    return features
+
+
+def _bech32_decode(bolt11: str) -> tuple[str, list[int]]:
+    # segwit_addr.bech32_decode caps length at 90, invoices are longer
+    pos = bolt11.rfind("1")
+    if pos < 1 or pos + 7 > len(bolt11):
+        raise Bolt11Error("Invalid bech32 separator")
+    hrp = bolt11[:pos]
+    if not all(c in CHARSET for c in bolt11[pos+1:]):
+        raise Bolt11Error("Invalid bech32 character")
+    data = [CHARSET.find(c) for c in bolt11[pos+1:]]
+    if bech32_polymod(bech32_hrp_expand(hrp) + data) != 1:
+        raise Bolt11Error("Invalid bech32 checksum")
+    return hrp, data[:-6]
+
+
+@lru_cache(maxsize=BOLT11_CACHE_SIZE)
+def _decode_fields(bolt11: str) -> tuple[str, dict]:
+    if bolt11.startswith("lightning:"):
+        bolt11 = bolt11[len("lightning:"):]
+    hrp, data = _bech32_decode(bolt11)
+    m = HRP_RE.match(hrp)
+    if m is None:
+        raise Bolt11Error("Unknown invoice prefix "+hrp)
+    currency, amount, multiplier = m.groups()
+    amount_msat = _decode_amount(amount, multiplier)
+
+    if len(data) < 7 + 104:
+        raise Bolt11Error("Invoice too short")
+    signed, sig = data[:-104], _to_bytes(data[-104:])
+    timestamp = _to_int(signed[:7])
+
+    fields = {
+        "payment_hash": "",
+        "destination": "",
+        "description": "",
+        "description_hash": "",
+        "fallback_addr": "",
+        "payment_addr": "",
+        "expiry": DEFAULT_EXPIRY,
+        "cltv_expiry": DEFAULT_MIN_FINAL_CLTV_EXPIRY,
+        "route_hints": [],
+        "features": {},
+    }
+    i = 7
+    while i < len(signed):
+        if i + 3 > len(signed):
+            raise Bolt11Error("Truncated tagged field")
+        tag = CHARSET[signed[i]]
+        length = _to_int(signed[i+1:i+3])
+        groups = signed[i+3:i+3+length]
+        if len(groups) != length:
+            raise Bolt11Error("Truncated tagged field")
+        i += 3 + length
+        # fields of unexpected length are skipped as per BOLT11
+        if tag == "p" and length == 52 and not fields["payment_hash"]:
+            fields["payment_hash"] = _to_bytes(groups).hex()
+        elif tag == "s" and length == 52:
+            fields["payment_addr"] = base64.b64encode(_to_bytes(groups)).decode("ascii")
+        elif tag == "d":
+            fields["description"] = _to_bytes(groups).decode("utf-8")
+        elif tag == "h" and length == 52:
+            fields["description_hash"] = _to_bytes(groups).hex()
+        elif tag == "n" and length == 53:
+            fields["destination"] = _to_bytes(groups).hex()
+        elif tag == "x":
+            fields["expiry"] = _to_int(groups)
+        elif tag == "c":
+            fields["cltv_expiry"] = _to_int(groups)
+        elif tag == "f" and length:
+            fields["fallback_addr"] = fields["fallback_addr"] or _decode_fallback(groups, currency)
+        elif tag == "r":
+            fields["route_hints"].append(_decode_route_hint(_to_bytes(groups)))
+        elif tag == "9":
+            fields["features"] = _decode_features(groups)
+    if not fields["payment_hash"]:
+        raise Bolt11Error("Missing payment hash")
+
+    # signature over sha256(hrp || data without signature)
+    message = hrp.encode() + bytes(convertbits(signed, 5, 8, True))
+    digest = hashlib.sha256(message).digest()
+    recid = sig[64]
+    if recid > 3:
+        raise Bolt11Error("Invalid recovery id")
+    pubkey = CPubKey.recover_compact(digest, bytes([27 + 4 + recid]) + sig[:64])
+    if not pubkey:
+        raise Bolt11Error("Signature recovery failed")
+    if fields["destination"] and fields["destination"] != pubkey.hex():
+        raise Bolt11Error("Signature does not match payee")
+    fields["destination"] = pubkey.hex()
+
+    fields.update(
+        num_satoshis=amount_msat // 1000,
+        timestamp=str(timestamp),
+        expiry=str(fields["expiry"]),
+        cltv_expiry=str(fields["cltv_expiry"]),
+    )
+    return currency, fields
+
+
+def decode(bolt11: str, network: str | None = None) -> LNDInvoice:
+    """
+    Decode and verify a payment request. Raises Bolt11Error when invalid
+    or, with network given, when it is for another chain.
+    Parsed fields are cached by payment request, every call returns a
+    new LNDInvoice so callers can set k1 / add_index.
+    """
+    bolt11 = bolt11.strip().lower()
+    try:
+        currency, fields = _decode_fields(bolt11)
+    except (IndexError, TypeError, UnicodeDecodeError) as e:
+        raise Bolt11Error(str(e))
+    if network is not None and currency not in NETWORK_CURRENCIES.get(network, ()):
+        raise Bolt11Error("Invoice currency "+currency+" is not for "+network)
+    invoice = LNDInvoice(**fields)
+    invoice.bolt11 = bolt11
+    invoice.state = "ACCEPTED"
+    return invoice
@@ -1,20 +1,10 @@
 from datetime import datetime
-import asyncio
 import psycopg_pool
-import psycopg
-from psycopg.rows import dict_row
 from ..user.base import WithdrawRequest
 from ..user.crud import PSQLClient
 from .base import LNDInvoice, LNPayment, PaymentStatus
 
 
-def lock_function(func):
-    async def wrapper(*args, **kwargs):
-        async with asyncio.Lock():
-            return await func(*args, **kwargs)
-    return wrapper
-
-
 class LNCrud(PSQLClient):
 
     def __init__(self, pool: psycopg_pool.AsyncConnectionPool):
@@ -127,10 +117,35 @@ class LNCrud(PSQLClient):
         WHERE state IN ('SETTLED', 'CANCELED')
         """
         idx = await self.fetchone(q)
-        if idx is not None:
-            idx.get("idx", 0)
+        if idx is not None and idx.get("idx") is not None:
+            return idx["idx"]
         return 0
 
+    async def get_stream_checkpoint(self, stream: str) -> dict:
+        q = """
+        SELECT add_index, settle_index
+        FROM stream_checkpoints
+        WHERE stream = %s
+        """
+        checkpoint = await self.fetchone(q, stream)
+        if checkpoint is None:
+            return {"add_index": 0, "settle_index": 0}
+        return checkpoint
+
+    async def update_stream_checkpoint(self, stream: str, add_index: int = 0, settle_index: int = 0) -> None:
+        """Advance stream checkpoint, indexes never move backwards"""
+        q = """
+        INSERT INTO stream_checkpoints
+        (stream, add_index, settle_index, ts_updated)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (stream) DO UPDATE
+        SET add_index = GREATEST(stream_checkpoints.add_index, EXCLUDED.add_index),
+        settle_index = GREATEST(stream_checkpoints.settle_index, EXCLUDED.settle_index),
+        ts_updated = EXCLUDED.ts_updated
+        """
+        current_time = int(datetime.utcnow().timestamp())
+        return await self.execute(q, stream, add_index, settle_index, current_time)
+
     async def get_withdraw_invoice_exists(self, payment: LNPayment) -> int:
         q = """
         SELECT COUNT(payment_hash) exists
@@ -140,71 +155,114 @@ class LNCrud(PSQLClient):
         exists = await self.fetchone(q, payment.payment_hash)
         return exists.get("exists")
 
-    @lock_function
-    async def withdraw_redeem_request(self, k1: str, invoice: LNDInvoice):
-        q1 = """
-        SELECT *
-        FROM withdraw_requests
-        WHERE k1 = %s
-        AND status = 'VERIFIED'
+    async def withdraw_redeem_request(self, k1: str, invoice: LNDInvoice, fee_limit_sat: int = 0):
         """
-        q2 = """
+        Claim a VERIFIED request and debit it in one transaction. The claim
+        only matches an unredeemed request, so concurrent callbacks for the
+        same k1 can not both debit the balance.
+        """
+        q1 = """
         UPDATE withdraw_requests
         SET redeemed = TRUE,
         amount = %s,
         destination = %s,
         status = 'IN_FLIGHT'
         WHERE k1 = %s
+        AND status = 'VERIFIED'
+        AND redeemed = FALSE
+        RETURNING *
         """
-        q3 = """
+        q2 = """
         UPDATE balances
-        SET amount = balances.amount -%s
-        FROM withdraw_requests
-        WHERE balances.userid = withdraw_requests.userid
-        AND withdraw_requests.k1 = %s
+        SET amount = balances.amount - %s
+        WHERE userid = %s
         """
-        q4 = """
+        q3 = """
         INSERT INTO locked_balances
         (userid, k1, amount)
-        SELECT userid, %s, %s
-        FROM withdraw_requests
-        WHERE k1 = %s
+        VALUES (%s, %s, %s)
         """
-        q5 = """
+        q4 = """
         INSERT INTO withdraw_invoices
             (
                 k1, payment_hash, bolt11, state, destination, num_satoshis, timestamp, expiry, description,
                 description_hash, fallback_addr, cltv_expiry, route_hints, payment_addr, features, add_index
             )
         VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """        
-        q6 = """
-        INSERT INTO ln_payments 
+        """
+        q5 = """
+        INSERT INTO ln_payments
         (k1, userid, payment_hash, value_sat, ts_created)
         VALUES (%s, %s, %s, %s, %s)
-        """        
+        """
+        q6 = """
+        INSERT INTO ln_payouts
+        (payment_hash, k1, bolt11, fee_limit_sat, status, ts_created)
+        VALUES (%s, %s, %s, %s, 'QUEUED', %s)
+        """
         current_time = int(datetime.utcnow().timestamp())
-        async with self.pool.connection() as conn:
-            await conn.set_autocommit(True)
-            async with conn.cursor(row_factory=dict_row) as cur:
-                cur: psycopg.Cursor
-                await cur.execute(q1, (k1, ))
-                request = await cur.fetchone()
-                if request is None:
-                    return None
-                async with conn.transaction():
-                    await cur.execute(q2, (invoice.num_satoshis, invoice.destination, k1))
-                    await cur.execute(q3, (invoice.num_satoshis, k1))
-                    await cur.execute(q4, (k1, invoice.num_satoshis, k1))
-                    await cur.execute(q5, (k1, invoice.payment_hash, invoice.bolt11, invoice.state,
-                                            invoice.destination, invoice.num_satoshis, invoice.timestamp,
-                                            invoice.expiry, invoice.description, invoice.description_hash,
-                                            invoice.fallback_addr, invoice.cltv_expiry, invoice.route_hints,
-                                            invoice.payment_addr, invoice.features, invoice.add_index, ))
-                    await self.execute(q6, request['k1'], request["userid"], invoice.payment_hash, invoice.num_satoshis, current_time)
+        async with self.pipeline_transaction() as cur:
+            await cur.execute(q1, (invoice.num_satoshis, invoice.destination, k1))
+            request = await cur.fetchone()
+            if request is None:
+                # not verified or already redeemed, nothing written
+                return None
+            await cur.execute(q2, (invoice.num_satoshis, request["userid"]))
+            await cur.execute(q3, (request["userid"], k1, invoice.num_satoshis))
+            await cur.execute(q4, (k1, invoice.payment_hash, invoice.bolt11, invoice.state,
+                                    invoice.destination, invoice.num_satoshis, invoice.timestamp,
+                                    invoice.expiry, invoice.description, invoice.description_hash,
+                                    invoice.fallback_addr, invoice.cltv_expiry, invoice.route_hints,
+                                    invoice.payment_addr, invoice.features, invoice.add_index, ))
+            await cur.execute(q5, (k1, request["userid"], invoice.payment_hash, invoice.num_satoshis, current_time))
+            # durable payout queue, sent by the payout workers
+            await cur.execute(q6, (invoice.payment_hash, k1, invoice.bolt11, fee_limit_sat, current_time))
         return WithdrawRequest(**request)
 
 
+    async def claim_payouts(self, limit: int = 1) -> list[dict]:
+        """Move oldest QUEUED payouts to IN_FLIGHT, safe with concurrent workers"""
+        q = """
+        UPDATE ln_payouts
+        SET status = 'IN_FLIGHT',
+        attempts = attempts + 1,
+        ts_updated = %s
+        WHERE payment_hash IN (
+            SELECT payment_hash
+            FROM ln_payouts
+            WHERE status = 'QUEUED'
+            ORDER BY ts_created ASC
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING payment_hash, k1, bolt11, fee_limit_sat, ts_created
+        """
+        current_time = int(datetime.utcnow().timestamp())
+        return await self.fetchmany(q, current_time, limit)
+
+    async def requeue_payouts(self) -> None:
+        """
+        Payouts left IN_FLIGHT by a stopped process are sent again,
+        LND refuses a second payment of the same hash
+        """
+        q = """
+        UPDATE ln_payouts
+        SET status = 'QUEUED'
+        WHERE status = 'IN_FLIGHT'
+        """
+        return await self.execute(q)
+
+    async def update_payout_status(self, payment_hash: str, status: str, error: str = None) -> None:
+        q = """
+        UPDATE ln_payouts
+        SET status = %s,
+        error = %s,
+        ts_updated = %s
+        WHERE payment_hash = %s
+        """
+        current_time = int(datetime.utcnow().timestamp())
+        return await self.execute(q, status, error, current_time, payment_hash)
+
     async def create_withdraw_invoice(self, invoice: LNDInvoice) -> None:
         q = """
         INSERT INTO withdraw_invoices
@@ -238,50 +296,105 @@ class LNCrud(PSQLClient):
         current_time = int(datetime.utcnow().timestamp())
         return await self.execute(q, request['k1'], request["userid"], invoice.payment_hash, invoice.num_satoshis, current_time)    
 
-    async def finalize_payment(self, payment: PaymentStatus):
-        q = """
-        UPDATE ln_payments
-        SET fee_sat = %s,
-        status = %s
-        WHERE payment_hash = %s
-        """
-        q2 = """
-        DELETE FROM locked_balances
-        USING ln_payments
-        WHERE locked_balances.k1 = ln_payments.k1
-        AND ln_payments.payment_hash = %s
+    async def finalize_payment(self, payment: PaymentStatus) -> str | None:
+        """Settle a single outgoing payment, returns userid of the payer"""
+        paid = await self.finalize_payments([payment])
+        if paid:
+            return paid[0]["userid"]
+        return None
+
+    async def finalize_payments(self, payments: list[PaymentStatus]) -> list[dict]:
         """
-        q3 = """
-        INSERT INTO withdraw_transactions 
-        (txid_hex, vout, network, userid, amount, fee, ts_created)
-        SELECT %s, 0, 'LN', lp.userid, %s, %s, %s
-        FROM ln_payments AS lp
-        WHERE lp.payment_hash = %s
+        Set-based settlement of outgoing payments in one statement, payments
+        already final are skipped. Returns userid and payment_hash settled.
         """
-        q4 = """
-        UPDATE withdraw_requests AS wr
-        SET status = 'PAID'
-        FROM ln_payments AS lp
-        WHERE wr.k1 = lp.k1
-        AND lp.payment_hash = %s
+        q = """
+        WITH batch AS (
+            SELECT DISTINCT ON (payment_hash) *
+            FROM unnest(%s::bpchar[], %s::text[], %s::bigint[], %s::bigint[], %s::text[])
+            AS b(payment_hash, status, value_sat, fee_sat, preimage)
+        ), paid AS (
+            UPDATE ln_payments AS lp
+            SET fee_sat = batch.fee_sat,
+            status = batch.status
+            FROM batch
+            WHERE lp.payment_hash = batch.payment_hash
+            AND lp.status NOT IN ('SUCCEEDED', 'FAILED')
+            RETURNING lp.k1, lp.userid, lp.payment_hash, batch.status,
+            batch.value_sat, batch.fee_sat, batch.preimage
+        ), unlocked AS (
+            DELETE FROM locked_balances AS lb
+            USING paid
+            WHERE lb.k1 = paid.k1
+        ), withdrawal AS (
+            INSERT INTO withdraw_transactions
+            (txid_hex, vout, network, userid, amount, fee, ts_created)
+            SELECT paid.payment_hash, 0, 'LN', paid.userid, paid.value_sat, paid.fee_sat, %s
+            FROM paid
+        ), request AS (
+            UPDATE withdraw_requests AS wr
+            SET status = 'PAID'
+            FROM paid
+            WHERE wr.k1 = paid.k1
+        ), invoice AS (
+            UPDATE withdraw_invoices AS wi
+            SET preimage = paid.preimage,
+            state = paid.status
+            FROM paid
+            WHERE wi.payment_hash = paid.payment_hash
+        )
+        SELECT userid, payment_hash
+        FROM paid
+        """
+        if not payments:
+            return []
+        current_time = int(datetime.utcnow().timestamp())
+        return await self.fetchmany(q, [p.payment_hash for p in payments], [p.status for p in payments],
+                                    [p.value_sat for p in payments], [p.fee_sat for p in payments],
+                                    [p.payment_preimage for p in payments], current_time)
+
+    async def classify_payments(self, payments: list[PaymentStatus]) -> list[dict]:
         """
-        q5 = """
-        UPDATE withdraw_invoices
-        SET preimage = %s,
-        state = %s
-        WHERE payment_hash = %s
+        Classify node payments against the ledger in one query:
+        unknown (not ours), final (already settled or failed),
+        success / failure (needs transition) or pending
         """
-        current_time = int(datetime.utcnow().timestamp())
-        async with self.pool.connection() as conn:
-            await conn.set_autocommit(True)
-            async with conn.cursor(row_factory=dict_row) as cur:
-                async with conn.transaction():
-                    await cur.execute(q, (payment.fee_sat, payment.status, payment.payment_hash))
-                    await cur.execute(q2, (payment.payment_hash, ))
-                    await cur.execute(q3, (payment.payment_hash, payment.value_sat, payment.fee_sat, current_time, payment.payment_hash))
-                    await cur.execute(q4, (payment.payment_hash, ))
-                    await cur.execute(q5, (payment.payment_preimage, payment.status, payment.payment_hash, ))
-                return
+        q = """
+        SELECT b.payment_hash,
+        CASE
+            WHEN wi.payment_hash IS NULL OR lp.payment_hash IS NULL THEN 'unknown'
+            WHEN lp.status IN ('SUCCEEDED', 'FAILED') THEN 'final'
+            WHEN b.status = 'SUCCEEDED' THEN 'success'
+            WHEN b.status = 'FAILED' THEN 'failure'
+            ELSE 'pending'
+        END AS action
+        FROM unnest(%s::bpchar[], %s::text[]) AS b(payment_hash, status)
+        LEFT JOIN withdraw_invoices AS wi
+        ON wi.payment_hash = b.payment_hash
+        LEFT JOIN ln_payments AS lp
+        ON lp.payment_hash = b.payment_hash
+        """
+        if not payments:
+            return []
+        return await self.fetchmany(q, [p.payment_hash for p in payments], [p.status for p in payments])
+
+    async def reconcile_payments(self, payments: list[PaymentStatus]) -> dict:
+        """
+        Bulk apply node payment states to the ledger. Returns counts per
+        classification and refunds to cache.
+        """
+        classified = await self.classify_payments(payments)
+        actions = {c["payment_hash"]: c["action"] for c in classified}
+        counts = {"unknown": 0, "final": 0, "pending": 0, "success": 0, "failure": 0}
+        for action in actions.values():
+            counts[action] += 1
+        succeeded = [p for p in payments if actions.get(p.payment_hash) == "success"]
+        failed = [p for p in payments if actions.get(p.payment_hash) == "failure"]
+        paid = await self.finalize_payments(succeeded)
+        refunds = await self.fail_payments(failed)
+        counts["succeeded"] = len(paid)
+        counts["refunded"] = len(refunds)
+        return {"counts": counts, "refunds": refunds}
 
     async def get_payment_exists(self, payment: PaymentStatus) -> dict:
         q = """
@@ -293,52 +406,56 @@ class LNCrud(PSQLClient):
         exists = await self.fetchone(q, payment.payment_hash)
         return exists.get('exists', 0)
 
-    async def failed_payment(self, payment: PaymentStatus) -> dict:
-        q = """
-        UPDATE ln_payments
-        SET status = 'FAILED'
-        WHERE payment_hash = %s
-        """
-        q2 = """
-        DELETE FROM locked_balances
-        USING ln_payments
-        WHERE locked_balances.k1 = ln_payments.k1
-        AND ln_payments.payment_hash = %s
-        """
-        q3 = """
-        UPDATE balances
-        SET amount = balances.amount + lp.value_sat
-        FROM ln_payments AS lp
-        WHERE balances.userid = lp.userid
-        AND lp.payment_hash = %s
-        AND lp.status NOT IN ('SUCCEEDED', 'FAILED')
+    async def failed_payment(self, payment: PaymentStatus) -> str | None:
+        """Refund a single failed outgoing payment, returns userid refunded"""
+        refunds = await self.fail_payments([payment])
+        if refunds:
+            return refunds[0]["userid"]
+        return None
+
+    async def fail_payments(self, payments: list[PaymentStatus]) -> list[dict]:
         """
-        q4 = """
-        UPDATE withdraw_requests
-        SET status = 'PAYMENT_FAILED'
-        FROM ln_payments AS lp
-        WHERE withdraw_requests.k1 = lp.k1
-        AND lp.payment_hash = %s
+        Set-based refund of failed outgoing payments in one statement,
+        payments already final are skipped. Returns userid and total
+        amount refunded per user.
         """
-        q5 = """
-        SELECT wr.userid
-        FROM withdraw_requests AS wr
-        JOIN ln_payments AS lp
-        ON lp.k1 = wr.k1
-        WHERE lp.payment_hash = %s
-        AND lp.status NOT IN ('SUCCEEDED', 'FAILED')
-        """
-        async with self.pool.connection() as conn:
-            await conn.set_autocommit(True)
-            async with conn.cursor(row_factory=dict_row) as cur:
-                async with conn.transaction():
-                    await cur.execute(q3, (payment.payment_hash, ))                    
-                    await cur.execute(q5, (payment.payment_hash, ))
-                    userid = await cur.fetchone()                    
-                    await cur.execute(q2, (payment.payment_hash, ))
-                    await cur.execute(q4, (payment.payment_hash, ))
-                await cur.execute(q, (payment.payment_hash, ))
-                return userid
+        q = """
+        WITH batch AS (
+            SELECT DISTINCT payment_hash
+            FROM unnest(%s::bpchar[]) AS b(payment_hash)
+        ), failed AS (
+            UPDATE ln_payments AS lp
+            SET status = 'FAILED'
+            FROM batch
+            WHERE lp.payment_hash = batch.payment_hash
+            AND lp.status NOT IN ('SUCCEEDED', 'FAILED')
+            RETURNING lp.k1, lp.userid, lp.value_sat
+        ), unlocked AS (
+            DELETE FROM locked_balances AS lb
+            USING failed
+            WHERE lb.k1 = failed.k1
+        ), refunds AS (
+            SELECT userid, SUM(value_sat)::bigint AS amount
+            FROM failed
+            GROUP BY userid
+        ), refund AS (
+            UPDATE balances AS b
+            SET amount = b.amount + refunds.amount
+            FROM refunds
+            WHERE b.userid = refunds.userid
+            AND b.market = 'usd'
+        ), request AS (
+            UPDATE withdraw_requests AS wr
+            SET status = 'PAYMENT_FAILED'
+            FROM failed
+            WHERE wr.k1 = failed.k1
+        )
+        SELECT userid, amount
+        FROM refunds
+        """
+        if not payments:
+            return []
+        return await self.fetchmany(q, [p.payment_hash for p in payments])
     
     """
     DEPOSIT
@@ -377,50 +494,51 @@ class LNCrud(PSQLClient):
         return await self.execute(q, invoice)
     
     async def deposit_finalize(self, invoice: LNDInvoice) -> str | None:
-        q = """
-        UPDATE deposit_invoices
-        SET state = %s
-        WHERE payment_hash = %s
-        """
-        q2 = """
-        INSERT INTO deposit_transactions
-        (userid, network, txid_hex, vout, amount, ts_created)
-        SELECT u.userid, 'LN', %s, 0, %s, %s
-        FROM deposit_invoices AS di
-        JOIN users AS u
-        ON di.k1 = u.k1
-        WHERE di.payment_hash = %s
-        """
-        q3 = """
-        UPDATE balances AS b
-        SET amount = b.amount + %s
-        WHERE market = 'usd'
-        AND userid = (
-            SELECT u.userid 
-            FROM users AS u
-            JOIN deposit_invoices AS di
-            ON u.k1 = di.k1
-            WHERE di.payment_hash = %s
-            )
+        """Settle a single deposit invoice, returns userid credited"""
+        credits = await self.deposit_finalize_batch([invoice])
+        if credits:
+            return credits[0]["userid"]
+        return None
+
+    async def deposit_finalize_batch(self, invoices: list[LNDInvoice]) -> list[dict]:
         """
-        q4 = """
-        SELECT u.userid
-        FROM users AS u
-        JOIN deposit_invoices AS di
-        ON u.k1 = di.k1
-        WHERE di.payment_hash = %s
-        AND di.state NOT IN ('SETTLED', 'CANCELED')
+        Set-based settlement of deposit invoices in one statement. Invoices
+        already SETTLED or CANCELED are skipped. Returns userid and total
+        amount credited per user.
         """
+        q = """
+        WITH batch AS (
+            SELECT DISTINCT ON (payment_hash) payment_hash, state, amount
+            FROM unnest(%s::bpchar[], %s::text[], %s::bigint[]) AS b(payment_hash, state, amount)
+        ), settled AS (
+            UPDATE deposit_invoices AS di
+            SET state = batch.state
+            FROM batch, users AS u
+            WHERE di.payment_hash = batch.payment_hash
+            AND di.k1 = u.k1
+            AND di.state NOT IN ('SETTLED', 'CANCELED')
+            RETURNING u.userid, di.payment_hash, batch.amount
+        ), deposit AS (
+            INSERT INTO deposit_transactions
+            (userid, network, txid_hex, vout, amount, ts_created)
+            SELECT settled.userid, 'LN', settled.payment_hash, 0, settled.amount, %s
+            FROM settled
+        ), credits AS (
+            SELECT userid, SUM(amount)::bigint AS amount
+            FROM settled
+            GROUP BY userid
+        ), credit AS (
+            UPDATE balances AS b
+            SET amount = b.amount + credits.amount
+            FROM credits
+            WHERE b.userid = credits.userid
+            AND b.market = 'usd'
+        )
+        SELECT userid, amount
+        FROM credits
+        """
+        if not invoices:
+            return []
         current_time = int(datetime.utcnow().timestamp())
-        async with self.pool.connection() as conn:
-            async with conn.cursor(row_factory=dict_row) as cur:
-                async with conn.transaction():
-                    await cur.execute(q4, (invoice.payment_hash, ))
-                    userid = await cur.fetchone()                    
-                    await cur.execute(q, (invoice.state, invoice.payment_hash, ))
-                    await cur.execute(q2, (invoice.payment_hash, invoice.num_satoshis, current_time, invoice.payment_hash, ))
-                    await cur.execute(q3, (invoice.num_satoshis, invoice.payment_hash, ))
-                if userid is not None:
-                    return userid.get("userid")
-                return userid
-            
\ No newline at end of file
+        return await self.fetchmany(q, [i.payment_hash for i in invoices], [i.state for i in invoices],
+                                    [i.num_satoshis for i in invoices], current_time)
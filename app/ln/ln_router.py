@@ -1,6 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from redis import Redis
-import asyncio
+from redis.asyncio import Redis
 from psycopg import IntegrityError
 from typing import Annotated
 from datetime import datetime
@@ -11,12 +10,13 @@ from ..connections import psql_pool, get_redis_connection, logger, node
 from ..user.base import TokenData, WithdrawRequest
 from .lnurl import LnurlPayResponse, PayRequestMetadata, LnurlPayActionResponse, MessageAction, encode, LnurlErrorResponse, LnurlSuccessResponse, LnurlWithdrawResponse, CreateLnurlResponse
 from .crud import LNCrud
+from .payouts import payouts
 
 
 SCHEMA = os.getenv("SCHEMA")
 DOMAIN = os.getenv("DOMAIN")
 MIN_AVAIL = os.getenv("LN_MIN_AVAIL")
-FEE_LIMIT_SAT = os.getenv("FEE_LIMIT_SAT")
+FEE_LIMIT_SAT = os.getenv("FEE_LIMIT_SAT", 500)
 
 MIN_SENDABLE = 1000 * 1000   # 0.45
 MAX_SENDABLE = 500000 * 1000 # 5*45.0=220
@@ -37,7 +37,7 @@ async def ln_withdraw_request(
     if token_data is None:
         raise HTTPException(status_code=400, detail="Invalid token")        
     # verify balance
-    available_r = redis_conn.hget(f"{token_data.userid}::session", "balances")
+    available_r = await redis_conn.hget(f"{token_data.userid}::session", "balances")
     if available_r is None:
         raise HTTPException(status_code=400, detail="Invalid token")
     available_db = await psql.get_user_balances(token_data.userid)
@@ -66,7 +66,7 @@ async def ln_withdraw_request(
         ts_created=int(datetime.utcnow().timestamp()))
     await psql.create_withdraw_request(req)
     # timer
-    redis_conn.set(random_k1_value, value=token_data.userid, ex=600)
+    await redis_conn.set(random_k1_value, value=token_data.userid, ex=600)
 
     return CreateLnurlResponse(lnurl=lnurl_legacy, lnurlw=lnurlw)
 
@@ -79,7 +79,7 @@ async def lnurlw_callback(
     redis_conn: Redis = Depends(get_redis_connection)
     ) -> LnurlWithdrawResponse | LnurlErrorResponse:
     # request valid for 10 minutes
-    exists = redis_conn.exists(k1)
+    exists = await redis_conn.exists(k1)
     if not exists:
         return LnurlErrorResponse(reason="Request expired")
     # get WithdrawRequest from db
@@ -87,7 +87,7 @@ async def lnurlw_callback(
     if not (request is not None and request.status == "CREATED"):
         return LnurlErrorResponse(reason="Invalid withdraw request")
     request: WithdrawRequest
-    balance_r = redis_conn.hget(f"{request.userid}::session", "balances")
+    balance_r = await redis_conn.hget(f"{request.userid}::session", "balances")
     balance_db = await psql.get_user_balances(request.userid)
     balance = min(int(balance_r), balance_db)
     if balance is None:
@@ -116,7 +116,7 @@ async def ln_withdraw(
     pr: str,
     redis_conn: Redis = Depends(get_redis_connection),
     ) -> LnurlSuccessResponse | LnurlErrorResponse:
-    userid = redis_conn.get(k1)
+    userid = await redis_conn.get(k1)
     if userid is None:
         await psql.update_withdraw_status(k1=k1, status="EXPIRED", reason="")
         return LnurlErrorResponse(reason="Request expired")
@@ -125,7 +125,7 @@ async def ln_withdraw(
     if decoded_invoice is None:
         return LnurlErrorResponse(reason="Invoice decode error")
     decoded_invoice.k1 = k1
-    balance_r = redis_conn.hget(f"{userid}::session", "balances")
+    balance_r = await redis_conn.hget(f"{userid}::session", "balances")
     if balance_r is None:
         await psql.update_withdraw_status(k1=k1, status="REJECTED", reason="No session")
         return LnurlErrorResponse(reason="Authentication error")
@@ -135,16 +135,16 @@ async def ln_withdraw(
         await psql.update_withdraw_status(k1=k1, status="REJECTED", reason="Insufficient balance")
         return LnurlErrorResponse(reason="Insufficient balance")
     try:
-        request = await psql.withdraw_redeem_request(k1, decoded_invoice)
+        request = await psql.withdraw_redeem_request(k1, decoded_invoice, int(FEE_LIMIT_SAT))
     except IntegrityError:
         logger.exception({"error": "Redeem error. Duplicate invoice"})
         await psql.update_withdraw_status(k1=k1, status="REJECTED", reason="Duplicate invoice")
         return LnurlErrorResponse(reason="Invalid request")
     if request is None:
         return LnurlErrorResponse(reason="Invalid request")
-    redis_conn.hincrby(userid+"::session", "balances", decoded_invoice.num_satoshis)
-    # pay async as per lnurl
-    asyncio.create_task(node.pay_invoice(decoded_invoice.bolt11, FEE_LIMIT_SAT))
+    await redis_conn.hincrby(userid+"::session", "balances", -decoded_invoice.num_satoshis)
+    # payout queued with the redeem, paid async as per lnurl
+    payouts.notify()
     return LnurlSuccessResponse()
 
 
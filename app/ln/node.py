@@ -19,11 +19,39 @@ from typing import AsyncGenerator, Dict, Optional
 import httpx
 from typing import Optional
 import os
+from . import bolt11
 
 
 MACAROON_PATH = os.getenv("MACAROON_PATH")
 CERT_PATH = os.getenv("CERT_PATH")
 LND_HOST = os.getenv("LND_HOST")
+LND_PAGE_SIZE = int(os.getenv("LND_PAGE_SIZE", 1000))
+# chain of the node, invoices for other chains are rejected
+NETWORK = os.getenv("NETWORK")
+
+
+def parse_invoice(data: dict) -> LNDInvoice:
+    """LND lnrpc.Invoice json to LNDInvoice"""
+    payment_hash = base64.b64decode(data["r_hash"]).hex()
+    return LNDInvoice(
+        payment_hash=payment_hash,
+        bolt11=data["payment_request"],
+        preimage=data["r_preimage"],
+        state=data["state"],
+        destination=data["payment_addr"],
+        num_satoshis=data["value"],
+        timestamp=data["creation_date"],
+        expiry=data["expiry"],
+        description=data["memo"],
+        description_hash=data["description_hash"],
+        fallback_addr=data["fallback_addr"],
+        cltv_expiry=data["cltv_expiry"],
+        route_hints=data["route_hints"],
+        payment_addr=data["payment_addr"],
+        features=data["features"],
+        add_index=data["add_index"],
+        settle_index=data.get("settle_index"),
+    )
 
 
 def fee_reserve(amount_msat: int) -> int:
@@ -131,7 +159,10 @@ class LndRestNode:
         if r.is_error:
             return None
         data = r.json()
+        # decoded locally, saves the /v1/payreq round trip
         decoded_invoice = await self.decode_invoice(data["payment_request"])
+        if decoded_invoice is None:
+            return None
         decoded_invoice.add_index = data["add_index"]
         return decoded_invoice
 
@@ -154,6 +185,70 @@ class LndRestNode:
         preimage = base64.b64decode(data["payment_preimage"]).hex()
         return PaymentResponse(True, payment_hash, fee_msat, preimage, None)
 
+    async def send_payment(self, bolt11: str, fee_limit_sat: int, timeout_seconds: int = 60) -> tuple[PaymentStatus | None, str | None]:
+        """
+        Pay through the streaming routerrpc.SendPaymentV2 endpoint.
+        Returns (final payment status, None) or (None, error message) when
+        LND refused the payment or the outcome is not known.
+        """
+        data = {
+            "payment_request": bolt11,
+            "fee_limit_sat": str(fee_limit_sat),
+            "timeout_seconds": timeout_seconds,
+            "no_inflight_updates": True,
+        }
+        async with self.client.stream("POST", "/v2/router/send", json=data, timeout=timeout_seconds + 30) as r:
+            async for json_line in r.aiter_lines():
+                try:
+                    line = json.loads(json_line)
+                except json.JSONDecodeError:
+                    continue
+                if line.get("error"):
+                    return None, str(line["error"].get("message", line["error"]))
+                payment = line.get("result")
+                if payment is None or payment.get("status") not in ("SUCCEEDED", "FAILED"):
+                    continue
+                return PaymentStatus(
+                    payment_hash=payment["payment_hash"],
+                    payment_preimage=payment.get("payment_preimage"),
+                    value_sat=payment.get("value_sat"),
+                    status=payment["status"],
+                    fee_sat=payment.get("fee_sat"),
+                ), None
+        return None, "Payment stream closed without final status"
+
+    async def track_payment(self, payment_hash: str, timeout_seconds: int = 30) -> PaymentStatus | None:
+        """
+        Current state of an outgoing payment from routerrpc.TrackPaymentV2.
+        Returns None when LND has no payment for payment_hash, raises when
+        LND can not be asked.
+        """
+        path_hash = base64.urlsafe_b64encode(bytes.fromhex(payment_hash)).decode("ascii")
+        params = {"no_inflight_updates": "false"}
+        async with self.client.stream("GET", f"/v2/router/track/{path_hash}", params=params, timeout=timeout_seconds) as r:
+            async for json_line in r.aiter_lines():
+                try:
+                    line = json.loads(json_line)
+                except json.JSONDecodeError:
+                    continue
+                if line.get("error"):
+                    # grpc NOT_FOUND, "payment isn't initiated"
+                    if line["error"].get("code") == 5:
+                        return None
+                    raise httpx.HTTPError(str(line["error"].get("message", line["error"])))
+                payment = line.get("result")
+                if payment is None or not payment.get("status"):
+                    continue
+                # first update is the state the payment is in now
+                return PaymentStatus(
+                    payment_hash=payment["payment_hash"],
+                    payment_preimage=payment.get("payment_preimage"),
+                    value_sat=payment.get("value_sat"),
+                    status=payment["status"],
+                    fee_sat=payment.get("fee_sat"),
+                )
+        raise httpx.HTTPError("Track stream closed without payment state")
+
     async def get_invoice_status(self, payment_hash: str) -> PaymentStatus:
         r = await self.client.get(url=f"/v1/invoice/{payment_hash}")
 
@@ -202,61 +297,54 @@ class LndRestNode:
                     continue
         return PaymentStatus(None)
 
-    async def list_payments(self, latest_ts: str) -> list[LNPayment]:
-        url = "/v1/payments?creation_date_start="+latest_ts
-        r = await self.client.get(url)
-        if r.is_error:
-            error_message = r.text
-            return None
-        try:
+    async def list_payments(self, latest_ts: int, page_size: int = LND_PAGE_SIZE) -> AsyncGenerator[LNPayment, None]:
+        """
+        Payments created since latest_ts, fetched page by page
+        through index_offset / max_payments and yielded lazily
+        """
+        index_offset = 0
+        while True:
+            params = {
+                "creation_date_start": str(latest_ts or 0),
+                "include_incomplete": "true",
+                "index_offset": str(index_offset),
+                "max_payments": str(page_size),
+            }
+            r = await self.client.get("/v1/payments", params=params)
+            r.raise_for_status()
             response = r.json()
-            all_payments = []
-            for data in response["payments"]:
-                payment = LNPayment(
+            payments = response.get("payments", [])
+            for data in payments:
+                yield LNPayment(
                     payment_hash=data["payment_hash"],
                     payment_preimage=data["payment_preimage"],
                     value_sat=data["value_sat"],
                     status=data["status"],
                     fee_sat=data["fee_sat"],
-                    ts_created=int(data["creation_time_ns"] / 1000000000),
+                    ts_created=int(int(data["creation_time_ns"]) / 1000000000),
                     failure_reason=data["failure_reason"]
                 )
-                all_payments.append(payment)
-            return all_payments
-        except Exception as e:
-            return None
-
+            if len(payments) < page_size:
+                return
+            index_offset = int(response["last_index_offset"])
 
-    async def paid_invoices_stream(self, idx: int = 0) -> AsyncGenerator[LNDInvoice, None]:
+    async def paid_invoices_stream(self, settle_index: int = 0) -> AsyncGenerator[LNDInvoice, None]:
+        """
+        Invoice updates, LND first replays invoices settled after settle_index.
+        Reconnects resume from the last settle_index yielded.
+        """
         while True:
             try:
-                url = "/v1/invoices/subscribe?add_index="+str(idx)
+                url = "/v1/invoices/subscribe?settle_index="+str(settle_index)
                 async with self.client.stream("GET", url, timeout=None) as r:
                     async for line in r.aiter_lines():
                         try:
                             data = json.loads(line)["result"]
                         except Exception:
                             continue
-                        payment_hash = base64.b64decode(data["r_hash"]).hex()
-                        data["decoded_hash"] = payment_hash
-                        invoice = LNDInvoice(
-                            payment_hash=payment_hash,
-                            bolt11=data["payment_request"],
-                            preimage=data["r_preimage"],
-                            state=data["state"],
-                            destination=data["payment_addr"],
-                            num_satoshis=data["value"],
-                            timestamp=data["creation_date"],
-                            expiry=data["expiry"],
-                            description=data["memo"],
-                            description_hash=data["description_hash"],
-                            fallback_addr=data["fallback_addr"],
-                            cltv_expiry=data["cltv_expiry"],
-                            route_hints=data["route_hints"],
-                            payment_addr=data["payment_addr"],
-                            features=data["features"],
-                            add_index=data["add_index"],
-                        )
+                        invoice = parse_invoice(data)
+                        if invoice.settle_index:
+                            settle_index = max(settle_index, invoice.settle_index)
                         yield invoice
             except Exception as exc:
                 await asyncio.sleep(5)
@@ -278,19 +366,11 @@ class LndRestNode:
                 await asyncio.sleep(5)
 
     async def decode_invoice(self, pay_req: str) -> LNDInvoice | None:
-        url = "v1/payreq/"+pay_req
-        r = await self.client.get(url)
-        if r.is_error:
-            error_message = r.json().get("payment_error") or r.text
-            return None
+        """Decode and verify bolt11 locally, see bolt11.decode"""
         try:
-            data = r.json()
-            invoice = LNDInvoice(**data)
-            invoice.bolt11 = pay_req
-            invoice.state = "ACCEPTED"
-        except Exception as e:
+            return bolt11.decode(pay_req, NETWORK)
+        except bolt11.Bolt11Error:
             return None
-        return invoice
 
     async def get_peer_ids(self) -> list[str]:
         response = await self.client.get("/v1/peers")
@@ -319,31 +399,23 @@ class LndRestNode:
                 except Exception as e:
                     continue
     
-    async def scan_invoices(self, idx=0) -> list[LNDInvoice]:
-        url = "/v1/invoices?index_offset="+str(idx)
-        response = await self.client.get(url)
-        all_payments = []
-        if response.status_code == 200:
-            for data in response.json().get("invoices", []):
-                payment_hash = base64.b64decode(data["r_hash"]).hex()
-                data["decoded_hash"] = payment_hash
-                invoice = LNDInvoice(
-                    payment_hash=payment_hash,
-                    bolt11=data["payment_request"],
-                    preimage=data["r_preimage"],
-                    state=data["state"],
-                    destination=data["payment_addr"],
-                    num_satoshis=data["value"],
-                    timestamp=data["creation_date"],
-                    expiry=data["expiry"],
-                    description=data["memo"],
-                    description_hash=data["description_hash"],
-                    fallback_addr=data["fallback_addr"],
-                    cltv_expiry=data["cltv_expiry"],
-                    route_hints=data["route_hints"],
-                    payment_addr=data["payment_addr"],
-                    features=data["features"],
-                    add_index=data["add_index"],
-                )
-                all_payments.append(invoice)
-        return all_payments
\ No newline at end of file
+    async def scan_invoices(self, idx: int = 0, page_size: int = LND_PAGE_SIZE) -> AsyncGenerator[LNDInvoice, None]:
+        """
+        Invoices added after add_index idx, fetched page by page
+        through index_offset / num_max_invoices and yielded lazily
+        """
+        index_offset = idx
+        while True:
+            params = {
+                "index_offset": str(index_offset),
+                "num_max_invoices": str(page_size),
+            }
+            r = await self.client.get("/v1/invoices", params=params)
+            r.raise_for_status()
+            response = r.json()
+            invoices = response.get("invoices", [])
+            for data in invoices:
+                yield parse_invoice(data)
+            if len(invoices) < page_size:
+                return
+            index_offset = int(response["last_index_offset"])
@@ -0,0 +1,150 @@
+"""
+LN payout workers
+
+Redeemed withdrawals are queued in ln_payouts in the same transaction
+that locks the balance. A fixed number of workers claim them and pay
+through SendPaymentV2, so a burst of withdrawals is bounded by
+LN_PAYOUT_WORKERS in-flight payments instead of one task per request.
+"""
+
+import asyncio
+import os
+import time
+from ..connections import logger, node, psql_pool
+from .base import PaymentStatus
+from .crud import LNCrud
+from .node import LndRestNode
+from .settlement import apply_committed_credits
+
+
+LN_PAYOUT_WORKERS = int(os.getenv("LN_PAYOUT_WORKERS", 4))
+LN_PAYOUT_TIMEOUT = int(os.getenv("LN_PAYOUT_TIMEOUT", 60))
+LN_PAYOUT_POLL_S = float(os.getenv("LN_PAYOUT_POLL_S", 5))
+
+
+class PayoutWorkerPool:
+    """
+    Fixed-size pool paying queued withdrawals. Final results go through
+    finalize_payment / fail_payments. When SendPaymentV2 gives no final
+    status the payment is looked up in LND, only payments still in flight
+    are left to the payment tracker and startup reconciliation.
+    """
+    def __init__(self, psql: LNCrud, node: LndRestNode,
+                 workers: int = LN_PAYOUT_WORKERS,
+                 timeout_seconds: int = LN_PAYOUT_TIMEOUT,
+                 poll_interval: float = LN_PAYOUT_POLL_S):
+        self.psql = psql
+        self.node = node
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+        self.poll_interval = poll_interval
+        self.wakeup = asyncio.Event()
+        self.started = time.monotonic()
+        # metrics
+        self.in_flight = 0
+        self.sent = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.unknown = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def notify(self):
+        """Wake idle workers, called after a withdrawal is queued"""
+        self.wakeup.set()
+
+    async def run(self):
+        await self.psql.requeue_payouts()
+        self.started = time.monotonic()
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+
+    async def worker(self):
+        while True:
+            payouts = await self.psql.claim_payouts(1)
+            if not payouts:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.pay(payouts[0])
+
+    async def pay(self, payout: dict):
+        payment_hash = payout["payment_hash"]
+        start = time.monotonic()
+        self.in_flight += 1
+        try:
+            status, error = await self.node.send_payment(payout["bolt11"], payout["fee_limit_sat"], self.timeout_seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            status, error = None, str(exc)
+        finally:
+            self.in_flight -= 1
+        latency = time.monotonic() - start
+        self.sent += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+        if status is None:
+            status, found = await self.lookup(payment_hash)
+            if not found:
+                # LND never started the payment, safe to refund
+                status = PaymentStatus(payment_hash=payment_hash, payment_preimage=None,
+                                       value_sat=None, status="FAILED", fee_sat=None)
+
+        if status is not None and status.status == "SUCCEEDED":
+            self.succeeded += 1
+            await self.psql.finalize_payment(status)
+            await self.psql.update_payout_status(payment_hash, "SUCCEEDED")
+        elif status is not None and status.status == "FAILED":
+            self.failed += 1
+            refunds = await self.psql.fail_payments([status])
+            if refunds:
+                await apply_committed_credits(refunds)
+            await self.psql.update_payout_status(payment_hash, "FAILED", error)
+        else:
+            # still in flight or LND unreachable, never refund here
+            self.unknown += 1
+            logger.error({"error": "LN payout without final status", "payment_hash": payment_hash, "message": error})
+            await self.psql.update_payout_status(payment_hash, "UNKNOWN", error)
+        logger.debug({"event": "LN payout", "payment_hash": payment_hash,
+                      "latency_s": round(latency, 3), "stats": self.stats()})
+
+    async def lookup(self, payment_hash: str) -> tuple[PaymentStatus | None, bool]:
+        """
+        State of a payment SendPaymentV2 gave no final status for.
+        Returns (status, found), found is False only when LND answered
+        that it has no payment for the hash.
+        """
+        try:
+            status = await self.node.track_payment(payment_hash)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception({"error": "LN payout lookup failed", "payment_hash": payment_hash})
+            return None, True
+        return status, status is not None
+
+    def stats(self) -> dict:
+        uptime = time.monotonic() - self.started
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "unknown": self.unknown,
+            "avg_latency_s": round(self.latency_total / self.sent, 3) if self.sent else 0,
+            "max_latency_s": round(self.latency_max, 3),
+            "payments_per_min": round(self.sent / uptime * 60, 2) if uptime > 0 else 0,
+        }
+
+
+payouts = PayoutWorkerPool(LNCrud(psql_pool), node)
@@ -0,0 +1,128 @@
+"""
+Micro-batched deposit settlement
+"""
+
+import asyncio
+import os
+from ..connections import get_redis_connection, logger
+from .base import LNDInvoice
+from .crud import LNCrud
+
+
+SETTLE_QUEUE_SIZE = int(os.getenv("SETTLE_QUEUE_SIZE", 10000))
+SETTLE_BATCH_SIZE = int(os.getenv("SETTLE_BATCH_SIZE", 500))
+SETTLE_BATCH_MS = int(os.getenv("SETTLE_BATCH_MS", 50))
+
+
+async def apply_credits(credits: list[dict]):
+    """Cache balance increments of a settled batch in one redis round trip"""
+    if not credits:
+        return
+    async for redis_conn in get_redis_connection():
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            for credit in credits:
+                pipe.hincrby(credit["userid"]+"::session", "balances", credit["amount"])
+            await pipe.execute()
+
+
+async def apply_committed_credits(credits: list[dict], delay: int = 5):
+    """
+    apply_credits for credits already committed in the database, retried
+    until redis takes them: the database step would not return them again.
+    """
+    while True:
+        try:
+            return await apply_credits(credits)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception({"error": "Caching committed credits failed", "count": len(credits)})
+            await asyncio.sleep(delay)
+
+
+class SettlementBatcher:
+    """
+    Bounded queue between the LND invoice stream and the database.
+    Reader awaits put (backpressure when full), writer drains up to
+    batch_size events or batch_ms and settles them in one statement.
+    """
+    def __init__(self, psql: LNCrud, stream: str,
+                 queue_size: int = SETTLE_QUEUE_SIZE,
+                 batch_size: int = SETTLE_BATCH_SIZE,
+                 batch_ms: int = SETTLE_BATCH_MS):
+        self.psql = psql
+        self.stream = stream
+        self.queue: asyncio.Queue[LNDInvoice] = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.batch_timeout = batch_ms / 1000
+        # metrics
+        self.batches = 0
+        self.events = 0
+        self.settled = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+
+    async def put(self, invoice: LNDInvoice):
+        await self.queue.put(invoice)
+
+    async def run(self):
+        while True:
+            batch = await self.next_batch()
+            while True:
+                try:
+                    await self.settle(batch)
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # keep the batch, checkpoint was not advanced
+                    logger.exception({"error": "Deposit batch settlement failed", "size": len(batch)})
+                    await asyncio.sleep(5)
+            for _ in batch:
+                self.queue.task_done()
+
+    async def next_batch(self) -> list[LNDInvoice]:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_timeout
+        while len(batch) < self.batch_size:
+            # take what is already queued without waiting
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def settle(self, batch: list[LNDInvoice]):
+        settled = [i for i in batch if i.state == "SETTLED"]
+        credits = await self.psql.deposit_finalize_batch(settled)
+        await apply_committed_credits(credits)
+        # advance after the batch is committed
+        add_index = max(i.add_index or 0 for i in batch)
+        settle_index = max(i.settle_index or 0 for i in batch)
+        await self.psql.update_stream_checkpoint(self.stream, add_index, settle_index)
+        self.batches += 1
+        self.events += len(batch)
+        self.settled += len(settled)
+        self.last_batch_size = len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        if settled:
+            logger.debug({"event": "Deposit batch settled", "stats": self.stats()})
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "batches": self.batches,
+            "events": self.events,
+            "settled": self.settled,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": round(self.events / self.batches, 2) if self.batches else 0,
+        }
@@ -1,63 +1,80 @@
 from ..connections import get_redis_connection, logger, node, psql_pool
 from .crud import LNCrud
 from .base import PaymentStatus
+from .settlement import SettlementBatcher, apply_credits, apply_committed_credits
+from .node import LND_PAGE_SIZE
+import asyncio
+import time
 import psycopg.errors
 
 
 psql = LNCrud(psql_pool)
 
+INVOICE_STREAM = "deposit_invoices"
+settlement = SettlementBatcher(psql, INVOICE_STREAM)
 
-async def load_deposit_invoices():
-    max_index = await psql.get_max_issued_add_index()
-    all_payments = await node.scan_invoices(max_index)
-    for invoice in all_payments:
+
+async def load_deposit_invoices() -> int:
+    """
+    Catch up on invoices added since the checkpoint add_index.
+    Returns settle_index the subscription should resume from.
+    """
+    checkpoint = await psql.get_stream_checkpoint(INVOICE_STREAM)
+    add_index = checkpoint["add_index"]
+    settle_index = checkpoint["settle_index"]
+    settled = []
+    async for invoice in node.scan_invoices(add_index):
+        add_index = max(add_index, invoice.add_index or 0)
+        # invoices below the scan offset may have settled meanwhile, settle_index
+        # can only be taken from a full scan, otherwise replay from the old one
+        if checkpoint["add_index"] == 0:
+            settle_index = max(settle_index, invoice.settle_index or 0)
         if invoice.state == "SETTLED":
-            try:
-                # get userid associated with payment_hash
-                userid = await psql.deposit_finalize(invoice)
-                if userid is None:
-                    continue
-                # cache balance transaction
-                async for redis_conn in get_redis_connection():
-                    redis_conn.hincrby(userid+"::session", "balances", invoice.num_satoshis)
-            # abort transaction if deposit already redeemed
-            except psycopg.errors.IntegrityError as e:
-                pass
+            settled.append(invoice)
+        if len(settled) >= settlement.batch_size:
+            await apply_committed_credits(await psql.deposit_finalize_batch(settled))
+            settled = []
+    # cache balance transactions
+    await apply_committed_credits(await psql.deposit_finalize_batch(settled))
+    await psql.update_stream_checkpoint(INVOICE_STREAM, add_index, settle_index)
+    return settle_index
 
 
 async def load_ln_payments():
+    """Reconcile payments made while offline in bulk"""
+    start = time.perf_counter()
     # get latest payments
     latest_ts = await psql.get_latest_ln_payment()
-    all_payments = await node.list_payments(latest_ts)
-    for payment in all_payments:
-        # check if payment belongs to withdraw invoice
-        exists = await psql.get_withdraw_invoice_exists(payment)
-        # payment without associated invoice
-        if not exists:
-            logger.info({"event": "outgoing_payment", "body": {"payment_hash": payment.payment_hash, "msg": "No invoice"}})
-            continue
-        status = PaymentStatus(
+    counts = {}
+    total = 0
+    statuses = []
+
+    async def reconcile():
+        result = await psql.reconcile_payments(statuses)
+        # refund cache balances of failed payments
+        await apply_credits(result["refunds"])
+        for k, v in result["counts"].items():
+            counts[k] = counts.get(k, 0) + v
+
+    async for payment in node.list_payments(latest_ts):
+        statuses.append(PaymentStatus(
             payment_hash=payment.payment_hash,
             payment_preimage=payment.payment_preimage,
             value_sat=payment.value_sat,
             status=payment.status,
-            fee_sat=payment.fee_sat)
-        exists = await psql.get_payment_exists(status)
-        if exists: continue        
-        if status.status == "SUCCEEDED":
-            # move amount from locked_balances to withdraw_transaction using payment_hash
-            try:
-                await psql.finalize_payment(status)
-            except psycopg.errors.IntegrityError as e:
-                logger.exception({"error": "Duplicate payment entry. Failed", "payment_hash": status.payment_hash})
-        elif status.status == "FAILED":
-            userid = await psql.failed_payment(status)
-            if userid is not None:
-                async for redis_conn in get_redis_connection():
-                    redis_conn.hincrby(userid+"::session", "balances", status.value_sat)
+            fee_sat=payment.fee_sat))
+        total += 1
+        if len(statuses) >= LND_PAGE_SIZE:
+            await reconcile()
+            statuses = []
+    await reconcile()
+    logger.info({"event": "ln_payments_reconciled", "total": total, "counts": counts,
+                 "duration_s": round(time.perf_counter() - start, 3)})
 
 
 async def process_payment_notifications():
+    # catch up on payments finished while offline
+    await load_ln_payments()
     async for status in node.track_payments():
         exists = await psql.get_payment_exists(status)
         if exists:
@@ -74,29 +91,22 @@ async def process_payment_notifications():
             if userid is not None:
                 # if userid not redeemed increase cache balance by failed amount
                 async for redis_conn in get_redis_connection():
-                    redis_conn.hincrby(userid+"::session", "balances", status.value_sat)
+                    await redis_conn.hincrby(userid+"::session", "balances", status.value_sat)
             else:
                 logger.error({"error": "Duplicate ln payment entry. Failed", "payment_hash": status.payment_hash})
 
 
 async def process_invoice_notifications():
-    # get index of latest invoice that has status finalized
-    await load_deposit_invoices()
-    idx = await psql.get_max_issued_add_index()
+    # catch up from checkpoint add_index
+    settle_index = await load_deposit_invoices()
     # Deposit notifications
     # tracks issued invoices
     # notification on create, and state updates
-    # by providing add_index can catch up to missed invoice updates
-    idx = 0
-    async for invoice in node.paid_invoices_stream(idx):
-        if invoice.state == "SETTLED":
-            try:
-                # get userid associated with payment_hash
-                userid = await psql.deposit_finalize(invoice)
-                if userid is None:
-                    continue
-                async for redis_conn in get_redis_connection():
-                    redis_conn.hincrby(userid+"::session", "balances", invoice.num_satoshis)
-            # abort transaction if deposit already redeemed
-            except psycopg.errors.IntegrityError as e:
-                logger.error({"error": "Duplicate deposit entry", "payment_hash": invoice.payment_hash})
+    # by providing settle_index LND replays settlements missed while offline
+    writer = asyncio.create_task(settlement.run())
+    try:
+        # settled in batches, checkpoint advanced per committed batch
+        async for invoice in node.paid_invoices_stream(settle_index):
+            await settlement.put(invoice)
+    finally:
+        writer.cancel()
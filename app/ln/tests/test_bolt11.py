@@ -0,0 +1,93 @@
+import hashlib
+import unittest
+
+from app.ln import bolt11
+
+
+# BOLT11 specification test vectors
+# https://github.com/lightning/bolts/blob/master/11-payment-encoding.md#examples
+PAYEE = "03e7156ae33b0a208d0744199163177e909e80176e55d97a2f221ede0f934dd9ad"
+PAYMENT_HASH = "0001020304050607080900010203040506070809000102030405060708090102"
+DESCRIPTION_HASH = hashlib.sha256(
+    b"One piece of chocolate cake, one icecream cone, one pickle, one slice of swiss cheese, "
+    b"one slice of salami, one lollypop, one piece of cherry pie, one sausage, one cupcake, "
+    b"and one slice of watermelon").hexdigest()
+
+DONATION = ("lnbc1pvjluezsp5zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zygspp5qqqsyqcyq5rqwzqfqqqsyqcyq5r"
+            "qwzqfqqqsyqcyq5rqwzqfqypqdpl2pkx2ctnv5sxxmmwwd5kgetjypeh2ursdae8g6twvus8g6rfwvs8qun0dfjkxaq9qrsgq"
+            "357wnc5r2ueh7ck6q93dj32dlqnls087fxdwk8qakdyafkq3yap9us6v52vjjsrvywa6rt52cm9r9zqt8r2t7mlcwspyetp5"
+            "h2tztugp9lfyql")
+COFFEE = ("lnbc2500u1pvjluezsp5zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zygspp5qqqsyqcyq5rqwzqfqqqsyq"
+          "cyq5rqwzqfqqqsyqcyq5rqwzqfqypqdq5xysxxatsyp3k7enxv4jsxqzpu9qrsgquk0rl77nj30yxdy8j9vdx85fkpmdla2087"
+          "ne0xh8nhedh8w27kyke0lp53ut353s06fv3qfegext0eh0ymjpf39tuven09sam30g4vgpfna3rh")
+HASHED_DESCRIPTION = ("lnbc20m1pvjluezsp5zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zygspp5qqqsyqcyq5rqwz"
+                      "qfqqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqypqhp58yjmdan79s6qqdhdzgynm4zwqd5d7xmw5fk98klysy043l2ah"
+                      "rqs9qrsgq7ea976txfraylvgzuxs8kgcw23ezlrszfnh8r6qtfpr6cxga50aj6txm9rxrydzd06dfeawfk6swupvz4"
+                      "erwnyutnjq7x39ymw6j38gp7ynn44")
+ROUTE_HINTS = ("lnbc20m1pvjluezsp5zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zygspp5qqqsyqcyq5rqwzqfqq"
+               "qsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqypqhp58yjmdan79s6qqdhdzgynm4zwqd5d7xmw5fk98klysy043l2ahrqsfpp3qj"
+               "mp7lwpagxun9pygexvgpjdc4jdj85fr9yq20q82gphp2nflc7jtzrcazrra7wwgzxqc8u7754cdlpfrmccae92qgzqvzq2p"
+               "s8pqqqqqqpqqqqq9qqqvpeuqafqxu92d8lr6fvg0r5gv0heeeqgcrqlnm6jhphu9y00rrhy4grqszsvpcgpy9qqqqqqgqqq"
+               "qq7qqzq9qrsgqdfjcdk6w3ak5pca9hwfwfh63zrrz06wwfya0ydlzpgzxkn5xagsqz7x9j4jwe7yj7vaf2k9lqsdk45kts2"
+               "fd0fkr28am0u4w95tt2nsq76cqw0")
+TESTNET_FALLBACK = ("lntb20m1pvjluezsp5zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zyg3zygshp58yjmdan79s6qqdhdzg"
+                    "ynm4zwqd5d7xmw5fk98klysy043l2ahrqspp5qqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqqqsyqcyq5rqwzqfqypqfpp"
+                    "3x9et2e20v6pu37c5d9vax37wxq72un989qrsgqdj545axuxtnfemtpwkc45hx9d2ft7x04mt8q7y6t0k2dge9e7h8kp"
+                    "y9p34ytyslj3yu569aalz2xdk8xkd7ltxqld94u8h2esmsmacgpghe9k8")
+
+
+class Test_Bolt11(unittest.TestCase):
+    def test_donation(self):
+        invoice = bolt11.decode(DONATION)
+        self.assertEqual(invoice.destination, PAYEE)
+        self.assertEqual(invoice.payment_hash, PAYMENT_HASH)
+        self.assertEqual(invoice.description, "Please consider supporting this project")
+        self.assertEqual(invoice.num_satoshis, 0)
+        self.assertEqual(invoice.expiry, "3600")
+        self.assertEqual(invoice.bolt11, DONATION)
+
+    def test_amount_and_expiry(self):
+        invoice = bolt11.decode(COFFEE)
+        self.assertEqual(invoice.num_satoshis, 250000)
+        self.assertEqual(invoice.description, "1 cup coffee")
+        self.assertEqual(invoice.expiry, "60")
+        self.assertEqual(invoice.timestamp, "1496314658")
+
+    def test_description_hash(self):
+        invoice = bolt11.decode(HASHED_DESCRIPTION)
+        self.assertEqual(invoice.num_satoshis, 2000000)
+        self.assertEqual(invoice.description_hash, DESCRIPTION_HASH)
+        self.assertEqual(invoice.destination, PAYEE)
+
+    def test_fallback_and_route_hints(self):
+        invoice = bolt11.decode(ROUTE_HINTS)
+        self.assertEqual(invoice.fallback_addr, "1RustyRX2oai4EYYDpQGWvEL62BBGqN9T")
+        self.assertIn("029e03a901b85534ff1e92c43c74431f7ce72046060fcf7a95c37e148f78c77255", invoice.route_hints)
+        self.assertIn("039e03a901b85534ff1e92c43c74431f7ce72046060fcf7a95c37e148f78c77255", invoice.route_hints)
+
+    def test_testnet_fallback(self):
+        invoice = bolt11.decode(TESTNET_FALLBACK)
+        self.assertEqual(invoice.fallback_addr, "mk2QpYatsKicvFVuTAQLBryyccRXMUaGHP")
+        self.assertEqual(invoice.payment_hash, PAYMENT_HASH)
+
+    def test_uppercase_and_uri_prefix(self):
+        self.assertEqual(bolt11.decode("LIGHTNING:" + COFFEE.upper()).payment_hash, PAYMENT_HASH)
+
+    def test_bad_checksum(self):
+        bad = COFFEE[:-1] + ("q" if COFFEE[-1] != "q" else "p")
+        with self.assertRaises(bolt11.Bolt11Error):
+            bolt11.decode(bad)
+
+    def test_truncated(self):
+        with self.assertRaises(bolt11.Bolt11Error):
+            bolt11.decode("lnbc2500u1pvjluez")
+
+    def test_network(self):
+        self.assertEqual(bolt11.decode(COFFEE, "mainnet").num_satoshis, 250000)
+        self.assertEqual(bolt11.decode(TESTNET_FALLBACK, "testnet").num_satoshis, 2000000)
+        with self.assertRaises(bolt11.Bolt11Error):
+            bolt11.decode(TESTNET_FALLBACK, "mainnet")
+        with self.assertRaises(bolt11.Bolt11Error):
+            bolt11.decode(COFFEE, "testnet")
+        with self.assertRaises(bolt11.Bolt11Error):
+            bolt11.decode(COFFEE, "regtest")
@@ -5,9 +5,16 @@ if not os.getenv("DOCKER_ENV"):
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from .connections import create_permanent_task, cancel_all_tasks, redis_pool, psql_pool, node, logger
+from .connections import create_permanent_task, cancel_all_tasks, redis_pool, psql_pool, node, logger, NETWORK
 from .database import db_init
+from .migrations import run_migrations
 from .ln.tasks import process_invoice_notifications, process_payment_notifications
+from .ln.payouts import payouts
+from .btc.address_pool import address_pool
+from .btc.deposit_scanner import deposit_scanner
+from .btc.node import btc_node
+from .btc.withdraw_tracker import withdraw_tracker
+from .btc.withdraw_batcher import withdraw_batcher
 from .ln import ln_router
 from .btc import btc_router
 from .user import user_router
@@ -16,11 +23,20 @@ from .user import user_router
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await db_init(psql_pool)
+    await run_migrations(psql_pool)
     create_permanent_task(process_invoice_notifications)
     create_permanent_task(process_payment_notifications)
+    create_permanent_task(payouts.run)
+    create_permanent_task(address_pool.run)
+    create_permanent_task(withdraw_tracker.run)
+    create_permanent_task(withdraw_batcher.run)
+    if NETWORK != "testnet":
+        # testnet deposits are found by /deposit/btc/scan through the explorer
+        create_permanent_task(deposit_scanner.run)
     yield
-    redis_pool.close()
+    await redis_pool.disconnect()
     await psql_pool.close()
+    await btc_node.aclose()
     cancel_all_tasks()
 
 
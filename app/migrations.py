@@ -0,0 +1,147 @@
+"""
+Versioned schema migrations
+
+Applied versions are recorded in schema_migrations. Runs in autocommit so
+indexes can be built with CREATE INDEX CONCURRENTLY without locking writes.
+Every migration must be safe to re-run, a crash between the migration and
+its version insert applies it again on the next start.
+"""
+
+import psycopg_pool
+from .connections import logger
+from .database import create_tables_all, create_stream_checkpoints_table, create_ln_payouts_table, create_wallet_user_index_sequence
+
+
+# pg_advisory_lock key, serializes runners of several app instances
+MIGRATIONS_LOCK_ID = 72101
+
+
+async def create_schema_migrations_table(cursor):
+    q = """
+    CREATE TABLE IF NOT EXISTS schema_migrations
+    (
+        version bigint NOT NULL PRIMARY KEY,
+        description character varying(200) NOT NULL,
+        ts_applied bigint NOT NULL
+    )
+    """
+    await cursor.execute(q)
+
+
+async def create_index_concurrently(cursor, name: str, table: str, columns: str, where: str = ""):
+    # failed concurrent build leaves an INVALID index behind, rebuild it
+    q = """
+    SELECT 1
+    FROM pg_index AS i
+    JOIN pg_class AS c
+    ON c.oid = i.indexrelid
+    WHERE c.relname = %s
+    AND NOT i.indisvalid
+    """
+    await cursor.execute(q, (name, ))
+    if await cursor.fetchone() is not None:
+        await cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    q = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"
+    if where:
+        q += f" WHERE {where}"
+    await cursor.execute(q)
+
+
+async def m001_base_tables(cursor):
+    await create_tables_all(cursor)
+
+
+async def m002_lookup_indexes(cursor):
+    # users
+    await create_index_concurrently(cursor, "users_k1_idx", "users", "k1")
+    await create_index_concurrently(cursor, "users_username_idx", "users", "username")
+    await create_index_concurrently(cursor, "users_email_idx", "users", "email")
+    # transfers
+    await create_index_concurrently(cursor, "withdraw_requests_userid_status_idx", "withdraw_requests", "userid, status")
+    await create_index_concurrently(cursor, "deposit_transactions_userid_ts_idx", "deposit_transactions", "userid, ts_created")
+    await create_index_concurrently(cursor, "withdraw_transactions_userid_ts_idx", "withdraw_transactions", "userid, ts_created")
+    # ln
+    await create_index_concurrently(cursor, "ln_payments_k1_idx", "ln_payments", "k1")
+    # btc
+    await create_index_concurrently(cursor, "wallet_addresses_userid_change_idx", "wallet_addresses", "userid, change")
+    await create_index_concurrently(cursor, "wallet_addresses_script_pubkey_idx", "wallet_addresses", "script_pubkey")
+    await create_index_concurrently(cursor, "wallet_addresses_p2wsh_idx", "wallet_addresses", "p2wsh")
+    await create_index_concurrently(cursor, "utxos_public_key_idx", "utxos", "public_key")
+
+
+async def m003_stream_checkpoints(cursor):
+    await create_stream_checkpoints_table(cursor)
+
+
+async def m004_ln_payouts(cursor):
+    await create_ln_payouts_table(cursor)
+    await create_index_concurrently(cursor, "ln_payouts_status_ts_idx", "ln_payouts", "status, ts_created")
+
+
+async def m005_address_pool(cursor):
+    await create_wallet_user_index_sequence(cursor)
+    # continue after user indexes allocated with MAX(user_index)
+    q = """
+    SELECT setval('wallet_user_index_seq', GREATEST(MAX(user_index), 1000))
+    FROM wallet_addresses
+    """
+    await cursor.execute(q)
+    await create_index_concurrently(cursor, "wallet_addresses_unused_idx", "wallet_addresses",
+                                    "userid, change, address_index", where="used = 0")
+
+
+async def m006_withdraw_tracking(cursor):
+    await create_index_concurrently(cursor, "btc_payments_confirmations_idx", "btc_payments", "confirmations")
+    await create_index_concurrently(cursor, "wd_outs_txid_hex_idx", "wd_outs", "txid_hex")
+    await create_index_concurrently(cursor, "wd_ins_txid_hex_idx", "wd_ins", "txid_hex")
+
+
+async def m007_withdraw_batches(cursor):
+    # unsigned transaction of a payment, for the signers
+    await cursor.execute("ALTER TABLE btc_payments ADD COLUMN IF NOT EXISTS tx_hex text")
+    await create_index_concurrently(cursor, "utxos_spendable_idx", "utxos", "amount DESC", where="locked = 0")
+
+
+migrations = [
+    (1, "Base tables", m001_base_tables),
+    (2, "Lookup indexes", m002_lookup_indexes),
+    (3, "LND stream checkpoints", m003_stream_checkpoints),
+    (4, "LN payout queue", m004_ln_payouts),
+    (5, "Address pool", m005_address_pool),
+    (6, "Withdrawal confirmation tracking", m006_withdraw_tracking),
+    (7, "Batched withdrawals", m007_withdraw_batches),
+]
+
+
+async def run_migrations(pool: psycopg_pool.AsyncConnectionPool):
+    q = """
+    SELECT version
+    FROM schema_migrations
+    """
+    q2 = """
+    INSERT INTO schema_migrations
+    (version, description, ts_applied)
+    VALUES (%s, %s, EXTRACT(EPOCH FROM NOW())::bigint)
+    ON CONFLICT DO NOTHING
+    """
+    async with pool.connection() as conn:
+        await conn.set_autocommit(True)
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_ID, ))
+                try:
+                    await create_schema_migrations_table(cur)
+                    await cur.execute(q)
+                    applied = {row[0] for row in await cur.fetchall()}
+                    for version, description, migration in migrations:
+                        if version in applied:
+                            continue
+                        logger.debug({"event": "Applying migration", "version": version, "description": description})
+                        await migration(cur)
+                        await cur.execute(q2, (version, description))
+                finally:
+                    await cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_ID, ))
+        finally:
+            # pooled connection, hand it back in transaction mode
+            await conn.set_autocommit(False)
+    logger.debug("Database migrations applied")
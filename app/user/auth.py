@@ -1,4 +1,6 @@
 import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
 from fastapi import Depends, Header
 from typing import Optional
@@ -6,22 +8,25 @@ from passlib.context import CryptContext
 import hashlib
 import secrets
 import binascii
+import threading
 import jwt
-from hdwallet import HDWallet
 import os
-from ..btc.base import WalletAddressInDb
-from ..bitcoinlib.wallet import P2WSHBitcoinAddress
+import time
 from ..bitcoinlib.core.key import CPubKey
-from ..bitcoinlib.core.script import CScript, OP_0, OP_1, OP_3, OP_CHECKMULTISIG
-from ..bitcoinlib.core import b2x, x
+from ..bitcoinlib.core import x
 from ..bitcoinlib import SelectParams
 from .base import TokenData
+from .derivation import AddressDerivation
 
 
 NETWORK = os.getenv("NETWORK")
 SECRET_KEY = os.getenv("JWT_SECRET")
 ALGORITHM = os.getenv("JWT_ALGO")
 ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 64))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
 
 SelectParams(NETWORK)
 
@@ -30,13 +35,18 @@ MASTER_0_SIGNER_PUBKEY = os.getenv("MASTER_0_SIGNER_PUBKEY")
 MASTER_1_SIGNER_PUBKEY = os.getenv("MASTER_1_SIGNER_PUBKEY")
 master0_cpubkey = CPubKey(x(MASTER_0_SIGNER_PUBKEY))
 master1_cpubkey = CPubKey(x(MASTER_1_SIGNER_PUBKEY))
+# root public master key for wallet generation
+address_derivation = AddressDerivation(WALLET_MASTER_XPUBKEY, [master0_cpubkey, master1_cpubkey])
 
 def random_k1():
     random_bytes = secrets.token_bytes(32)  # Generates 32 random bytes
     random_hex = binascii.hexlify(random_bytes).decode()  # Convert bytes to a hexadecimal string
     return random_hex
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# hashes below BCRYPT_ROUNDS are flagged for rehash on login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto",
+                           bcrypt__default_rounds=BCRYPT_ROUNDS,
+                           bcrypt__min_rounds=BCRYPT_ROUNDS)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -44,6 +54,69 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated thread pool so hashing does not block the
+    event loop. At most workers + queue_size jobs are accepted, beyond
+    that PasswordHasherBusy is raised instead of queueing without bound.
+    """
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_size: int = PASSWORD_HASH_QUEUE):
+        self.workers = workers
+        self.max_pending = workers + queue_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # metrics
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    async def run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self.pending += 1
+        start = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            latency = time.monotonic() - start
+            self.completed += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    async def hash(self, password: str) -> str:
+        return await self.run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """Returns (valid, new_hash), new_hash is set when the stored hash needs an update"""
+        valid, new_hash = await self.run(pwd_context.verify_and_update, password, hashed_password)
+        if new_hash is not None:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": min(self.pending, self.workers),
+            "queue_depth": max(self.pending - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "avg_latency_ms": round(self.latency_total / self.completed * 1000, 2) if self.completed else 0,
+            "max_latency_ms": round(self.latency_max * 1000, 2),
+        }
+
+
+password_hasher = PasswordHasher()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -54,15 +127,107 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+
+class TokenCache:
+    """
+    LRU of validated tokens keyed by sha256 of the token. Entries are
+    served until the token exp, revoke_user drops all entries of a user.
+    decode_access_token runs in the threadpool, every method holds lock.
+    """
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[bytes, tuple[TokenData, float]] = OrderedDict()
+        self.by_user: dict[str, set[bytes]] = {}
+        self.lock = threading.Lock()
+        # metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> TokenData | None:
+        key = self.key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            token_data, exp = entry
+            if exp <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return token_data
+
+    def put(self, token_data: TokenData, exp: float):
+        key = self.key(token_data.token)
+        with self.lock:
+            self.entries[key] = (token_data, exp)
+            self.entries.move_to_end(key)
+            self.by_user.setdefault(token_data.userid, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key: bytes):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key: bytes):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self.by_user.get(entry[0].userid)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.by_user[entry[0].userid]
+
+    def revoke(self, token: str):
+        self.remove(self.key(token))
+
+    def revoke_user(self, userid: str):
+        with self.lock:
+            for key in list(self.by_user.get(userid, ())):
+                self._remove(key)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0,
+            }
+
+
+token_cache = TokenCache()
+
 def decode_access_token(authorization: str = Header(None)):
     if authorization is None:
         return None
     try:
         token = authorization.split()[1]
+    except IndexError:
+        return None
+    token_data = token_cache.get(token)
+    if token_data is not None:
+        return token_data
+    try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         token_data = TokenData(userid=payload.get("sub"), token=token, username=payload.get("username"))
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         return None
+    if "exp" in payload:
+        token_cache.put(token_data, payload["exp"])
     return token_data
 
 class RateLimiter:
@@ -103,31 +268,4 @@ class RateLimiter:
                         continue
 
 def derive_new_address(userid, user_index, change, address_index):
-    # root public master key for wallet generation
-    master_wallet = HDWallet(symbol="BTC", use_default_path=False).from_xpublic_key(WALLET_MASTER_XPUBKEY)
-    path = f"m/{user_index}/{change}/{address_index}"
-    user_wallet = master_wallet.from_path(path)
-    user_pubkey = user_wallet.public_key()
-
-    # convert pubkey to bytes
-    user_pubkey_bytes = bytes.fromhex(user_pubkey)
-    seckey = CPubKey(user_pubkey_bytes)
-
-    # creating a multisig p2wsh address
-    witness_script = CScript([OP_1, seckey, master0_cpubkey, master1_cpubkey, OP_3, OP_CHECKMULTISIG])
-    script_hash = hashlib.sha256(witness_script).digest()
-    script_pubkey = CScript([OP_0, script_hash])
-    address = P2WSHBitcoinAddress.from_scriptPubKey(script_pubkey)
-
-    address = WalletAddressInDb(
-        public_key=user_pubkey,     # underlying user pubkey
-        chain_code=user_wallet.chain_code(),
-        user_index=user_index,
-        userid=userid,
-        change=change,
-        address_index=address_index,
-        path=path,
-        witness_script=b2x(witness_script),
-        script_pubkey=b2x(script_pubkey),   # script pubkey
-        p2wsh=str(address))
-    return address
+    return address_derivation.derive(userid, user_index, change, address_index)
@@ -3,7 +3,6 @@ from datetime import datetime, timezone
 from psycopg.rows import dict_row
 from ..database import PSQLClient
 from ..btc.base import WalletAddressInDb
-from .auth import derive_new_address
 from .base import WithdrawRequest, UserInDB, OrderSYS, Transfer
 
 
@@ -101,6 +100,14 @@ class BaseCrud(PSQLClient):
             return None
         return UserInDB(**user)
     
+    async def update_password_hash(self, userid: str, hashed_password: str):
+        q = """
+        UPDATE users
+        SET hashed_password = %s
+        WHERE userid = %s
+        """
+        await self.execute(q, hashed_password, userid)
+
     async def get_user_orders(self, userid: str) -> list[OrderSYS]:
         q = """
         SELECT orderid, tsid, userid, market, side, market_name, market_expiry, side_name, price, size, fill
@@ -153,52 +160,21 @@ class BaseCrud(PSQLClient):
         """
         return await self.execute(q, *address.model_dump(exclude=['used']).values())
 
-    async def create_next_address(self, userid: str, change = 0) -> str:
-        next_idx = await self.get_next_addressindex(userid, change)
-        user_index = next_idx['user_index']
-        address_index = next_idx['next_index']
-        address = derive_new_address(userid, user_index, change, address_index)
-        await self.create_wallet_address(address)
-        return address.script_pubkey
-
-    async def get_unused_address(self, userid: str):
+    async def get_unused_address(self, userid: str, change: int = 0) -> str | None:
         q = """
         SELECT script_pubkey
         FROM wallet_addresses
         WHERE userid = %s
+        AND change = %s
         AND used = 0
+        ORDER BY address_index
+        LIMIT 1
         """
-        addr =  await self.fetchone(q, userid)
+        addr = await self.fetchone(q, userid, change)
         if addr is None:
-            return await self.create_next_address(userid)
+            return None
         return addr['script_pubkey']
 
-
-    async def get_max_userindex(self) -> int:
-        q = """
-        SELECT MAX(user_index) ci
-        FROM wallet_addresses
-        """
-        result = await self.fetchone(q)
-        if result['ci'] is None:
-            return 1000
-        return result['ci']
-
-    async def get_next_addressindex(self, userid: str, change: int):
-        q = """
-        SELECT MAX(address_index) + 1 next_index, user_index
-        FROM wallet_addresses
-        WHERE userid = %s
-        AND change = %s
-        GROUP BY user_index
-        """
-        idx = await self.fetchone(q, userid, change)
-        # print('got next addressindex', idx)
-        if idx is None:
-            max_idx = await self.get_max_userindex()
-            return {'next_index': 0, 'user_index': max_idx+1}
-        return idx
-
     async def get_address_exists(self, public_key: str, userid: str) -> int:
         q = """
         SELECT COUNT(*) exists
@@ -0,0 +1,132 @@
+"""
+BIP32 public derivation of user deposit addresses
+
+The master xpub is parsed once and m/user_index/change nodes are kept in
+an LRU, so deriving an address is one CKDpub step plus the script. Point
+addition runs in libsecp256k1 when it is installed, in ecdsa otherwise.
+https://github.com/bitcoin/bips/blob/master/bip-0032.mediawiki
+"""
+
+from functools import lru_cache
+from typing import NamedTuple
+import hashlib
+import hmac
+import os
+from ecdsa import VerifyingKey
+from ecdsa.curves import SECP256k1
+from ecdsa.ellipticcurve import INFINITY
+from ecdsa.errors import MalformedPointError
+from .. import bitcoinlib
+from ..bitcoinlib.base58 import decode as b58decode
+from ..bitcoinlib.segwit_addr import bech32_encode, convertbits
+from ..bitcoinlib.core import Hash, b2x
+from ..bitcoinlib.core import secp256k1
+from ..bitcoinlib.core.script import CScript, OP_0, OP_1, OP_3, OP_CHECKMULTISIG
+from ..btc.base import WalletAddressInDb
+
+
+ADDRESS_NODE_CACHE_SIZE = int(os.getenv("ADDRESS_NODE_CACHE_SIZE", 10000))
+
+HARDENED = 0x80000000
+
+USE_LIBSECP256K1 = secp256k1.is_available()
+
+
+class DerivationError(ValueError):
+    pass
+
+
+class PublicNode(NamedTuple):
+    public_key: bytes   # compressed
+    chain_code: bytes
+
+
+def parse_xpub(xpub: str) -> PublicNode:
+    data = b58decode(xpub)
+    if len(data) != 82 or Hash(data[:-4])[:4] != data[-4:]:
+        raise DerivationError("Invalid extended public key")
+    chain_code, key = data[13:45], data[45:78]
+    if key[0] not in (2, 3):
+        raise DerivationError("Extended key is not a public key")
+    try:
+        VerifyingKey.from_string(key, curve=SECP256k1)
+    except MalformedPointError:
+        raise DerivationError("Invalid extended public key")
+    return PublicNode(key, chain_code)
+
+
+@lru_cache(maxsize=ADDRESS_NODE_CACHE_SIZE)
+def _ecdsa_point(public_key: bytes):
+    # parents are the cached branch nodes, decompress each once
+    return VerifyingKey.from_string(public_key, curve=SECP256k1).pubkey.point
+
+
+def _tweak_add_ecdsa(public_key: bytes, tweak: int) -> bytes:
+    point = SECP256k1.generator * tweak + _ecdsa_point(public_key)
+    if point == INFINITY:
+        raise DerivationError("Child key at infinity")
+    x, y = point.x(), point.y()
+    return bytes([2 + (y & 1)]) + x.to_bytes(32, "big")
+
+
+def ckd_pub(parent: PublicNode, index: int) -> PublicNode:
+    """Public parent key -> public child key, non-hardened only"""
+    if index >= HARDENED:
+        raise DerivationError("Hardened derivation from a public key")
+    I = hmac.new(parent.chain_code, parent.public_key + index.to_bytes(4, "big"), hashlib.sha512).digest()
+    tweak = int.from_bytes(I[:32], "big")
+    if tweak >= SECP256k1.order:
+        raise DerivationError("Invalid child index "+str(index))
+    if USE_LIBSECP256K1:
+        try:
+            public_key = secp256k1.pubkey_tweak_add(parent.public_key, I[:32])
+        except secp256k1.Secp256k1Error:
+            raise DerivationError("Invalid child index "+str(index))
+    else:
+        public_key = _tweak_add_ecdsa(parent.public_key, tweak)
+    return PublicNode(public_key, I[32:])
+
+
+class AddressDerivation:
+    """
+    1-of-3 P2WSH deposit addresses: user key at m/user_index/change/i of
+    the wallet xpub plus the two signer keys.
+    """
+    def __init__(self, xpub: str, signer_pubkeys: list[bytes], cache_size: int = ADDRESS_NODE_CACHE_SIZE):
+        self.master = parse_xpub(xpub)
+        # script after the user key is the same for every address
+        self.script_suffix = bytes(CScript([*signer_pubkeys, OP_3, OP_CHECKMULTISIG]))
+        self.branch = lru_cache(maxsize=cache_size)(self._branch)
+
+    def _branch(self, user_index: int, change: int) -> PublicNode:
+        return ckd_pub(ckd_pub(self.master, user_index), change)
+
+    def derive(self, userid: str, user_index: int, change: int, address_index: int) -> WalletAddressInDb:
+        return self.derive_range(user_index, change, address_index, 1, userid)[0]
+
+    def derive_range(self, user_index: int, change: int, start: int, count: int, userid: str = "") -> list[WalletAddressInDb]:
+        branch = self.branch(user_index, change)
+        addresses = []
+        for address_index in range(start, start + count):
+            node = ckd_pub(branch, address_index)
+            public_key = node.public_key
+            # CScript + bytes would push the suffix as data, join raw bytes
+            witness_script = CScript(bytes(CScript([OP_1, public_key])) + self.script_suffix)
+            script_hash = hashlib.sha256(witness_script).digest()
+            script_pubkey = CScript([OP_0, script_hash])
+            addresses.append(WalletAddressInDb(
+                public_key=public_key.hex(),
+                chain_code=node.chain_code.hex(),
+                user_index=user_index,
+                userid=userid,
+                change=change,
+                address_index=address_index,
+                path=f"m/{user_index}/{change}/{address_index}",
+                witness_script=b2x(witness_script),
+                script_pubkey=b2x(script_pubkey),
+                # segwit_addr.encode decodes again to check, skip it for our own data
+                p2wsh=bech32_encode(bitcoinlib.params.BECH32_HRP, [0] + convertbits(script_hash, 8, 5))))
+        return addresses
+
+    def cache_info(self):
+        return self.branch.cache_info()
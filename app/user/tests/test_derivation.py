@@ -0,0 +1,140 @@
+import hashlib
+import unittest
+from unittest import mock
+
+from app import bitcoinlib
+from app.bitcoinlib.core import b2x, secp256k1, x
+from app.bitcoinlib.core.key import CPubKey
+from app.bitcoinlib.core.script import CScript, OP_0, OP_1, OP_3, OP_CHECKMULTISIG
+from app.bitcoinlib.wallet import P2WSHBitcoinAddress
+from app.user import derivation
+from app.user.derivation import AddressDerivation, DerivationError, PublicNode, ckd_pub, parse_xpub
+
+try:
+    from hdwallet import HDWallet
+except ImportError:
+    HDWallet = None
+
+
+# BIP32 test vectors, public derivation steps only
+# https://github.com/bitcoin/bips/blob/master/bip-0032.mediawiki#test-vectors
+VECTOR_1_M_0H_1_2H_2 = (
+    "xpub6FHa3pjLCk84BayeJxFW2SP4XRrFd1JYnxeLeU8EqN3vDfZmbqBqaGJAyiLjTAwm6ZLRQUMv1ZACTj37sR62cfN7fe5JnJ7dh8zL4fiyLHV",
+    "02e8445082a72f29b75ca48748a914df60622a609cacfce8ed0e35804560741d29",
+    "cfb71883f01676f587d023cc53a35bc7f88f724b1f8c2892ac1275ac822a3edd")
+VECTOR_1_CHILD_1000000000 = (
+    "022a471424da5e657499d1ff51cb43c47481a03b1e77f951fe64cec9f5a48f7011",
+    "c783e67b921d2beb8f6b389cc646d7263b4145701dadd2161548a8b078e65e9e")
+VECTOR_2_M = (
+    "xpub661MyMwAqRbcFW31YEwpkMuc5THy2PSt5bDMsktWQcFF8syAmRUapSCGu8ED9W6oDMSgv6Zz8idoc4a6mr8BDzTJY47LJhkJ8UB7WEGuduB",
+    "03cbcaa9c98c877a26977d00825c956a238e8dddfbd322cce4f74b0b5bd6ace4a7",
+    "60499f801b896d83179a4374aeb7822aaeaceaa0db1f85ee3e904c4defbd9689")
+VECTOR_2_CHILD_0 = (
+    "02fc9e5af0ac8d9b3cecfe2a888e2117ba3d089d8585886c9c826b6b22a98d12ea",
+    "f0909affaa7ee7abe5dd4e100598d4dc53cd709d5a5c2cac40e7412f232f7c9c")
+# xprv of vector 1 m
+XPRV = "xprv9s21ZrQH143K3QTDL4LXw2F7HEK3wJUD2nW2nRk4stbPy6cq3jPPqjiChkVvvNKmPGJxWUtg6LnF5kejMRNNU3TGtRBeJgk33yuGBxrMPHi"
+
+# pubkeys of the secret keys 2 and 3
+SIGNER_PUBKEYS = [
+    CPubKey(x("02c6047f9441ed7d6d3045406e95c07cd85c778e4b8cef3ca7abac09b95c709ee5")),
+    CPubKey(x("02f9308a019258c31049344f85f89d5229b531c845836f99b08601f113bce036f9")),
+]
+
+
+def hdwallet_address(xpub, user_index, change, address_index):
+    """derive_new_address as it was with hdwallet"""
+    path = f"m/{user_index}/{change}/{address_index}"
+    user_wallet = HDWallet(symbol="BTC", use_default_path=False).from_xpublic_key(xpub).from_path(path)
+    user_pubkey = CPubKey(bytes.fromhex(user_wallet.public_key()))
+    witness_script = CScript([OP_1, user_pubkey, *SIGNER_PUBKEYS, OP_3, OP_CHECKMULTISIG])
+    script_pubkey = CScript([OP_0, hashlib.sha256(witness_script).digest()])
+    return (user_wallet.public_key(), user_wallet.chain_code(), b2x(witness_script),
+            b2x(script_pubkey), str(P2WSHBitcoinAddress.from_scriptPubKey(script_pubkey)))
+
+
+class Test_parse_xpub(unittest.TestCase):
+    def test_vectors(self):
+        for xpub, public_key, chain_code in (VECTOR_1_M_0H_1_2H_2, VECTOR_2_M):
+            node = parse_xpub(xpub)
+            self.assertEqual(node.public_key, x(public_key))
+            self.assertEqual(node.chain_code, x(chain_code))
+
+    def test_invalid(self):
+        xpub = VECTOR_2_M[0]
+        # bad checksum
+        with self.assertRaises(DerivationError):
+            parse_xpub(xpub[:-1] + ("1" if xpub[-1] != "1" else "2"))
+        with self.assertRaises(DerivationError):
+            parse_xpub(xpub[:-8])
+        # private extended keys are refused
+        with self.assertRaises(DerivationError):
+            parse_xpub(XPRV)
+
+
+class Test_ckd_pub(unittest.TestCase):
+    def check_vectors(self):
+        for xpub, child, (public_key, chain_code) in ((VECTOR_2_M[0], 0, VECTOR_2_CHILD_0),
+                                                      (VECTOR_1_M_0H_1_2H_2[0], 1000000000, VECTOR_1_CHILD_1000000000)):
+            node = ckd_pub(parse_xpub(xpub), child)
+            self.assertEqual(node.public_key, x(public_key))
+            self.assertEqual(node.chain_code, x(chain_code))
+
+    def test_vectors_ecdsa(self):
+        with mock.patch.object(derivation, "USE_LIBSECP256K1", False):
+            self.check_vectors()
+
+    @unittest.skipUnless(secp256k1.is_available(), "libsecp256k1 not installed")
+    def test_vectors_libsecp256k1(self):
+        with mock.patch.object(derivation, "USE_LIBSECP256K1", True):
+            self.check_vectors()
+
+    def test_hardened(self):
+        with self.assertRaises(DerivationError):
+            ckd_pub(parse_xpub(VECTOR_2_M[0]), derivation.HARDENED)
+
+    @unittest.skipUnless(secp256k1.is_available(), "libsecp256k1 not installed")
+    def test_backends_agree(self):
+        parent = PublicNode(x(VECTOR_2_CHILD_0[0]), x(VECTOR_2_CHILD_0[1]))
+        for index in (0, 1, 2, 1000, 2 ** 31 - 1):
+            with mock.patch.object(derivation, "USE_LIBSECP256K1", False):
+                expected = ckd_pub(parent, index)
+            with mock.patch.object(derivation, "USE_LIBSECP256K1", True):
+                self.assertEqual(ckd_pub(parent, index), expected)
+
+
+class Test_AddressDerivation(unittest.TestCase):
+    def tearDown(self):
+        bitcoinlib.SelectParams("mainnet")
+
+    def derive(self, xpub, use_libsecp256k1):
+        with mock.patch.object(derivation, "USE_LIBSECP256K1", use_libsecp256k1):
+            wallet = AddressDerivation(xpub, SIGNER_PUBKEYS)
+            return [a for user_index in (0, 7) for change in (0, 1)
+                    for a in wallet.derive_range(user_index, change, 0, 5, "user")]
+
+    def test_derive_range(self):
+        addresses = self.derive(VECTOR_2_M[0], False)
+        self.assertEqual(len(addresses), 20)
+        self.assertEqual(len({a.p2wsh for a in addresses}), 20)
+        first = addresses[0]
+        self.assertEqual(first.path, "m/0/0/0")
+        self.assertEqual(first.userid, "user")
+        self.assertEqual(first.witness_script[:4], "5121")
+        self.assertEqual(first.script_pubkey[:4], "0020")
+
+    def test_derive(self):
+        wallet = AddressDerivation(VECTOR_2_M[0], SIGNER_PUBKEYS)
+        self.assertEqual(wallet.derive("user", 7, 1, 3), wallet.derive_range(7, 1, 3, 1, "user")[0])
+
+    @unittest.skipIf(HDWallet is None, "hdwallet not installed")
+    def test_hdwallet_path(self):
+        for network in ("mainnet", "testnet"):
+            bitcoinlib.SelectParams(network)
+            for a in self.derive(VECTOR_2_M[0], False):
+                self.assertEqual((a.public_key, a.chain_code, a.witness_script, a.script_pubkey, a.p2wsh),
+                                 hdwallet_address(VECTOR_2_M[0], a.user_index, a.change, a.address_index))
+
+    @unittest.skipUnless(secp256k1.is_available(), "libsecp256k1 not installed")
+    def test_backends_agree(self):
+        self.assertEqual(self.derive(VECTOR_2_M[0], True), self.derive(VECTOR_2_M[0], False))
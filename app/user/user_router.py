@@ -2,10 +2,11 @@ from fastapi import APIRouter, HTTPException, status, Depends, Request, Query
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from typing import Annotated
 from datetime import timedelta
-from ..connections import psql_pool, get_redis_connection
-from .auth import decode_access_token, get_password_hash, verify_password, create_access_token, random_k1, ACCESS_TOKEN_EXPIRE_MINUTES
+from ..connections import psql_pool, get_redis_connection, logger
+from .auth import decode_access_token, create_access_token, random_k1, password_hasher, PasswordHasherBusy, token_cache, ACCESS_TOKEN_EXPIRE_MINUTES
 from .base import *
 from .crud import BaseCrud
+from ..btc.address_pool import address_pool
 
 
 psql = BaseCrud(psql_pool)
@@ -31,15 +32,18 @@ async def create_user(
     userid = random_k1()
     # secondary id
     k1 = random_k1()
-    hashed_password = get_password_hash(user.password)
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, try again")
     user_db = UserInDB(
         **user.model_dump(),
         userid=userid,
         k1=k1,
         hashed_password=hashed_password
     )
-    await psql.get_unused_address(userid)
     await psql.create_user_entry(user_db)
+    address_pool.notify(userid)
     return SignUpResponse(
         username=user.username,
         email=user.email,
@@ -61,9 +65,16 @@ async def login(
     user = await psql.get_user(credentials.username)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username")
-    psw = verify_password(credentials.password, user.hashed_password)
+    try:
+        psw, new_hash = await password_hasher.verify(credentials.password, user.hashed_password)
+    except PasswordHasherBusy:
+        logger.warning({"event": "Login rejected, password hasher busy", "stats": password_hasher.stats()})
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, try again")
     if not psw:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect password")
+    if new_hash is not None:
+        # work factor changed, store the upgraded hash
+        await psql.update_password_hash(user.userid, new_hash)
     access_token = create_access_token(
         data={"sub": user.userid, "username": user.username},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -76,15 +87,21 @@ async def login(
 
 
 async def init_session(userid, access_token):
+    # session reset, previously validated tokens are checked again
+    token_cache.revoke_user(userid)
     async for redis_conn in get_redis_connection():
-        redis_conn.delete(f"{userid}::session")
+        await redis_conn.delete(f"{userid}::session")
         balances = await psql.get_user_balances(userid)
         sess = Session(
             userid=userid,
             token=access_token,
             balances=balances
         )
-        redis_conn.hmset(name=f"{userid}::session", mapping=sess.model_dump(), ex=ACCESS_TOKEN_EXPIRE_MINUTES*60)
+        # asyncio client has no ex on hset, set expiry in the same round trip
+        async with redis_conn.pipeline(transaction=True) as pipe:
+            pipe.hset(name=f"{userid}::session", mapping=sess.model_dump())
+            pipe.expire(f"{userid}::session", int(ACCESS_TOKEN_EXPIRE_MINUTES)*60)
+            await pipe.execute()
         return sess
 
 """
@@ -105,10 +122,10 @@ async def cancel_withdraw_request(
     if request is None:
         raise HTTPException(status_code=400, detail="Invalid request")    
     if request.status in ["CREATED", "VERIFIED", "QUEUED"]:
-        redis_conn.delete(k1)
+        await redis_conn.delete(k1)
         await psql.cancel_withdraw_request(k1)
         if request.amount is not None and request.status in ["VERIFIED", "QUEUED"]:
-            redis_conn.hincrby(f"{token_data.userid}::session", "balances", request.amount)
+            await redis_conn.hincrby(f"{token_data.userid}::session", "balances", request.amount)
     return WithdrawCancelSuccess(k1=k1)
 
 
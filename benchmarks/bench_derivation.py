@@ -0,0 +1,53 @@
+"""
+Deposit address derivation benchmark
+
+Reports derived addresses per second for each available backend of
+app.user.derivation and the CPubKey construction rate. Needs the app
+environment (NETWORK, WALLET_MASTER_XPUBKEY, MASTER_*_SIGNER_PUBKEY).
+
+    PYTHONPATH=. python benchmarks/bench_derivation.py --count 5000
+"""
+
+import argparse
+import time
+from app.bitcoinlib.core import secp256k1
+from app.bitcoinlib.core.key import CPubKey
+from app.user import derivation
+from app.user.auth import WALLET_MASTER_XPUBKEY, master0_cpubkey, master1_cpubkey
+
+
+def bench_derive(use_libsecp256k1: bool, count: int, users: int):
+    derivation.USE_LIBSECP256K1 = use_libsecp256k1
+    deriver = derivation.AddressDerivation(WALLET_MASTER_XPUBKEY, [master0_cpubkey, master1_cpubkey])
+    per_user = max(count // users, 1)
+    start = time.perf_counter()
+    for user_index in range(1001, 1001 + users):
+        deriver.derive_range(user_index, 0, 0, per_user)
+    elapsed = time.perf_counter() - start
+    n = per_user * users
+    backend = "libsecp256k1" if use_libsecp256k1 else "ecdsa"
+    print(f"derive {backend:<14} n={n:<6} {n / elapsed:10.1f} addr/s {elapsed / n * 1000:8.3f} ms/addr")
+
+
+def bench_cpubkey(count: int):
+    keys = [a.public_key for a in derivation.AddressDerivation(
+        WALLET_MASTER_XPUBKEY, [master0_cpubkey, master1_cpubkey]).derive_range(1001, 0, 0, 100)]
+    keys = [bytes.fromhex(k) for k in keys]
+    start = time.perf_counter()
+    for i in range(count):
+        CPubKey(keys[i % len(keys)])
+    elapsed = time.perf_counter() - start
+    print(f"CPubKey()             n={count:<6} {count / elapsed:10.1f} keys/s {elapsed / count * 1000:8.3f} ms/key")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=10)
+    args = parser.parse_args()
+    if secp256k1.is_available():
+        bench_derive(True, args.count, args.users)
+    else:
+        print("libsecp256k1 not installed, ecdsa only")
+    bench_derive(False, args.count, args.users)
+    bench_cpubkey(args.count)
@@ -0,0 +1,49 @@
+"""
+Block deserialization benchmark
+
+Parses a block with the stream deserializer and with the memoryview path
+of CBlock.deserialize, then reads every txid as the deposit scan does.
+The last row walks only the outputs with iter_block_outputs.
+
+    PYTHONPATH=. python benchmarks/bench_deserialize.py --block block.hex --rounds 5
+"""
+
+import argparse
+import time
+from io import BytesIO
+from app.bitcoinlib.core import CBlock, iter_block_outputs
+from block_data import get_block_bytes
+
+
+def timed(name: str, func, raw: bytes, n_tx: int, rounds: int):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        block = func(raw)
+        txids = [tx.GetTxid() for tx in block.vtx]
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"{name:<12} {elapsed * 1000:9.1f} ms/block {elapsed / n_tx * 1e6:8.2f} us/tx")
+    return block, txids
+
+
+def main(args):
+    raw, name = get_block_bytes(args.block, args.n_tx)
+    n_tx = len(CBlock.deserialize(raw).vtx)
+    print(f"block: {name}, {n_tx} tx, {len(raw)} bytes, {args.rounds} rounds")
+
+    stream, stream_txids = timed("stream", lambda b: CBlock.stream_deserialize(BytesIO(b)), raw, n_tx, args.rounds)
+    block, txids = timed("memoryview", CBlock.deserialize, raw, n_tx, args.rounds)
+    assert txids == stream_txids and block.vWitnessMerkleTree == stream.vWitnessMerkleTree
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        outputs = sum(1 for _ in iter_block_outputs(raw))
+    elapsed = (time.perf_counter() - start) / args.rounds
+    print(f"{'outputs only':<12} {elapsed * 1000:9.1f} ms/block {elapsed / n_tx * 1e6:8.2f} us/tx, {outputs} outputs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--block", default=None, help="raw block file, binary or hex")
+    parser.add_argument("--n-tx", type=int, default=3000, help="synthetic block size without --block")
+    parser.add_argument("--rounds", type=int, default=5)
+    main(parser.parse_args())
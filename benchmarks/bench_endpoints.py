@@ -0,0 +1,71 @@
+"""
+Latency benchmark for the withdraw/deposit endpoints
+
+Runs against a live server, run it once on the old build and once on the
+new one with the same arguments to compare.
+
+    python benchmarks/bench_endpoints.py --url http://localhost:8080 \
+        --token <jwt> --k1 <user k1> --requests 2000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import time
+import httpx
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    idx = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+async def run_endpoint(client: httpx.AsyncClient, path: str, headers: dict, n: int, concurrency: int):
+    latencies = []
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with sem:
+            start = time.perf_counter()
+            try:
+                r = await client.get(path, headers=headers)
+                if r.status_code >= 500:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(n)])
+    elapsed = time.perf_counter() - start
+    print(f"{path.split('?')[0]:<24} n={n:<6} rps={n / elapsed:8.1f} "
+          f"p50={percentile(latencies, 50):7.2f}ms p90={percentile(latencies, 90):7.2f}ms "
+          f"p99={percentile(latencies, 99):7.2f}ms max={max(latencies):7.2f}ms errors={errors}")
+
+
+async def main(args):
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        endpoints = [
+            "/withdraw/ln/request",
+            f"/withdraw/ln/cb?k1={args.k1}",
+            f"/deposit/ln/cb?k1={args.k1}",
+            "/withdraw/request",
+        ]
+        for path in endpoints:
+            await run_endpoint(client, path, headers, args.requests, args.concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--token", default="")
+    parser.add_argument("--k1", default="0" * 64)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
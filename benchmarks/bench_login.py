@@ -0,0 +1,103 @@
+"""
+Login burst benchmark
+
+Measures login throughput and the latency of another endpoint while a
+burst of logins is running. With bcrypt on the event loop the probe p99
+follows the login latency, with the hashing pool it stays close to the
+idle baseline.
+
+    python benchmarks/bench_login.py --url http://localhost:8080 \
+        --username <user> --password <password> --token <jwt> \
+        --logins 500 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import time
+import httpx
+from bench_endpoints import percentile
+
+
+def report(name: str, latencies: list[float], elapsed: float, errors: int):
+    n = len(latencies)
+    print(f"{name:<24} n={n:<6} rps={n / elapsed:8.1f} "
+          f"p50={percentile(latencies, 50):7.2f}ms p99={percentile(latencies, 99):7.2f}ms "
+          f"max={max(latencies, default=0):7.2f}ms errors={errors}")
+
+
+async def probe(client: httpx.AsyncClient, path: str, headers: dict, stop: asyncio.Event, interval: float):
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    while not stop.is_set():
+        t = time.perf_counter()
+        try:
+            r = await client.get(path, headers=headers)
+            if r.status_code >= 500:
+                errors += 1
+        except httpx.HTTPError:
+            errors += 1
+        latencies.append((time.perf_counter() - t) * 1000)
+        await asyncio.sleep(interval)
+    return latencies, time.perf_counter() - start, errors
+
+
+async def login_burst(client: httpx.AsyncClient, auth: tuple, n: int, concurrency: int):
+    latencies = []
+    errors = 0
+    busy = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors, busy
+        async with sem:
+            t = time.perf_counter()
+            try:
+                r = await client.post("/login", auth=auth)
+                if r.status_code == 503:
+                    busy += 1
+                elif r.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - t) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(n)])
+    return latencies, time.perf_counter() - start, errors, busy
+
+
+async def main(args):
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        # idle baseline
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, args.probe, headers, stop, args.probe_interval))
+        await asyncio.sleep(args.baseline_s)
+        stop.set()
+        report("probe idle", *await task)
+
+        # probe during the burst
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, args.probe, headers, stop, args.probe_interval))
+        latencies, elapsed, errors, busy = await login_burst(
+            client, (args.username, args.password), args.logins, args.concurrency)
+        stop.set()
+        report("login", latencies, elapsed, errors)
+        print(f"{'':<24} rejected busy (503)={busy}")
+        report("probe during logins", *await task)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--token", default="")
+    parser.add_argument("--probe", default="/withdraw/request")
+    parser.add_argument("--probe-interval", type=float, default=0.01)
+    parser.add_argument("--baseline-s", type=float, default=5)
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,115 @@
+"""
+Settled-invoices-per-second against a local Postgres
+
+Needs the app environment (.env with POSTGRES_* and LND settings, the app
+modules connect on import). Seeds users and open deposit invoices, settles
+them through LNCrud.deposit_finalize (or deposit_finalize_batch with
+--batch) and removes the seeded rows.
+
+    PYTHONPATH=. python benchmarks/bench_settlement.py --invoices 5000 --concurrency 8
+    PYTHONPATH=. python benchmarks/bench_settlement.py --invoices 5000 --batch 500
+"""
+
+import argparse
+import asyncio
+import secrets
+import time
+import dotenv
+dotenv.load_dotenv()
+
+from app.connections import psql_pool
+from app.migrations import run_migrations
+from app.ln.crud import LNCrud
+from app.ln.base import LNDInvoice
+
+
+def make_invoice(k1: str) -> LNDInvoice:
+    return LNDInvoice(
+        k1=k1,
+        payment_hash=secrets.token_hex(32),
+        bolt11="lnbench",
+        state="OPEN",
+        destination="bench",
+        num_satoshis=1000,
+        timestamp="0",
+        expiry="3600",
+        description="",
+        description_hash="",
+        fallback_addr="",
+        cltv_expiry="40",
+        route_hints=[],
+        payment_addr="",
+        features={},
+        add_index=0,
+    )
+
+
+async def seed(psql: LNCrud, users: int, invoices: int) -> tuple[list[str], list[LNDInvoice]]:
+    q = """
+    INSERT INTO users (userid, username, email, hashed_password, k1)
+    VALUES (%s, %s, %s, '', %s)
+    """
+    q2 = """
+    INSERT INTO balances (userid, market, market_name, amount)
+    VALUES (%s, 'usd', 'usd', 0)
+    """
+    userids, k1s = [], []
+    async with psql.pipeline_transaction() as cur:
+        for _ in range(users):
+            userid, k1 = secrets.token_hex(32), secrets.token_hex(32)
+            await cur.execute(q, (userid, "bench"+userid[:8], "bench@bench", k1))
+            await cur.execute(q2, (userid, ))
+            userids.append(userid)
+            k1s.append(k1)
+    all_invoices = [make_invoice(k1s[i % users]) for i in range(invoices)]
+    for invoice in all_invoices:
+        await psql.create_deposit_invoice(invoice)
+    return userids, all_invoices
+
+
+async def cleanup(psql: LNCrud, userids: list[str], all_invoices: list[LNDInvoice]):
+    hashes = [i.payment_hash for i in all_invoices]
+    async with psql.pipeline_transaction() as cur:
+        await cur.execute("DELETE FROM deposit_transactions WHERE txid_hex = ANY(%s)", (hashes, ))
+        await cur.execute("DELETE FROM deposit_invoices WHERE payment_hash = ANY(%s)", (hashes, ))
+        await cur.execute("DELETE FROM balances WHERE userid = ANY(%s)", (userids, ))
+        await cur.execute("DELETE FROM users WHERE userid = ANY(%s)", (userids, ))
+
+
+async def main(args):
+    await psql_pool.open()
+    await run_migrations(psql_pool)
+    psql = LNCrud(psql_pool)
+    userids, all_invoices = await seed(psql, args.users, args.invoices)
+    for invoice in all_invoices:
+        invoice.state = "SETTLED"
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def settle(invoice):
+        async with sem:
+            await psql.deposit_finalize(invoice)
+
+    try:
+        start = time.perf_counter()
+        if args.batch:
+            for n in range(0, len(all_invoices), args.batch):
+                await psql.deposit_finalize_batch(all_invoices[n:n+args.batch])
+            mode = f"batch {args.batch}"
+        else:
+            await asyncio.gather(*[settle(i) for i in all_invoices])
+            mode = f"concurrency {args.concurrency}"
+        elapsed = time.perf_counter() - start
+        print(f"settled {len(all_invoices)} invoices in {elapsed:.2f}s "
+              f"= {len(all_invoices) / elapsed:.1f} invoices/s ({mode})")
+    finally:
+        await cleanup(psql, userids, all_invoices)
+        await psql_pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--invoices", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
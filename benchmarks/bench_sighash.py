@@ -0,0 +1,49 @@
+"""
+BIP143 signature hash benchmark
+
+Hashes every input of a P2WSH transaction with n inputs, recomputing the
+shared hashes per input and with one PrecomputedTxData per transaction.
+
+    PYTHONPATH=. python benchmarks/bench_sighash.py --inputs 500 --outputs 50
+"""
+
+import argparse
+import random
+import time
+from app.bitcoinlib.core.script import (CScript, OP_1, OP_2, OP_CHECKMULTISIG, PrecomputedTxData,
+                                        SIGHASH_ALL, SIGVERSION_WITNESS_V0, SignatureHash)
+from block_data import synthetic_tx
+
+
+def sighash_all(tx, script, amount, precompute: bool):
+    precomputed = PrecomputedTxData(tx) if precompute else None
+    return [SignatureHash(script, tx, i, SIGHASH_ALL, amount, SIGVERSION_WITNESS_V0, precomputed=precomputed)
+            for i in range(len(tx.vin))]
+
+
+def timed(name: str, func, n_in: int, rounds: int):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = func()
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"{name:<14} {elapsed * 1000:9.1f} ms/tx {elapsed / n_in * 1e6:8.2f} us/input")
+    return result
+
+
+def main(args):
+    rng = random.Random(1)
+    tx = synthetic_tx(rng, args.inputs, args.outputs, segwit=True)
+    script = CScript([OP_1, bytes(33), bytes(33), OP_2, OP_CHECKMULTISIG])
+    print(f"{args.inputs} inputs, {args.outputs} outputs, {args.rounds} rounds")
+
+    baseline = timed("per input", lambda: sighash_all(tx, script, 10000, False), args.inputs, args.rounds)
+    precomputed = timed("precomputed", lambda: sighash_all(tx, script, 10000, True), args.inputs, args.rounds)
+    assert baseline == precomputed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inputs", type=int, default=500)
+    parser.add_argument("--outputs", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,62 @@
+"""
+CTransaction txid / wtxid / weight benchmark
+
+Times GetTxid, GetHash and calc_weight over every transaction of a block,
+first call and repeated calls, against the previous uncached
+implementation.
+
+    PYTHONPATH=. python benchmarks/bench_tx_hashes.py --block block.hex --rounds 5
+"""
+
+import argparse
+import time
+from app.bitcoinlib.core import CBlock, CTransaction, CTxWitness, Hash
+from block_data import get_block_bytes
+
+
+def uncached_txid(tx):
+    # previous GetTxid
+    if tx.wit != CTxWitness():
+        return Hash(CTransaction(tx.vin, tx.vout, tx.nLockTime, tx.nVersion).serialize())
+    return Hash(tx.serialize())
+
+
+def uncached_weight(tx):
+    # previous calc_weight
+    if tx.wit.is_null():
+        return len(tx.serialize()) * 4
+    stripped = CTransaction(tx.vin, tx.vout, tx.nLockTime, tx.nVersion)
+    return len(stripped.serialize()) * 3 + len(tx.serialize())
+
+
+def timed(name: str, func, vtx, rounds: int):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for tx in vtx:
+            func(tx)
+    elapsed = time.perf_counter() - start
+    n = len(vtx) * rounds
+    print(f"{name:<28} {elapsed * 1000:9.1f} ms {elapsed / n * 1e6:8.2f} us/tx")
+
+
+def main(args):
+    raw, name = get_block_bytes(args.block, args.n_tx)
+    vtx = CBlock.deserialize(raw).vtx
+    print(f"block: {name}, {len(vtx)} tx, {len(raw)} bytes, {args.rounds} rounds")
+
+    timed("uncached txid+wtxid+weight", lambda tx: (uncached_txid(tx), Hash(tx.serialize()), uncached_weight(tx)),
+          vtx, args.rounds)
+    # CBlock.deserialize already hashed the txs for the merkle tree, copy
+    # them so the first call pays for the computation
+    vtx = [CTransaction(tx.vin, tx.vout, tx.nLockTime, tx.nVersion, tx.wit) for tx in vtx]
+    timed("cached first call", lambda tx: (tx.GetTxid(), tx.GetHash(), tx.calc_weight()), vtx, 1)
+    timed("cached repeated", lambda tx: (tx.GetTxid(), tx.GetHash(), tx.calc_weight(), tx.calc_vsize()),
+          vtx, args.rounds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--block", default=None, help="raw block file, binary or hex")
+    parser.add_argument("--n-tx", type=int, default=3000, help="synthetic block size without --block")
+    parser.add_argument("--rounds", type=int, default=5)
+    main(parser.parse_args())
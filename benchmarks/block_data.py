@@ -0,0 +1,66 @@
+"""
+Block input for the bitcoinlib benchmarks
+
+A real block is read from a file holding the raw block, binary or hex as
+returned by `bitcoin-cli getblock <hash> 0`. Without one a synthetic
+block of mainnet-like shape is built: mostly P2WPKH spends, some legacy
+P2PKH, two or three outputs each.
+"""
+
+import os
+import random
+from app.bitcoinlib.core import (CBlock, COutPoint, CTransaction, CTxIn, CTxInWitness,
+                                 CTxOut, CTxWitness, x)
+from app.bitcoinlib.core.script import CScript, CScriptWitness, OP_0, OP_DUP, OP_HASH160, OP_EQUALVERIFY, OP_CHECKSIG
+
+
+def load_block_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        return x(data.decode("ascii").strip())
+    except (UnicodeDecodeError, ValueError):
+        return data
+
+
+def _rand(rng: random.Random, n: int) -> bytes:
+    return bytes(rng.getrandbits(8) for _ in range(n))
+
+
+def _output(rng: random.Random) -> CTxOut:
+    if rng.random() < 0.7:
+        script = CScript([OP_0, _rand(rng, 20)])
+    else:
+        script = CScript([OP_DUP, OP_HASH160, _rand(rng, 20), OP_EQUALVERIFY, OP_CHECKSIG])
+    return CTxOut(rng.randrange(546, 10**8), script)
+
+
+def synthetic_tx(rng: random.Random, n_in: int, n_out: int, segwit: bool) -> CTransaction:
+    vin, wit = [], []
+    for _ in range(n_in):
+        prevout = COutPoint(_rand(rng, 32), rng.randrange(4))
+        if segwit:
+            vin.append(CTxIn(prevout, CScript(), 0xfffffffd))
+            wit.append(CTxInWitness(CScriptWitness([_rand(rng, 71), _rand(rng, 33)])))
+        else:
+            vin.append(CTxIn(prevout, CScript([_rand(rng, 71), _rand(rng, 33)]), 0xffffffff))
+    vout = [_output(rng) for _ in range(n_out)]
+    return CTransaction(vin, vout, 0, 2, CTxWitness(tuple(wit)) if segwit else CTxWitness())
+
+
+def synthetic_block(n_tx: int = 3000, seed: int = 1) -> bytes:
+    rng = random.Random(seed)
+    coinbase = CTransaction([CTxIn(COutPoint(), CScript([_rand(rng, 8)]))], [_output(rng)])
+    vtx = [coinbase]
+    for _ in range(n_tx - 1):
+        segwit = rng.random() < 0.8
+        vtx.append(synthetic_tx(rng, rng.choice((1, 1, 1, 2, 3)), rng.choice((2, 2, 3)), segwit))
+    block = CBlock(nVersion=0x20000000, hashPrevBlock=_rand(rng, 32), nTime=1700000000,
+                   nBits=0x17053894, nNonce=rng.getrandbits(32), vtx=vtx)
+    return block.serialize()
+
+
+def get_block_bytes(path: str | None, n_tx: int) -> tuple[bytes, str]:
+    if path and os.path.exists(path):
+        return load_block_bytes(path), os.path.basename(path)
+    return synthetic_block(n_tx), f"synthetic {n_tx} tx"